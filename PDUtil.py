@@ -4,39 +4,105 @@ import subprocess
 import importlib
 import sys
 import argparse
+import glob
+import hashlib
+import json
 from importlib.metadata import version, PackageNotFoundError
 
 # Global Variables
 dir_path = os.path.dirname(os.path.realpath(__file__))
+env_dir = os.path.join(dir_path, "venv/")
+# What the virtualenv was last set up from, so launches that change nothing
+# skip pip and go straight to the app
+fingerprint_path = os.path.join(env_dir, "pdutil_fingerprint.json")
 
 argparser = argparse.ArgumentParser()
 argparser.add_argument('--build', action='store_true', default=False)
+argparser.add_argument('--reinstall', action='store_true', default=False, help='install the dependencies even if nothing changed')
 args = argparser.parse_args()
 
+def _digest(paths):
+    hash = hashlib.sha256()
+    for path in paths:
+        hash.update(path.encode('utf-8'))
+        try:
+            with open(path, 'rb') as file:
+                hash.update(file.read())
+        except OSError:
+            hash.update(b'missing')
+    return hash.hexdigest()
+
+def _installed_metadata():
+    # METADATA of the ParadiddleUtilities distribution pip installed into the
+    # virtualenv. It's rewritten on every install and gone if it was removed.
+    # Newer pips write the folder name in lower case.
+    site_dirs = glob.glob(os.path.join(env_dir, "lib", "python*", "site-packages")) + glob.glob(os.path.join(env_dir, "Lib", "site-packages"))
+    found = set()
+    for site_dir in site_dirs:
+        for name in os.listdir(site_dir):
+            if name.lower().startswith("paradiddleutilities-") and name.endswith(".dist-info"):
+                found.add(os.path.join(site_dir, name, "METADATA"))
+    return sorted(found)
+
+def _read_fingerprint():
+    try:
+        with open(fingerprint_path) as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return {}
+
+def _write_fingerprint(fingerprint):
+    try:
+        with open(fingerprint_path, 'w') as file:
+            json.dump(fingerprint, file, indent=4)
+    except OSError as e:
+        print("Could not save the environment fingerprint: " + str(e))
+
 def _create_env():
     venv = importlib.import_module("venv")
     pd_env = venv.EnvBuilder()
-    context = pd_env.ensure_directories(os.path.join(dir_path, "venv/"))
-    
+    context = pd_env.ensure_directories(env_dir)
+
     # FIX: Could possibly cause issues if calling this script from another environment? idk im too tired rn
     if not os.path.exists(context.env_exe):
         pd_env.setup_scripts(context)
         pd_env.create_configuration(context)
         pd_env.setup_python(context)
         pd_env.post_setup(context)
-        
+
         res = subprocess.check_call([context.env_exe, "-m", "ensurepip", "--upgrade"])
         if res != 0:
             print("Could not install pip into virtual environment")
             _error(res)
 
+    old_fingerprint = _read_fingerprint()
+    fingerprint = dict(old_fingerprint)
+    pyproject = _digest([os.path.join(dir_path, "pyproject.toml")])
+    metadata = _installed_metadata()
 
-    res = subprocess.run([context.env_exe, "-m", "pip", "install", "."])
-    if res.returncode != 0:
-        print("Could not install pyproject.toml dependencies")
-        _error(res)
-        
-    return context.env_exe  
+    if (args.reinstall or not metadata or fingerprint.get('pyproject') != pyproject
+            or fingerprint.get('env_exe') != context.env_exe or fingerprint.get('installed') != _digest(metadata)):
+        res = subprocess.run([context.env_exe, "-m", "pip", "install", "."], cwd=dir_path)
+        if res.returncode != 0:
+            print("Could not install pyproject.toml dependencies")
+            _error(res.returncode)
+        fingerprint['pyproject'] = pyproject
+        fingerprint['env_exe'] = context.env_exe
+        fingerprint['installed'] = _digest(_installed_metadata())
+
+    layouts = sorted(glob.glob(os.path.join(dir_path, "PDUtilities", "ui_layouts", "*.ui")))
+    ui = _digest(layouts)
+    if args.reinstall or fingerprint.get('ui') != ui:
+        res = subprocess.run([context.env_exe, os.path.join(dir_path, "PDUtilities"), "compile-ui"])
+        if res.returncode != 0:
+            print("Could not compile the .ui layouts")
+            _error(res.returncode)
+        fingerprint['ui'] = ui
+
+    if fingerprint != old_fingerprint:
+        _write_fingerprint(fingerprint)
+
+    return context.env_exe
 
     #pdutil = importlib.import_module("PDUtilities")
 
@@ -65,6 +131,14 @@ if args.build:
         print("Could not build exe")
         _error(ret.returncode)
 
-res = subprocess.run([env_exe, "PDUtilities"])
+app_args = [env_exe, os.path.join(dir_path, "PDUtilities")]
+sys.stdout.flush()
+if os.name == 'posix':
+    # Replaces this process with the app, so there's no launcher left waiting on it
+    os.execv(env_exe, app_args)
+else:
+    # execv on Windows starts a new process and returns to the console right away
+    res = subprocess.run(app_args)
+    sys.exit(res.returncode)
 
 #_main() # Calls the main function for PDUtilities
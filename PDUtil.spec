@@ -1,10 +1,19 @@
 # -*- mode: python ; coding: utf-8 -*-
 from PyInstaller.utils.hooks import copy_metadata
+import os
+import subprocess
+import sys
+
+# Generates the Python modules for the .ui layouts, so the bundled app doesn't
+# parse the .ui files at startup. They're bundled with the rest of PDUtilities/.
+subprocess.run([sys.executable, os.path.join(SPECPATH, 'PDUtilities'), 'compile-ui'], check=True)
 
 block_cipher = None
 
 # Copy metadata for ParadiddleUtilities package
 datas = [('PDUtilities/', '.')]
+# The schema `python -m PDUtilities validate` checks .rlrr files against
+datas += [('docs/rlrrschema.json', 'docs')]
 datas += copy_metadata('ParadiddleUtilities')
 
 a = Analysis(
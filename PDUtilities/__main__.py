@@ -13,15 +13,40 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
+import multiprocessing
+import os
 import sys
-from PyQt5 import QtWidgets
-from pd_gui import PD_GUI
+
+# Lets the sibling modules import each other both when run as
+# `python PDUtilities` and as `python -m PDUtilities`
+sys.path.insert(0, os.path.dirname(os.path.realpath(__file__)))
 
 def _main():
+    if len(sys.argv) > 1 and sys.argv[1] == 'convert':
+        # Headless batch conversion, doesn't touch PyQt at all
+        from batchconvert import main
+        sys.exit(main(sys.argv[2:]))
+    if len(sys.argv) > 1 and sys.argv[1] == 'validate':
+        from rlrrvalidate import main
+        sys.exit(main(sys.argv[2:]))
+    if len(sys.argv) > 1 and sys.argv[1] == 'compile-ui':
+        from uiloader import main
+        sys.exit(main(sys.argv[2:]))
+    if len(sys.argv) > 1 and sys.argv[1] == 'profile-startup':
+        from startupprofile import main
+        sys.exit(main(sys.argv[2:]))
+
+    from PyQt5 import QtWidgets
+    from pd_gui import PD_GUI
+
     # Sets primary window for the application
     app = QtWidgets.QApplication(sys.argv)
     window = PD_GUI()
+    if os.environ.get('PDU_STARTUP_PROFILE'):
+        from startupprofile import report_first_window
+        report_first_window(app)
     app.exec_()
 
 if __name__ == '__main__':
+    multiprocessing.freeze_support()
     _main()
@@ -0,0 +1,126 @@
+# Copyright (C) 2020 Emre Tanirgan <emre@paradiddleapp.com>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+# Puts a song's audio files and cover image next to its .rlrr files.
+# Files already in the output folder are left alone when they match the
+# source, new ones are hardlinked or reflinked where the filesystem allows
+# it and copied otherwise, several at a time. Files an earlier conversion
+# placed that the song no longer uses are removed with remove_unlisted_files.
+
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+import os
+import shutil
+import sys
+
+try:
+    import fcntl
+except ImportError: # Windows
+    fcntl = None
+
+FICLONE = 0x40049409 # Linux ioctl to share a file's data blocks (btrfs, xfs, ...)
+HASH_CHUNK_SIZE = 1024 * 1024
+MAX_COPY_WORKERS = 4
+
+# Outcomes reported by sync_assets
+SKIPPED = 'skipped'
+LINKED = 'linked'
+REFLINKED = 'reflinked'
+COPIED = 'copied'
+
+def file_digest(path):
+    h = hashlib.blake2b()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            h.update(chunk)
+    return h.digest()
+
+def is_unchanged(src, dest):
+    '''True if dest already holds the same data as src'''
+    try:
+        dest_st = os.stat(dest)
+    except FileNotFoundError:
+        return False
+    src_st = os.stat(src)
+    if (src_st.st_dev, src_st.st_ino) == (dest_st.st_dev, dest_st.st_ino):
+        return True
+    if src_st.st_size != dest_st.st_size:
+        return False
+    # copies keep the source's mtime, so this matches files we put there
+    if src_st.st_mtime_ns == dest_st.st_mtime_ns:
+        return True
+    return file_digest(src) == file_digest(dest)
+
+def _reflink(src, dest):
+    if fcntl is None or not sys.platform.startswith('linux'):
+        return False
+    try:
+        with open(src, 'rb') as s, open(dest, 'wb') as d:
+            fcntl.ioctl(d.fileno(), FICLONE, s.fileno())
+    except OSError:
+        if os.path.exists(dest):
+            os.remove(dest)
+        return False
+    shutil.copystat(src, dest)
+    return True
+
+def place_asset(src, dest):
+    '''Makes dest a copy of src as cheaply as possible, returns what was done'''
+    if is_unchanged(src, dest):
+        return SKIPPED
+    if os.path.lexists(dest):
+        os.remove(dest)
+    try:
+        os.link(src, dest)
+        return LINKED
+    except OSError:
+        pass
+    if _reflink(src, dest):
+        return REFLINKED
+    shutil.copy2(src, dest)
+    return COPIED
+
+def sync_assets(sources, dest_dir, max_workers=MAX_COPY_WORKERS):
+    '''Places every file in `sources` into dest_dir under its own file name.
+    Returns a list of (source, destination, outcome). Errors from any file
+    are raised once the others are done.'''
+    # one job per destination, later sources win like sequential copies did
+    jobs = {}
+    for src in sources:
+        jobs[os.path.join(dest_dir, src.split('/')[-1])] = src
+    if not jobs:
+        return []
+
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(jobs)))) as executor:
+        futures = [(src, dest, executor.submit(place_asset, src, dest)) for dest, src in jobs.items()]
+    return [(src, dest, future.result()) for src, dest, future in futures]
+
+def remove_unlisted_files(dest_dir, old_names, new_names, sources=()):
+    '''Removes the files in dest_dir named in old_names but not in new_names,
+    except any of `sources`. Returns the removed paths.'''
+    keep = {os.path.realpath(src) for src in sources}
+    removed = []
+    for name in sorted(set(old_names) - set(new_names)):
+        if os.path.basename(name) != name or name in ('', '.', '..'):
+            continue # only plain file names, nothing outside dest_dir
+        path = os.path.join(dest_dir, name)
+        if os.path.realpath(path) in keep or not os.path.isfile(path):
+            continue
+        try:
+            os.remove(path)
+            removed.append(path)
+        except OSError:
+            pass
+    return removed
@@ -0,0 +1,171 @@
+# Copyright (C) 2020 Emre Tanirgan <emre@paradiddleapp.com>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+# Optional packaging stage that makes songs smaller to download and faster to
+# load in Paradiddle: stems are transcoded to OGG/Vorbis with their trailing
+# silence trimmed, and the cover image is scaled down. Every output is
+# recorded in the user cache folder along with the source it came from and
+# the settings used, so it's only redone when one of those changed.
+
+from concurrent.futures import ProcessPoolExecutor
+import hashlib
+import os
+import numpy as np
+from assets import place_asset
+from pdcache import cache_path, read_json, write_json
+from pdlog import get_logger
+
+log = get_logger(__name__)
+
+# Pillow is optional, without it the cover image is shipped as is
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+SILENCE_THRESHOLD = 10 ** (-60 / 20) # -60 dBFS
+SILENCE_TAIL_SECONDS = 0.5 # kept after the last audible sample
+# libsndfile's Vorbis encoder has trouble with very large writes
+WRITE_BLOCK_FRAMES = 65536
+COVER_MAX_SIZE = 1024
+# Bump when the transcoding or scaling changes so existing outputs are redone
+AUDIO_PACK_VERSION = 1
+
+def audio_settings(trim_silence=True):
+    '''Everything that affects a transcoded stem besides its source'''
+    return {
+        'version': AUDIO_PACK_VERSION,
+        'format': 'OGG/VORBIS',
+        'trim_silence': trim_silence,
+        'silence_threshold': SILENCE_THRESHOLD,
+        'silence_tail': SILENCE_TAIL_SECONDS
+    }
+
+def cover_settings(max_size=COVER_MAX_SIZE):
+    return {'version': AUDIO_PACK_VERSION, 'max_size': max_size}
+
+def trailing_silence_start(data, samplerate):
+    '''Frame after which `data` stays below SILENCE_THRESHOLD, plus a short tail'''
+    loud = np.abs(data) >= SILENCE_THRESHOLD
+    if loud.ndim > 1:
+        loud = loud.any(axis=1)
+    loud_frames = np.flatnonzero(loud)
+    if not len(loud_frames):
+        return len(data)
+    return min(len(data), int(loud_frames[-1]) + 1 + int(SILENCE_TAIL_SECONDS * samplerate))
+
+def _record_path(dest):
+    key = hashlib.blake2b(os.path.realpath(dest).encode('utf-8'), digest_size=16).hexdigest()
+    return cache_path('packaged_assets', key + '.json')
+
+def _file_state(path):
+    st = os.stat(path)
+    return [os.path.realpath(path), st.st_size, st.st_mtime_ns]
+
+def is_up_to_date(src, dest, settings):
+    '''True if dest was written from src, as it is now, with the same settings'''
+    try:
+        if os.path.samefile(src, dest):
+            return False # a plain link left by an unoptimized conversion
+        record = read_json(_record_path(dest))
+        return bool(record) and record.get('settings') == settings and \
+            record.get('src') == _file_state(src) and record.get('dest') == _file_state(dest)
+    except OSError:
+        return False
+
+def _remember_output(src, dest, settings):
+    write_json(_record_path(dest), {'settings': settings, 'src': _file_state(src), 'dest': _file_state(dest)})
+
+def transcode_to_ogg(src, dest, trim_silence=True):
+    '''Writes src as OGG/Vorbis to dest. Returns a short description of what was done.'''
+    settings = audio_settings(trim_silence)
+    if is_up_to_date(src, dest, settings):
+        return 'up to date'
+    import soundfile as sf
+    data, samplerate = sf.read(src, dtype='float32', always_2d=True)
+    if trim_silence:
+        data = data[:trailing_silence_start(data, samplerate)]
+    # write next to the final file first so an interrupted run can't look up to date
+    tmp_dest = dest + '.part'
+    with sf.SoundFile(tmp_dest, 'w', samplerate, data.shape[1], format='OGG', subtype='VORBIS') as f:
+        for start in range(0, len(data), WRITE_BLOCK_FRAMES):
+            f.write(data[start:start + WRITE_BLOCK_FRAMES])
+    os.replace(tmp_dest, dest)
+    _remember_output(src, dest, settings)
+    return 'transcoded %.1f MB -> %.1f MB' % (os.path.getsize(src) / 1e6, os.path.getsize(dest) / 1e6)
+
+def _package_audio_file(src, dest, trim_silence):
+    if src.lower().endswith('.ogg'):
+        # already compressed, re-encoding would only lose quality
+        return place_asset(src, dest)
+    return transcode_to_ogg(src, dest, trim_silence)
+
+def ogg_names(sources):
+    '''Output file name for every source, with .ogg extensions and no clashes'''
+    names = {}
+    used = set()
+    for src in sources:
+        if src in names:
+            continue
+        stem = os.path.splitext(src.split('/')[-1])[0]
+        name = stem + '.ogg'
+        i = 2
+        while name in used:
+            name = '%s_%d.ogg' % (stem, i)
+            i += 1
+        used.add(name)
+        names[src] = name
+    return names
+
+def package_audio(sources, dest_dir, max_workers=None, trim_silence=True):
+    '''Transcodes every audio file in `sources` into dest_dir on a process
+    pool. Returns a dict of source path -> output file name.'''
+    names = ogg_names(sources)
+    jobs = [(src, os.path.join(dest_dir, name)) for src, name in names.items()]
+    if max_workers is None:
+        max_workers = os.cpu_count() or 1
+    max_workers = max(1, min(max_workers, len(jobs)))
+    if max_workers == 1:
+        results = [_package_audio_file(src, dest, trim_silence) for src, dest in jobs]
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            futures = [executor.submit(_package_audio_file, src, dest, trim_silence) for src, dest in jobs]
+            results = [future.result() for future in futures]
+    for (src, dest), result in zip(jobs, results):
+        log.info("%s: %s", dest, result)
+    return names
+
+def package_cover(src, dest_dir, max_size=COVER_MAX_SIZE):
+    '''Places the cover image in dest_dir, scaled down to fit max_size if
+    Pillow is installed. Returns the output file name.'''
+    name = src.split('/')[-1]
+    dest = os.path.join(dest_dir, name)
+    if Image is None:
+        log.warning("Pillow isn't installed, cover image is not resized")
+        place_asset(src, dest)
+        return name
+    settings = cover_settings(max_size)
+    if is_up_to_date(src, dest, settings):
+        return name
+    with Image.open(src) as image:
+        if max(image.size) <= max_size:
+            place_asset(src, dest)
+            return name
+        image.thumbnail((max_size, max_size), Image.LANCZOS)
+        if os.path.lexists(dest):
+            os.remove(dest) # might be a hardlink to the source
+        image.save(dest)
+    _remember_output(src, dest, settings)
+    return name
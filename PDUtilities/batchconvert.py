@@ -0,0 +1,266 @@
+# Copyright (C) 2020 Emre Tanirgan <emre@paradiddleapp.com>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+# Headless batch conversion of whole song libraries, run with
+#   python -m PDUtilities convert <manifest or folder> [...]
+# This module must not import PyQt so that it works without a display.
+
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import argparse
+import contextlib
+import io
+import json
+import os
+import sys
+import time
+import yaml
+
+project_dir = os.path.dirname(os.path.realpath(__file__))
+
+MIDI_EXTENSIONS = ('.mid', '.midi', '.kar')
+AUDIO_EXTENSIONS = ('.wav', '.ogg', '.mp3')
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg')
+
+DEFAULT_MAPPING = os.path.join(project_dir, 'midi_maps', 'pdtracks_mapping.yaml')
+DEFAULT_KIT = os.path.join(project_dir, 'drum_sets', 'defaultset.rlrr')
+
+# Song entry keys whose values are file paths, resolved relative to the manifest
+PATH_KEYS = ('midi', 'cover', 'preview', 'mapping', 'kit')
+PATH_LIST_KEYS = ('song_tracks', 'drum_tracks')
+
+def available_cpus():
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+# A manifest or song entry that can't be converted
+class ManifestError(Exception):
+    pass
+
+def _manifest_job(song, base_dir):
+    if not isinstance(song, dict):
+        raise ManifestError('song entries must be mappings, not %s' % type(song).__name__)
+    job = dict(song)
+    if not isinstance(job.get('midi'), str) or not job['midi']:
+        raise ManifestError('no "midi" path')
+    for key in PATH_KEYS:
+        if job.get(key):
+            if not isinstance(job[key], str):
+                raise ManifestError('"%s" must be a path' % key)
+            job[key] = os.path.join(base_dir, job[key])
+    for key in PATH_LIST_KEYS:
+        paths = job.get(key) or []
+        if not isinstance(paths, list) or not all(isinstance(p, str) for p in paths):
+            raise ManifestError('"%s" must be a list of paths' % key)
+        job[key] = [os.path.join(base_dir, p) for p in paths]
+    job.setdefault('name', os.path.splitext(os.path.basename(job['midi']))[0])
+    return job
+
+def load_manifest(manifest_path):
+    '''Reads a JSON or YAML manifest, either a list of song entries or a dict
+    with a "songs" list. Each entry needs at least a "midi" path and may set
+    name, artist, author, description, complexity, song_tracks, drum_tracks,
+    preview, cover, mapping, kit, track_index and calibration_offset.
+    Returns (jobs, errors), errors being (entry name, message) for entries
+    that were left out. Raises ManifestError if the file can't be used.'''
+    try:
+        with open(manifest_path) as f:
+            if manifest_path.lower().endswith('.json'):
+                manifest = json.load(f)
+            else:
+                manifest = yaml.safe_load(f)
+    except (OSError, ValueError, yaml.YAMLError) as e:
+        raise ManifestError('could not read %s: %s' % (manifest_path, e))
+    songs = manifest.get('songs') if isinstance(manifest, dict) else manifest
+    if not isinstance(songs, list):
+        raise ManifestError('%s has no list of songs' % manifest_path)
+
+    base_dir = os.path.dirname(os.path.abspath(manifest_path))
+    jobs = []
+    errors = []
+    for index, song in enumerate(songs):
+        try:
+            jobs.append(_manifest_job(song, base_dir))
+        except ManifestError as e:
+            name = song.get('name') if isinstance(song, dict) and song.get('name') else 'song %d' % (index + 1)
+            errors.append(('%s in %s' % (name, manifest_path), str(e)))
+    return jobs, errors
+
+def scan_song_tree(root_dir):
+    '''Finds every folder under root_dir holding exactly one MIDI file and
+    treats it as a song: audio files with "drum" in the name are drum tracks,
+    one with "preview" in the name is the song preview, other audio files are
+    song tracks and the first image is the cover.'''
+    jobs = []
+    for dirpath, dirnames, filenames in os.walk(root_dir):
+        dirnames.sort()
+        filenames = sorted(filenames)
+        midi_files = [f for f in filenames if f.lower().endswith(MIDI_EXTENSIONS)]
+        if len(midi_files) != 1:
+            if len(midi_files) > 1:
+                print("Skipping " + dirpath + ": more than one MIDI file")
+            continue
+
+        job = {
+            'name': os.path.basename(os.path.normpath(dirpath)),
+            'midi': os.path.join(dirpath, midi_files[0]),
+            'song_tracks': [],
+            'drum_tracks': []
+        }
+        for filename in filenames:
+            lower = filename.lower()
+            full_path = os.path.join(dirpath, filename)
+            if lower.endswith(AUDIO_EXTENSIONS):
+                if 'preview' in lower:
+                    job['preview'] = full_path
+                elif 'drum' in lower:
+                    job['drum_tracks'].append(full_path)
+                else:
+                    job['song_tracks'].append(full_path)
+            elif lower.endswith(IMAGE_EXTENSIONS) and 'cover' not in job:
+                job['cover'] = full_path
+        jobs.append(job)
+    return jobs
+
+def collect_jobs(paths):
+    '''(jobs, errors) for every song in the given manifests and folders'''
+    jobs = []
+    errors = []
+    for path in paths:
+        if os.path.isdir(path):
+            jobs.extend(scan_song_tree(path))
+            continue
+        try:
+            manifest_jobs, manifest_errors = load_manifest(path)
+        except ManifestError as e:
+            errors.append((path, str(e)))
+            continue
+        jobs.extend(manifest_jobs)
+        errors.extend(manifest_errors)
+    return jobs, errors
+
+def convert_song(job, options):
+    '''Converts a single song, run inside a worker process.
+    Returns a dict with the song name, status, message and timing.'''
+    from midiconvert import MidiConverter
+
+    start = time.perf_counter()
+    result = {'name': job.get('name', job['midi']), 'ok': False, 'message': '', 'seconds': 0.0, 'stages': {}, 'counters': {}}
+    log = io.StringIO()
+    try:
+        with contextlib.redirect_stdout(sys.stdout if options['verbose'] else log):
+            mc = MidiConverter()
+            mc.analyze_drum_set(job.get('kit') or options['kit'])
+            mc.load_midi_map(job.get('mapping') or options['mapping'])
+
+            mc.midi_file = job['midi']
+            (default_track, default_index) = mc.get_default_midi_track()
+            mc.convert_track_index = job.get('track_index', default_index)
+            mc.output_rlrr_dir = options['output']
+            mc.compact_output = options['compact']
+            mc.optimize_audio = options['optimize_audio']
+            mc.use_conversion_cache = not options['force']
+            mc.audio_workers = 1 # songs already run in parallel
+
+            mc.song_name = result['name']
+            mc.artist_name = job.get('artist', '')
+            mc.author_name = job.get('author', '')
+            mc.recording_description = job.get('description', '')
+            mc.song_complexity = int(job.get('complexity', 1))
+            mc.calibration_offset = int(job.get('calibration_offset', 0))
+            mc.song_tracks = list(job.get('song_tracks', []))
+            mc.drum_tracks = list(job.get('drum_tracks', []))
+            mc.song_preview_track = job.get('preview') or ''
+            mc.cover_image_path = job.get('cover') or ''
+
+            if options['difficulty'] == 'all':
+                conversion = mc.run_conversion(mc.difficulty_names)
+            else:
+                mc.difficulty = options['difficulty']
+                conversion = mc.run_conversion([mc.difficulty])
+        result['message'] = conversion.status
+        result['ok'] = conversion.ok
+        result['stages'] = conversion.stage_totals()
+        result['counters'] = conversion.counters
+    except Exception as e:
+        result['message'] = '%s: %s' % (type(e).__name__, e)
+    result['seconds'] = time.perf_counter() - start
+    return result
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m PDUtilities convert',
+                                     description='Convert MIDI songs to .rlrr files without the GUI.')
+    parser.add_argument('paths', nargs='+', help='song manifests (.json/.yaml) or folders to scan for songs')
+    parser.add_argument('-o', '--output', default='rlrr_files', help='output folder (default: rlrr_files)')
+    parser.add_argument('-m', '--mapping', default=DEFAULT_MAPPING, help='default MIDI mapping .yaml')
+    parser.add_argument('-k', '--kit', default=DEFAULT_KIT, help='default drum kit .rlrr, or the name of a kit in drum_sets/')
+    parser.add_argument('-d', '--difficulty', default='all', choices=['all', 'Easy', 'Medium', 'Hard', 'Expert'])
+    parser.add_argument('-j', '--jobs', type=int, default=available_cpus(), help='worker processes (default: available cores)')
+    parser.add_argument('-c', '--compact', action='store_true', help='write .rlrr files without indentation')
+    parser.add_argument('-a', '--optimize-audio', action='store_true', help='transcode audio to OGG/Vorbis, trim trailing silence and shrink cover images')
+    parser.add_argument('-f', '--force', action='store_true', help='convert every song, even ones that are unchanged since they were last converted')
+    parser.add_argument('-t', '--timings', metavar='FILE', help='write per song stage timings to a JSON file')
+    parser.add_argument('-v', '--verbose', action='store_true', help='show converter output')
+    args = parser.parse_args(argv)
+
+    jobs, errors = collect_jobs(args.paths)
+    for name, message in errors:
+        print("[FAILED] %s: %s" % (name, message))
+    if not jobs:
+        print("No songs found")
+        return 1
+
+    options = {
+        'output': args.output,
+        'mapping': args.mapping,
+        'kit': args.kit,
+        'difficulty': args.difficulty,
+        'compact': args.compact,
+        'optimize_audio': args.optimize_audio,
+        'force': args.force,
+        'verbose': args.verbose
+    }
+    workers = max(1, min(args.jobs, len(jobs)))
+    print("Converting %d songs with %d workers" % (len(jobs), workers))
+
+    start = time.perf_counter()
+    failures = []
+    results = []
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(convert_song, job, options): job for job in jobs}
+        for future in as_completed(futures):
+            try:
+                result = future.result()
+            except Exception as e:
+                # The worker itself died (e.g. killed or out of memory)
+                result = {'name': futures[future].get('name'), 'ok': False, 'message': str(e), 'seconds': 0.0, 'stages': {}, 'counters': {}}
+            results.append(result)
+            if result['ok'] and result['counters'].get('cache_hits'):
+                print("[same]   %s (%.2fs, unchanged since the last conversion)" % (result['name'], result['seconds']))
+            elif result['ok']:
+                print("[ok]     %s (%.2fs)" % (result['name'], result['seconds']))
+                if args.verbose:
+                    for stage, seconds in result['stages'].items():
+                        print("         %-30s %.3fs" % (stage, seconds))
+            else:
+                print("[FAILED] %s (%.2fs): %s" % (result['name'], result['seconds'], result['message']))
+                failures.append(result)
+
+    print("%d converted, %d failed in %.2fs" % (len(jobs) - len(failures), len(failures) + len(errors), time.perf_counter() - start))
+    if args.timings:
+        with open(args.timings, 'w') as f:
+            json.dump(results, f, indent=4)
+    return 1 if failures or errors else 0
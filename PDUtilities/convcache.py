@@ -0,0 +1,129 @@
+# Copyright (C) 2020 Emre Tanirgan <emre@paradiddleapp.com>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+# Remembers which conversions have already been done, so converting a song
+# library again only converts the songs that changed. An entry is keyed by a
+# hash of everything that goes into the .rlrr files (see
+# MidiConverter.conversion_key) and lists the files the conversion wrote. A
+# conversion is skipped when its key matches and those files are still there,
+# unchanged. There's one small file per entry, so parallel batch conversions
+# don't fight over a shared index, and the least recently used entries are
+# removed once there are more than max_entries.
+
+import hashlib
+import json
+import os
+import time
+from pdcache import cache_path, cache_root, read_json, write_json
+
+# Bump when the converter's output changes, so older conversions are redone
+CONVERSION_CACHE_VERSION = 1
+MAX_ENTRIES = 5000
+CACHE_FOLDER = 'conversions'
+
+def _file_state(path):
+    st = os.stat(path)
+    return [path, st.st_size, st.st_mtime_ns]
+
+class ConversionCache:
+    def __init__(self, max_entries=MAX_ENTRIES):
+        self.max_entries = max_entries
+
+    def key(self, parts):
+        '''Hash of `parts`, which must be JSON serializable'''
+        data = json.dumps([CONVERSION_CACHE_VERSION, parts], sort_keys=True, default=str)
+        return hashlib.blake2b(data.encode('utf-8'), digest_size=20).hexdigest()
+
+    def _entry_path(self, key):
+        return cache_path(CACHE_FOLDER, key + '.json')
+
+    def lookup(self, key):
+        '''The .rlrr files written by the conversion with this key, or None if
+        it hasn't been done or its output has changed since'''
+        entry_path = self._entry_path(key)
+        entry = read_json(entry_path)
+        if not entry:
+            return None
+        try:
+            # .rlrr files must be exactly as written, assets may have been
+            # re-linked or copied by another song sharing them
+            for path, size, mtime_ns in entry['rlrr']:
+                if _file_state(path) != [path, size, mtime_ns]:
+                    return None
+            for path, size in entry['assets']:
+                if os.path.getsize(path) != size:
+                    return None
+        except (OSError, KeyError, TypeError, ValueError):
+            return None
+        try:
+            os.utime(entry_path) # keeps recently used entries from being evicted
+        except OSError:
+            pass
+        return [path for path, size, mtime_ns in entry['rlrr']]
+
+    def store(self, key, rlrr_files, asset_files=()):
+        try:
+            entry = {
+                'rlrr': [_file_state(path) for path in rlrr_files],
+                'assets': [[path, os.path.getsize(path)] for path in asset_files],
+                'time': time.time()
+            }
+        except OSError:
+            return False
+        if not write_json(self._entry_path(key), entry):
+            return False
+        self.evict()
+        return True
+
+    def forget(self, key):
+        try:
+            os.remove(self._entry_path(key))
+        except OSError:
+            pass
+
+    def _entries(self):
+        folder = os.path.join(cache_root(), CACHE_FOLDER)
+        try:
+            names = [name for name in os.listdir(folder) if name.endswith('.json')]
+        except OSError:
+            return []
+        return [os.path.join(folder, name) for name in names]
+
+    def evict(self):
+        '''Removes the least recently used entries beyond max_entries'''
+        entries = self._entries()
+        if len(entries) <= self.max_entries:
+            return
+        ages = []
+        for path in entries:
+            try:
+                ages.append((os.path.getmtime(path), path))
+            except OSError:
+                pass # removed by another process
+        ages.sort()
+        for _, path in ages[:len(ages) - self.max_entries]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def clear(self):
+        for path in self._entries():
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+conversion_cache = ConversionCache()
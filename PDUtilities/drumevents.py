@@ -0,0 +1,79 @@
+# Copyright (C) 2020 Emre Tanirgan <emre@paradiddleapp.com>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import numpy as np
+
+# Converted drum hits stored column by column: time in seconds (float64),
+# instrument id (uint16, an index into `names`), velocity (uint8) and hit
+# location (uint8). Times are only formatted into the '%.4f' strings the
+# .rlrr format uses when the events are written out.
+class DrumEventStore:
+    def __init__(self, names=(), times=None, instruments=None, velocities=None, locations=None):
+        self.names = tuple(names)
+        self.times = np.zeros(0, dtype=np.float64) if times is None else np.asarray(times, dtype=np.float64)
+        self.instruments = np.zeros(0, dtype=np.uint16) if instruments is None else np.asarray(instruments, dtype=np.uint16)
+        self.velocities = np.zeros(0, dtype=np.uint8) if velocities is None else np.asarray(velocities, dtype=np.uint8)
+        self.locations = np.zeros(len(self.times), dtype=np.uint8) if locations is None else np.asarray(locations, dtype=np.uint8)
+
+    def __len__(self):
+        return len(self.times)
+
+    def __iter__(self):
+        '''Yields one .rlrr DrumEvent dict per hit, in stored order'''
+        names = self.names
+        for time, instrument, velocity, location in zip(self.times.tolist(), self.instruments.tolist(),
+                                                        self.velocities.tolist(), self.locations.tolist()):
+            yield {"name" : names[instrument], "vel" : velocity, "loc": location, "time": '%.4f'%time}
+
+    def _take(self, index):
+        return DrumEventStore(self.names, self.times[index], self.instruments[index],
+                              self.velocities[index], self.locations[index])
+
+    def last_time(self):
+        return float(self.times.max()) if len(self.times) else 0.0
+
+    def sorted(self):
+        '''Copy of the store ordered by time, keeping the order of simultaneous hits'''
+        return self._take(np.argsort(self.times, kind='stable'))
+
+    def slice_time(self, start, end):
+        '''Hits with start <= time < end'''
+        return self._take((self.times >= start) & (self.times < end))
+
+    def counts_by_name(self):
+        counts = np.bincount(self.instruments, minlength=len(self.names))
+        return {name: int(count) for name, count in zip(self.names, counts) if count}
+
+    @classmethod
+    def concatenate(cls, stores):
+        '''Joins several stores into one, merging their instrument name tables'''
+        names = []
+        name_ids = {}
+        instruments = []
+        for store in stores:
+            remap = np.zeros(max(len(store.names), 1), dtype=np.uint16)
+            for i, name in enumerate(store.names):
+                if name not in name_ids:
+                    name_ids[name] = len(names)
+                    names.append(name)
+                remap[i] = name_ids[name]
+            instruments.append(remap[store.instruments])
+        if not stores:
+            return cls()
+        return cls(names,
+                   np.concatenate([store.times for store in stores]),
+                   np.concatenate(instruments),
+                   np.concatenate([store.velocities for store in stores]),
+                   np.concatenate([store.locations for store in stores]))
@@ -0,0 +1,211 @@
+# Copyright (C) 2020 Emre Tanirgan <emre@paradiddleapp.com>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+# Drum kit (.rlrr) files, indexed by the instrument names and classes they
+# hold. Mapping drum classes to kit instruments only needs the index, the
+# full kit with every instrument's transform is read when a song is written.
+# A KitLibrary keeps the index of a whole folder of kits in the user cache
+# folder and only re-reads kits that changed since the last scan. get_kit()
+# takes kits in the library's folder from that index.
+
+import hashlib
+import json
+import os
+import threading
+from pdcache import cache_path, read_json, write_json
+from pdlog import get_logger
+
+log = get_logger(__name__)
+
+project_dir = os.path.dirname(os.path.realpath(__file__))
+DRUM_SETS_DIR = os.path.join(project_dir, 'drum_sets')
+DEFAULT_KIT = os.path.join(DRUM_SETS_DIR, 'defaultset.rlrr')
+KIT_EXTENSION = '.rlrr'
+# Bump when the index format changes so old cache files are ignored
+KIT_INDEX_VERSION = 1
+
+# Index entry for one kit file:
+#   instruments: tuple of {'name', 'class'} dicts in kit order, enough for
+#                CompiledMapping and compatibility checks
+#   digest:      hash of the file, changes whenever the kit does
+class DrumKit:
+    def __init__(self, path, mtime_ns, size, digest, instruments, data=None):
+        self.path = path
+        self.name = os.path.splitext(os.path.basename(path))[0]
+        self.mtime_ns = mtime_ns
+        self.size = size
+        self.digest = digest
+        self.instruments = tuple(instruments)
+        self._data = data
+        self._lock = threading.Lock()
+
+    @classmethod
+    def read(cls, path):
+        '''Indexes the kit at `path`. Only the instrument names and classes
+        are kept, load() reads the whole kit when it's needed.'''
+        st = os.stat(path)
+        with open(path, 'rb') as f:
+            raw = f.read()
+        instruments = [{'name': i['name'], 'class': i['class']} for i in json.loads(raw)['instruments']]
+        return cls(path, st.st_mtime_ns, st.st_size, hashlib.blake2b(raw).digest()[:16].hex(), instruments)
+
+    @property
+    def classes(self):
+        return frozenset(i['class'] for i in self.instruments)
+
+    def is_current(self, st):
+        return st.st_mtime_ns == self.mtime_ns and st.st_size == self.size
+
+    def load(self):
+        '''The full kit file as a dict, parsed on first use. Shared, don't modify it.'''
+        with self._lock:
+            if self._data is None:
+                with open(self.path) as f:
+                    self._data = json.load(f)
+            return self._data
+
+    def missing_classes(self, note_maps, toggle_maps=()):
+        '''Drum classes used by the given MIDI maps that this kit doesn't have'''
+        used = set()
+        for note_map in note_maps:
+            for drums in note_map.values():
+                used.update(drum['drum'] for drum in drums)
+        for toggle_map in toggle_maps:
+            used.update(toggle_map.values())
+        return used - self.classes
+
+    def to_json(self, directory):
+        return {
+            'file': os.path.relpath(self.path, directory),
+            'mtime_ns': self.mtime_ns,
+            'size': self.size,
+            'digest': self.digest,
+            'instruments': [[i['class'], i['name']] for i in self.instruments]
+        }
+
+    @classmethod
+    def from_json(cls, directory, entry):
+        instruments = [{'name': name, 'class': drum_class} for drum_class, name in entry['instruments']]
+        return cls(os.path.join(directory, entry['file']), entry['mtime_ns'], entry['size'], entry['digest'], instruments)
+
+_kits = {} # real path -> DrumKit
+_kits_lock = threading.Lock()
+
+def get_kit(path):
+    '''DrumKit for the .rlrr file at `path`, re-read only when the file changed.
+    Kits in the kit library's folder come from its saved index.'''
+    full_path = os.path.realpath(path)
+    st = os.stat(full_path)
+    if kit_library.contains_path(full_path):
+        kit_library.kits() # loads the index on first use
+    with _kits_lock:
+        kit = _kits.get(full_path)
+    if kit is not None and kit.is_current(st):
+        return kit
+    kit = DrumKit.read(full_path)
+    with _kits_lock:
+        _kits[full_path] = kit
+    return kit
+
+def _remember_kit(kit):
+    with _kits_lock:
+        current = _kits.get(kit.path)
+        if current is None or (current.mtime_ns, current.size) != (kit.mtime_ns, kit.size):
+            _kits[kit.path] = kit
+
+# Every kit in a folder (and its subfolders), by name. The folder is scanned
+# the first time a kit is asked for.
+class KitLibrary:
+    def __init__(self, directory=DRUM_SETS_DIR):
+        self.directory = os.path.realpath(directory)
+        self._kits = None
+        self._lock = threading.Lock()
+
+    def _index_path(self):
+        key = hashlib.blake2b(self.directory.encode('utf-8')).digest()[:16].hex()
+        return cache_path('drum_kits', key + '.json')
+
+    def _load_index(self):
+        data = read_json(self._index_path())
+        if not data or data.get('version') != KIT_INDEX_VERSION or data.get('directory') != self.directory:
+            return {}
+        kits = {}
+        try:
+            for entry in data['kits']:
+                kit = DrumKit.from_json(self.directory, entry)
+                kits[kit.path] = kit
+        except (KeyError, TypeError, ValueError):
+            return {} # damaged index, rebuild it
+        return kits
+
+    def _kit_files(self):
+        for dirpath, dirnames, filenames in os.walk(self.directory):
+            dirnames.sort()
+            for filename in sorted(filenames):
+                if filename.lower().endswith(KIT_EXTENSION):
+                    yield os.path.join(dirpath, filename)
+
+    def scan(self):
+        '''Updates the index, only reading kits that are new or changed'''
+        with self._lock:
+            previous = self._kits if self._kits is not None else self._load_index()
+            kits = {}
+            changed = len(previous) == 0
+            for path in self._kit_files():
+                try:
+                    st = os.stat(path)
+                    kit = previous.get(path)
+                    if kit is None or not kit.is_current(st):
+                        kit = DrumKit.read(path)
+                        changed = True
+                except (OSError, ValueError, KeyError, TypeError) as e:
+                    log.warning("Skipping drum kit %s: %s", path, e)
+                    continue
+                kits[path] = kit
+                _remember_kit(kit)
+            if changed or len(kits) != len(previous):
+                write_json(self._index_path(), {
+                    'version': KIT_INDEX_VERSION,
+                    'directory': self.directory,
+                    'kits': [kit.to_json(self.directory) for kit in kits.values()]
+                })
+            self._kits = kits
+            return list(kits.values())
+
+    def contains_path(self, path):
+        try:
+            return os.path.commonpath([self.directory, os.path.realpath(path)]) == self.directory
+        except ValueError:
+            return False # on another drive
+
+    def kits(self):
+        if self._kits is None:
+            self.scan()
+        return list(self._kits.values())
+
+    def names(self):
+        return [kit.name for kit in self.kits()]
+
+    def get(self, name):
+        for kit in self.kits():
+            if kit.name == name:
+                return kit
+        raise KeyError(name)
+
+    def compatible_kits(self, note_maps, toggle_maps=()):
+        '''Kits that have every drum class the given MIDI maps use'''
+        return [kit for kit in self.kits() if not kit.missing_classes(note_maps, toggle_maps)]
+
+kit_library = KitLibrary()
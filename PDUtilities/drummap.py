@@ -0,0 +1,90 @@
+# Copyright (C) 2020 Emre Tanirgan <emre@paradiddleapp.com>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from types import MappingProxyType
+import numpy as np
+from pdlog import get_logger
+
+log = get_logger(__name__)
+
+NUM_MIDI_NOTES = 128
+
+# One difficulty of a MIDI map (as built by MidiConverter.create_midi_map)
+# resolved against a drum kit, so drum classes are looked up once instead of
+# on every conversion. Instances are immutable and safe to share.
+#   notes:            128-entry tuple, note -> tuple of kit instrument names
+#   note_classes:     the drum classes those names were resolved from
+#   toggles:          toggle note -> instrument name it switches on
+#   toggle_notes:     instrument name -> its toggle note
+#   slot_toggles:     note -> toggle note of each of its drums, -1 if untoggled
+#   deferred:         note -> whether any of its drums needs a toggle
+#   instrument_names: every instrument name the map can produce
+#   note_ids:         (note, slot) -> index into instrument_names
+class CompiledMapping:
+    __slots__ = ('notes', 'note_classes', 'toggles', 'toggle_notes', 'slot_toggles', 'deferred',
+                 'instrument_names', 'note_ids', 'class_names')
+
+    def __init__(self, note_map, toggle_map, kit_instruments):
+        # The first kit instrument of each class wins, as in the kit editor
+        class_names = {}
+        for instrument in kit_instruments:
+            class_names.setdefault(instrument["class"], instrument["name"])
+
+        def instrument_name(drum_class):
+            if drum_class in class_names:
+                return class_names[drum_class]
+            # TODO for now assume all drums will be in the drum kit file
+            log.warning("%s is not in the drum kit, using %sDefault", drum_class, drum_class)
+            return drum_class+"Default"
+
+        note_classes = [()] * NUM_MIDI_NOTES
+        for note, drums in note_map.items():
+            if 0 <= note < NUM_MIDI_NOTES:
+                note_classes[note] = tuple(drum["drum"] for drum in drums)
+        notes = [tuple(instrument_name(c) for c in classes) for classes in note_classes]
+        toggles = {note: instrument_name(drum_class) for note, drum_class in toggle_map.items()}
+        toggle_notes = {name: note for note, name in toggles.items()}
+        slot_toggles = [tuple(toggle_notes.get(name, -1) for name in names) for names in notes]
+
+        instrument_names = []
+        for names in notes:
+            for name in names:
+                if name not in instrument_names:
+                    instrument_names.append(name)
+        note_ids = np.zeros((NUM_MIDI_NOTES, max([len(names) for names in notes] + [1])), dtype=np.uint16)
+        for note, names in enumerate(notes):
+            for slot, name in enumerate(names):
+                note_ids[note, slot] = instrument_names.index(name)
+        note_ids.setflags(write=False)
+
+        set_attr = object.__setattr__
+        set_attr(self, 'class_names', MappingProxyType(class_names))
+        set_attr(self, 'notes', tuple(notes))
+        set_attr(self, 'note_classes', tuple(note_classes))
+        set_attr(self, 'toggles', MappingProxyType(toggles))
+        set_attr(self, 'toggle_notes', MappingProxyType(toggle_notes))
+        set_attr(self, 'slot_toggles', tuple(slot_toggles))
+        set_attr(self, 'deferred', tuple(any(t >= 0 for t in ts) for ts in slot_toggles))
+        set_attr(self, 'instrument_names', tuple(instrument_names))
+        set_attr(self, 'note_ids', note_ids)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("CompiledMapping is immutable")
+
+    def __delattr__(self, name):
+        raise AttributeError("CompiledMapping is immutable")
+
+    def is_toggled(self, drum_name):
+        return drum_name in self.toggle_notes
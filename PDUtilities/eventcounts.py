@@ -0,0 +1,77 @@
+# Copyright (C) 2020 Emre Tanirgan <emre@paradiddleapp.com>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from collections import OrderedDict
+import os
+import threading
+from midiconvert import read_midi_notes, resolve_drum_hits
+
+# Converted event counts for every track x difficulty of one MIDI file under
+# one set of CompiledMappings (which pin down both the MIDI map and the kit).
+class EventCountIndex:
+    def __init__(self, midi_file, difficulty_names, mappings):
+        self.midi_file = os.path.realpath(midi_file)
+        st = os.stat(self.midi_file)
+        self.file_stamp = (st.st_mtime_ns, st.st_size)
+        self.difficulty_names = tuple(difficulty_names)
+        self.mappings = tuple(mappings)
+        self.counts = {} # (track index, difficulty) -> converted event count
+
+    def matches(self, midi_file, mappings):
+        if os.path.realpath(midi_file) != self.midi_file or len(mappings) != len(self.mappings):
+            return False
+        try:
+            st = os.stat(self.midi_file)
+        except OSError:
+            return False
+        if (st.st_mtime_ns, st.st_size) != self.file_stamp:
+            return False
+        # CompiledMappings are rebuilt whenever the map or kit changes
+        return all(a is b for a, b in zip(mappings, self.mappings))
+
+    def build(self):
+        mid = read_midi_notes(self.midi_file)
+        unique_mappings = list({id(m): m for m in self.mappings}.values())
+        for track_index, track in enumerate(mid.tracks):
+            # One walk of the track covers every difficulty
+            hits = resolve_drum_hits(unique_mappings, track.events)
+            counts = {id(m): len(event_indices) for m, (event_indices, slots) in zip(unique_mappings, hits)}
+            for difficulty, mapping in zip(self.difficulty_names, self.mappings):
+                self.counts[(track_index, difficulty)] = counts[id(mapping)]
+        return self
+
+    def get(self, track_index, difficulty):
+        return self.counts.get((track_index, difficulty), 0)
+
+_indexes = OrderedDict()
+_indexes_lock = threading.Lock()
+MAX_INDEXES = 8
+
+def event_count_index(midi_file, difficulty_names, mappings):
+    """Returns a built EventCountIndex, reusing an earlier one for the same
+    file, map and kit. Safe to call from a worker thread."""
+    key = os.path.realpath(midi_file)
+    with _indexes_lock:
+        index = _indexes.get(key)
+        if index is not None and index.matches(midi_file, mappings):
+            _indexes.move_to_end(key)
+            return index
+
+    index = EventCountIndex(midi_file, difficulty_names, mappings).build()
+    with _indexes_lock:
+        _indexes[key] = index
+        while len(_indexes) > MAX_INDEXES:
+            _indexes.popitem(last=False)
+    return index
@@ -0,0 +1,119 @@
+# Copyright (C) 2020 Emre Tanirgan <emre@paradiddleapp.com>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from contextlib import contextmanager
+import cProfile
+import json
+import os
+import time
+from pdlog import get_logger
+
+log = get_logger(__name__)
+
+# Set to a .prof file or a folder to capture a cProfile of every conversion
+PROFILE_ENV = 'PDU_PROFILE'
+
+# Times named stages of the converter with a monotonic clock and keeps simple
+# event counters. Stages can be nested, a nested stage is recorded as
+# "outer/inner".
+class StageTimer:
+    def __init__(self):
+        self.spans = [] # (stage, seconds) in the order the stages finished
+        self.counters = {}
+        self._stack = []
+
+    @contextmanager
+    def span(self, name):
+        self._stack.append(name)
+        stage = '/'.join(self._stack)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.spans.append((stage, time.perf_counter() - start))
+            self._stack.pop()
+
+    def count(self, name, amount=1):
+        self.counters[name] = self.counters.get(name, 0) + amount
+
+    def take(self):
+        '''Returns (spans, counters) recorded so far and starts over'''
+        spans, counters = self.spans, self.counters
+        self.spans = []
+        self.counters = {}
+        return spans, counters
+
+# Outcome of one MidiConverter conversion: the status message shown to the
+# user, the .rlrr files written and how long each stage took.
+class ConversionResult:
+    def __init__(self, status, ok, outputs, spans, counters, seconds, profile_path=None):
+        self.status = status
+        self.ok = ok
+        self.outputs = outputs
+        self.spans = spans
+        self.counters = counters
+        self.seconds = seconds
+        self.profile_path = profile_path
+
+    def stage_totals(self):
+        '''Total seconds per stage, stages that ran several times are summed'''
+        totals = {}
+        for stage, seconds in self.spans:
+            totals[stage] = totals.get(stage, 0.0) + seconds
+        return totals
+
+    def to_dict(self):
+        return {
+            'status': self.status,
+            'ok': self.ok,
+            'outputs': self.outputs,
+            'seconds': self.seconds,
+            'stages': self.stage_totals(),
+            'counters': self.counters,
+            'profile': self.profile_path
+        }
+
+    def dump_json(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.to_dict(), f, indent=4)
+
+    def summary(self):
+        lines = ['%-32s %8.3fs' % (stage, seconds) for stage, seconds in self.stage_totals().items()]
+        lines += ['%-32s %9d' % (name, value) for name, value in self.counters.items()]
+        return '\n'.join(lines)
+
+def profile_output_path(name):
+    '''Where to write a cProfile capture for `name`, None if profiling is off'''
+    target = os.environ.get(PROFILE_ENV)
+    if not target:
+        return None
+    if os.path.isdir(target):
+        return os.path.join(target, (name or 'conversion') + '.prof')
+    return target
+
+@contextmanager
+def maybe_profile(path):
+    '''Runs the body under cProfile and dumps the stats to `path`, if given'''
+    if not path:
+        yield
+        return
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        profiler.dump_stats(path)
+        log.info("Profile written to %s", path)
@@ -0,0 +1,96 @@
+# Copyright (C) 2020 Emre Tanirgan <emre@paradiddleapp.com>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from collections import OrderedDict
+import os
+import threading
+
+# Rough in-memory cost of one parsed mido message, used to keep the cache
+# under its memory cap without walking every object.
+MIDO_MESSAGE_BYTES = 160
+
+def _mido_sizeof(mid):
+    return sum(len(track) for track in mid.tracks) * MIDO_MESSAGE_BYTES + 1024
+
+def _load_mido(path):
+    from mido import MidiFile
+    return MidiFile(path, clip=True)
+
+# Process-wide cache of parsed MIDI files. Entries are keyed by the kind of
+# parse (mido objects, note arrays, ...) and the file path, and are only
+# reused while the file's mtime and size are unchanged. Cached objects are
+# shared between callers, so they must be treated as read-only.
+class MidiCache:
+    def __init__(self, max_entries=16, max_bytes=256 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict() # (kind, path) -> (mtime_ns, size, obj, nbytes)
+        self._lock = threading.Lock()
+
+    def get(self, path, kind='mido', loader=_load_mido, sizeof=_mido_sizeof):
+        """Return the parsed file at `path`, calling `loader(path)` on a miss."""
+        full_path = os.path.realpath(path)
+        st = os.stat(full_path)
+        key = (kind, full_path)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[0] == st.st_mtime_ns and entry[1] == st.st_size:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry[2]
+                self._remove(key)
+            self.misses += 1
+
+        # Parse outside the lock so one slow file doesn't block other callers
+        obj = loader(full_path)
+        nbytes = sizeof(obj)
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            if nbytes <= self.max_bytes:
+                self._entries[key] = (st.st_mtime_ns, st.st_size, obj, nbytes)
+                self.total_bytes += nbytes
+                self._evict()
+        return obj
+
+    def invalidate(self, path):
+        full_path = os.path.realpath(path)
+        with self._lock:
+            for key in [k for k in self._entries if k[1] == full_path]:
+                self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.total_bytes = 0
+
+    def _remove(self, key):
+        entry = self._entries.pop(key)
+        self.total_bytes -= entry[3]
+
+    def _evict(self):
+        # Drop least recently used entries until we're back under both caps
+        while self._entries and (len(self._entries) > self.max_entries or self.total_bytes > self.max_bytes):
+            self._remove(next(iter(self._entries)))
+
+midi_cache = MidiCache()
+
+def load_midi(path):
+    """Shared, read-only mido.MidiFile for `path` (parsed with clip=True)."""
+    return midi_cache.get(path)
@@ -13,18 +13,16 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
-from mido import MidiFile, tempo2bpm
 import threading
 import socket
-from PyQt5.QtWidgets import *
-import mido
 import json
 import os
-from shutil import copyfile
-import soundfile as sf
 import copy
 import time
 from enum import Enum
+from pdlog import get_logger
+
+log = get_logger(__name__)
 
 class ConnectionState(Enum):
     DISCONNECTED = 0
@@ -62,6 +60,9 @@ class MidiCompanion:
         self.client_socket = None
         self.midi_input_enabled = True  # New flag to control MIDI input
 
+        # mido and its MIDI backend are imported when they're first needed,
+        # so they stay off the import path of the GUI and the converter
+        import mido
         self.midi_outputs = mido.get_output_names()
         self.midi_inputs = mido.get_input_names()
 
@@ -87,6 +88,7 @@ class MidiCompanion:
     
     def setup_midi_input(self):
         """Set up MIDI input port for reading from hardware"""
+        import mido
         if self.midi_inputs and self.midi_input_index < len(self.midi_inputs):
             try:
                 if self.midi_in_port is None or self.midi_in_port.closed:
@@ -94,21 +96,21 @@ class MidiCompanion:
                         self.midi_inputs[self.midi_input_index], 
                         callback=self.on_midi_input_message
                     )
-                    print(f"Connected to MIDI input: {self.midi_inputs[self.midi_input_index]}")
+                    log.info("Connected to MIDI input: %s", self.midi_inputs[self.midi_input_index])
             except Exception as e:
-                print(f"Error connecting to MIDI input: {e}")
+                log.error("Error connecting to MIDI input: %s", e)
     
     def cleanup_midi_input(self):
         """Clean up MIDI input port"""
         if self.midi_in_port and not self.midi_in_port.closed:
             self.midi_in_port.close()
             self.midi_in_port = None
-            print("Disconnected from MIDI input")
+            log.info("Disconnected from MIDI input")
     
     def on_midi_input_message(self, message):
         """Callback for when MIDI messages are received from hardware"""
-        print(message)
-        # print("midi input enabled: " + str(self.midi_input_enabled) + " connected to host: " + str(self.connected_to_host))
+        import mido
+        log.debug("MIDI input: %s", message)
         if not self.midi_input_enabled or not self.is_connected():
             return
         
@@ -122,10 +124,10 @@ class MidiCompanion:
             midi_bytes = self.midi_message_to_bytes(temp_msg)
             if midi_bytes:
                 self.client_socket.send(midi_bytes)
-                print(f"Sent MIDI to VR: {temp_msg}")
+                log.debug("Sent MIDI to VR: %s", temp_msg)
                 
         except Exception as e:
-            print(f"Error sending MIDI message to VR: {e}")
+            log.error("Error sending MIDI message to VR: %s", e)
     
     def midi_message_to_bytes(self, message):
         """Convert mido MIDI message to byte array for UDP transmission"""
@@ -148,7 +150,7 @@ class MidiCompanion:
                 msb = (value >> 7) & 0x7F
                 return bytearray([14, message.channel, lsb, msb])
         except Exception as e:
-            print(f"Error converting MIDI message to bytes: {e}")
+            log.error("Error converting MIDI message to bytes: %s", e)
         return None
     
     def disconnect_from_host(self):
@@ -182,15 +184,16 @@ class MidiCompanion:
         return self.connection_state == ConnectionState.CONNECTED
         
     def connect_to_host(self, host_ip):
+        import mido
         self.host_ip = host_ip
         self.connection_state = ConnectionState.CONNECTING
         
-        print(f"Connecting to host: {host_ip}")
+        log.info("Connecting to host: %s", host_ip)
         
         # Set up MIDI output
         if self.midi_out_port is None or self.midi_out_port.closed:
             self.midi_out_port = mido.open_output(self.midi_outputs[self.midi_output_index])
-            print("Connected to " + self.midi_outputs[self.midi_output_index])
+            log.info("Connected to %s", self.midi_outputs[self.midi_output_index])
         
         # Set up MIDI input if enabled
         if self.midi_input_enabled:
@@ -211,11 +214,11 @@ class MidiCompanion:
                 self.initiate_handshake()
                 
             except Exception as e:
-                print(f"Error connecting to host: {e}")
+                log.error("Error connecting to host: %s", e)
                 self.connection_state = ConnectionState.DISCONNECTED
                 return False
         else:
-            print("Already connected to a socket")
+            log.warning("Already connected to a socket")
             
         return True
     
@@ -234,9 +237,9 @@ class MidiCompanion:
         try:
             message_str = json.dumps(handshake_msg)
             self.client_socket.send(message_str.encode('utf-8'))
-            print(f"Sent handshake request (attempt {self.handshake_attempts})")
+            log.debug("Sent handshake request (attempt %s)", self.handshake_attempts)
         except Exception as e:
-            print(f"Error sending handshake: {e}")
+            log.error("Error sending handshake: %s", e)
             self.connection_state = ConnectionState.DISCONNECTED
     
     def handle_handshake_response(self, message_data):
@@ -248,14 +251,14 @@ class MidiCompanion:
                 if response.get("status") == "accepted":
                     self.connection_state = ConnectionState.CONNECTED
                     self.last_heartbeat_time = time.time()
-                    print("Handshake successful - connection established!")
+                    log.info("Handshake successful - connection established!")
                     
                     if self.connection_cb:
                         self.connection_cb(True)
                         
                     return True
                 else:
-                    print(f"Handshake rejected: {response.get('reason', 'Unknown')}")
+                    log.warning("Handshake rejected: %s", response.get('reason', 'Unknown'))
                     self.connection_state = ConnectionState.DISCONNECTED
                     return False
                     
@@ -263,7 +266,7 @@ class MidiCompanion:
             # Not a JSON message, might be MIDI data
             return False
         except Exception as e:
-            print(f"Error handling handshake response: {e}")
+            log.error("Error handling handshake response: %s", e)
             return False
             
         return False
@@ -283,7 +286,7 @@ class MidiCompanion:
             self.client_socket.send(message_str.encode('utf-8'))
             self.last_heartbeat_time = time.time()
         except Exception as e:
-            print(f"Error sending heartbeat: {e}")
+            log.error("Error sending heartbeat: %s", e)
             self.connection_state = ConnectionState.DISCONNECTED
     
     def check_connection_health(self):
@@ -294,11 +297,11 @@ class MidiCompanion:
             # Check for handshake timeout
             if current_time - self.last_handshake_time > self.handshake_timeout:
                 if self.handshake_attempts < self.max_handshake_attempts:
-                    print(f"Handshake timeout, retrying... (attempt {self.handshake_attempts + 1})")
+                    log.warning("Handshake timeout, retrying... (attempt %s)", self.handshake_attempts + 1)
                     self.handshake_attempts += 1
                     self.initiate_handshake()
                 else:
-                    print("Handshake failed after maximum attempts")
+                    log.error("Handshake failed after maximum attempts")
                     self.disconnect_from_host()
                         
         elif self.connection_state == ConnectionState.CONNECTED:
@@ -308,7 +311,7 @@ class MidiCompanion:
                 
             # Check for connection timeout (no response from VR)
             if current_time - self.last_heartbeat_time > self.connection_timeout:
-                print("Connection timeout - lost connection to VR")
+                log.warning("Connection timeout - lost connection to VR")
                 self.connection_state = ConnectionState.DISCONNECTED
                 if self.connection_cb:
                     self.connection_cb(False)
@@ -316,6 +319,7 @@ class MidiCompanion:
     def listening_thread(self):
         """Enhanced listening thread with connection management"""
         global message_types
+        import mido
         
         while not self.stopEvent.is_set():
             try:
@@ -332,7 +336,7 @@ class MidiCompanion:
                     # Timeout is normal, just continue checking
                     continue
                 except Exception as e:
-                    print(f"Socket receive error: {e}")
+                    log.error("Socket receive error: %s", e)
                     break
                 
                 # Handle handshake responses first
@@ -375,17 +379,17 @@ class MidiCompanion:
                                 pitch_value -= 8192  # Convert back to signed
                                 msg = mido.Message(message_types[nums[0]], channel=nums[1], pitch=pitch_value)
                         except Exception as e:
-                            print("Error constructing midi message: " + str(e))
+                            log.error("Error constructing midi message: %s", e)
                     
                     if msg is not None:
-                        print("Received MIDI from VR: ", msg)
+                        log.debug("Received MIDI from VR: %s", msg)
                         if self.midi_msg_cb:
                             self.midi_msg_cb(str(msg))
                         if self.midi_out_port:
                             self.midi_out_port.send(msg)
                             
             except Exception as e:
-                print(f"Error in listening thread: {e}")
+                log.error("Error in listening thread: %s", e)
                 if not self.stopEvent.is_set():
                     time.sleep(1)  # Brief pause before retrying
                     continue
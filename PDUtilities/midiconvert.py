@@ -13,14 +13,353 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
-from mido import MidiFile, tempo2bpm
-from PyQt5.QtWidgets import *
-import mido
 import json
 import os
-from shutil import copyfile
-import soundfile as sf
-import copy
+import struct
+import time
+from array import array
+import numpy as np
+from midicache import load_midi, midi_cache
+from rlrrwriter import RLRRWriter
+from assets import sync_assets, file_digest, remove_unlisted_files
+from audiopack import package_audio, package_cover, audio_settings
+from pdlog import get_logger
+from instrumentation import StageTimer, ConversionResult, profile_output_path, maybe_profile
+from drumevents import DrumEventStore
+from drummap import CompiledMapping
+from midimaps import compile_midi_map, get_midi_map, add_notes
+from drumkits import get_kit, kit_library, DEFAULT_KIT
+from convcache import conversion_cache
+
+log = get_logger(__name__)
+
+CONVERSION_DONE = "Conversion done!"
+
+# Event types stored in the 'type' column of NOTE_EVENT_DTYPE. note_on with a
+# velocity of 0 is kept as EVENT_NOTE_ON, the same way mido reports it.
+EVENT_NOTE_OFF = 0
+EVENT_NOTE_ON = 1
+
+NOTE_EVENT_DTYPE = np.dtype([
+    ('tick', np.int64), # absolute tick from the start of the track
+    ('type', np.uint8),
+    ('channel', np.uint8),
+    ('note', np.uint8),
+    ('velocity', np.uint8)
+])
+
+TEMPO_EVENT_DTYPE = np.dtype([
+    ('tick', np.int64),
+    ('tempo', np.uint32) # microseconds per beat
+])
+
+def tempo_to_bpm(tempo):
+    '''Beats per minute for a tempo in microseconds per beat, like mido.tempo2bpm'''
+    return 60_000_000 / tempo
+
+# One MIDI track reduced to what the converter and song display use:
+# note on/off events, tempo changes, the track name and its last tick.
+class NoteTrack:
+    def __init__(self, name, events, tempos, end_tick):
+        self.name = name
+        self.events = events
+        self.tempos = tempos
+        self.end_tick = end_tick
+
+    def __len__(self):
+        return len(self.events)
+
+    def count_note_ons(self):
+        return int(np.count_nonzero(self.events['type'] == EVENT_NOTE_ON))
+
+DEFAULT_TEMPO = 500000 # 120 BPM, used until the first tempo change
+
+# Tick <-> seconds conversion for a whole MIDI file. Tempo changes from every
+# track are merged into one list of segments (start tick, tempo, start second),
+# so all tracks of a type 1 file are timed against the same tempo track.
+class TempoMap:
+    def __init__(self, ticks_per_beat, change_ticks=(), change_tempos=()):
+        self.ticks_per_beat = ticks_per_beat
+        change_ticks = np.asarray(change_ticks, dtype=np.int64)
+        change_tempos = np.asarray(change_tempos, dtype=np.float64)
+        # stable sort so that simultaneous changes keep their file order
+        order = np.argsort(change_ticks, kind='stable')
+        self.change_ticks = change_ticks[order]
+        self.change_tempos = change_tempos[order]
+
+        # Segments: the last change at any given tick wins
+        seg_ticks = np.concatenate(([0], self.change_ticks))
+        seg_tempos = np.concatenate(([DEFAULT_TEMPO], self.change_tempos))
+        last_at_tick = np.append(seg_ticks[1:] != seg_ticks[:-1], True)
+        self.segment_ticks = seg_ticks[last_at_tick]
+        self.segment_tempos = seg_tempos[last_at_tick]
+        seconds_per_tick = self.segment_tempos * 1e-6 / ticks_per_beat
+        self.segment_seconds = np.concatenate(([0.0], np.cumsum(np.diff(self.segment_ticks) * seconds_per_tick[:-1])))
+        self._seconds_per_tick = seconds_per_tick
+
+    @classmethod
+    def from_tracks(cls, ticks_per_beat, tracks):
+        tempos = [track.tempos for track in tracks if len(track.tempos)]
+        if not tempos:
+            return cls(ticks_per_beat)
+        merged = np.concatenate(tempos)
+        return cls(ticks_per_beat, merged['tick'], merged['tempo'])
+
+    def tick_to_seconds(self, tick):
+        i = int(np.searchsorted(self.segment_ticks, tick, side='right')) - 1
+        return float(self.segment_seconds[i] + (tick - self.segment_ticks[i]) * self._seconds_per_tick[i])
+
+    def ticks_to_seconds(self, ticks):
+        '''Vectorized tick_to_seconds for an array of absolute ticks'''
+        ticks = np.asarray(ticks, dtype=np.int64)
+        i = np.searchsorted(self.segment_ticks, ticks, side='right') - 1
+        return self.segment_seconds[i] + (ticks - self.segment_ticks[i]) * self._seconds_per_tick[i]
+
+    def tempo_at_tick(self, tick):
+        i = int(np.searchsorted(self.segment_ticks, tick, side='right')) - 1
+        return int(self.segment_tempos[i])
+
+    def tempo_at_seconds(self, seconds):
+        i = int(np.searchsorted(self.segment_seconds, seconds, side='right')) - 1
+        return int(self.segment_tempos[max(i, 0)])
+
+    def bpm_events(self):
+        '''One {"bpm", "time"} dict per tempo change in the file, as written to .rlrr'''
+        times = self.ticks_to_seconds(self.change_ticks)
+        return [{"bpm" : tempo_to_bpm(tempo), "time" : time} for tempo, time in zip(self.change_tempos.tolist(), times.tolist())]
+
+GM_DRUM_CHANNEL = 9 # MIDI channel 10
+
+# Summary of one track, worked out once when the file is loaded: how many
+# note_ons it has, which notes and channels they use, when they start and
+# end and how many tempo changes the track carries.
+class TrackProfile:
+    def __init__(self, index, track, tempo_map):
+        self.index = index
+        self.name = track.name
+        events = track.events
+        note_ons = events[events['type'] == EVENT_NOTE_ON]
+        self.note_ons = len(note_ons)
+        self.note_histogram = np.bincount(note_ons['note'], minlength=128)
+        self.channel_counts = np.bincount(note_ons['channel'], minlength=16)
+        self.tempo_events = len(track.tempos)
+        if self.note_ons:
+            self.first_note_time = tempo_map.tick_to_seconds(int(note_ons['tick'][0]))
+            self.last_note_time = tempo_map.tick_to_seconds(int(note_ons['tick'][-1]))
+        else:
+            self.first_note_time = self.last_note_time = 0.0
+
+    def drum_channel_density(self):
+        '''Fraction of the track's note_ons on the General MIDI drum channel'''
+        return self.channel_counts[GM_DRUM_CHANNEL] / self.note_ons if self.note_ons else 0.0
+
+    def drum_score(self):
+        '''How likely this is the drum part: a "drum" track name or notes on
+        the GM drum channel. 0 for tracks without any notes.'''
+        if not self.note_ons:
+            return 0.0
+        score = float(self.drum_channel_density())
+        if "drum" in self.name.lower():
+            score += 2.0
+        return score
+
+    def nbytes(self):
+        return self.note_histogram.nbytes + self.channel_counts.nbytes + 256
+
+# Note-only view of a Standard MIDI File, laid out as NumPy arrays
+class MidiNoteData:
+    def __init__(self, type, ticks_per_beat, tracks):
+        self.type = type
+        self.ticks_per_beat = ticks_per_beat
+        self.tracks = tracks
+        self.tempo_map = TempoMap.from_tracks(ticks_per_beat, tracks)
+        end_tick = max((track.end_tick for track in tracks), default=0)
+        self.length = self.tempo_map.tick_to_seconds(end_tick)
+        self.track_profiles = [TrackProfile(i, track, self.tempo_map) for i, track in enumerate(tracks)]
+
+    def count_note_ons(self):
+        return sum(profile.note_ons for profile in self.track_profiles)
+
+    def default_drum_track(self):
+        '''Index of the track most likely to hold the drums'''
+        default_index = 0 if self.type == 0 else (1 if len(self.tracks) > 1 else 0)
+        best = max(self.track_profiles, key=TrackProfile.drum_score, default=None)
+        if best is not None and best.drum_score() > 0:
+            return best.index
+        return default_index
+
+    def nbytes(self):
+        return sum(track.events.nbytes + track.tempos.nbytes for track in self.tracks) \
+            + sum(profile.nbytes() for profile in self.track_profiles) + 1024
+
+def _build_note_track(name, ticks, types, channels, notes, velocities, tempo_ticks, tempos, end_tick):
+    events = np.empty(len(ticks), dtype=NOTE_EVENT_DTYPE)
+    events['tick'] = ticks
+    events['type'] = types
+    events['channel'] = channels
+    events['note'] = notes
+    events['velocity'] = velocities
+    tempo_events = np.empty(len(tempo_ticks), dtype=TEMPO_EVENT_DTYPE)
+    tempo_events['tick'] = tempo_ticks
+    tempo_events['tempo'] = tempos
+    return NoteTrack(name, events, tempo_events, end_tick)
+
+def _parse_smf_track(data, pos, end):
+    ticks = []
+    types = []
+    channels = []
+    notes = []
+    velocities = []
+    tempo_ticks = []
+    tempos = []
+    name = None
+    tick = 0
+    status = None
+
+    while pos < end:
+        # Delta time (variable length quantity)
+        delta = 0
+        while True:
+            byte = data[pos]
+            pos += 1
+            delta = (delta << 7) | (byte & 0x7F)
+            if byte < 0x80:
+                break
+        tick += delta
+
+        byte = data[pos]
+        if byte == 0xFF:
+            # Meta event, doesn't change running status
+            meta_type = data[pos + 1]
+            pos += 2
+            length = 0
+            while True:
+                byte = data[pos]
+                pos += 1
+                length = (length << 7) | (byte & 0x7F)
+                if byte < 0x80:
+                    break
+            if meta_type == 0x51 and length == 3:
+                tempo_ticks.append(tick)
+                tempos.append((data[pos] << 16) | (data[pos + 1] << 8) | data[pos + 2])
+            elif meta_type == 0x03 and name is None:
+                name = data[pos:pos + length].decode('latin1')
+            pos += length
+            continue
+        if byte == 0xF0 or byte == 0xF7:
+            # Sysex, skipped entirely
+            pos += 1
+            length = 0
+            while True:
+                byte = data[pos]
+                pos += 1
+                length = (length << 7) | (byte & 0x7F)
+                if byte < 0x80:
+                    break
+            pos += length
+            status = None
+            continue
+
+        if byte >= 0x80:
+            status = byte
+            pos += 1
+        elif status is None:
+            raise ValueError('Running status without a previous status byte')
+
+        kind = status & 0xF0
+        if kind == 0x90 or kind == 0x80:
+            ticks.append(tick)
+            types.append(EVENT_NOTE_ON if kind == 0x90 else EVENT_NOTE_OFF)
+            channels.append(status & 0x0F)
+            notes.append(min(data[pos], 127))
+            velocities.append(min(data[pos + 1], 127))
+            pos += 2
+        elif kind == 0xC0 or kind == 0xD0:
+            pos += 1
+        elif kind < 0xF0:
+            pos += 2
+        else:
+            raise ValueError('Unexpected status byte 0x%02X in track data' % status)
+
+    if pos > end:
+        raise ValueError('Track data runs past the end of its chunk')
+    return _build_note_track(name or '', ticks, types, channels, notes, velocities, tempo_ticks, tempos, tick)
+
+def parse_smf_notes(data):
+    '''Decode the raw bytes of a Standard MIDI File straight into a MidiNoteData,
+    skipping every event that isn't a note on/off or tempo change.
+    Raises ValueError (or IndexError on truncated data) for files it can't read.'''
+    if data[:4] != b'MThd':
+        raise ValueError('Not a Standard MIDI File')
+    header_len = struct.unpack('>I', data[4:8])[0]
+    midi_type, num_tracks, division = struct.unpack('>HHh', data[8:14])
+    if division < 0:
+        raise ValueError('SMPTE time division is not supported')
+
+    pos = 8 + header_len
+    tracks = []
+    while len(tracks) < num_tracks:
+        if pos + 8 > len(data):
+            raise ValueError('Missing track chunks')
+        chunk_id = data[pos:pos + 4]
+        chunk_len = struct.unpack('>I', data[pos + 4:pos + 8])[0]
+        pos += 8
+        if chunk_id == b'MTrk':
+            tracks.append(_parse_smf_track(data, pos, min(pos + chunk_len, len(data))))
+        pos += chunk_len
+    return MidiNoteData(midi_type, division, tracks)
+
+def note_data_from_mido(mid):
+    '''Build a MidiNoteData from an already parsed mido.MidiFile'''
+    tracks = []
+    for track in mid.tracks:
+        ticks, types, channels, notes, velocities, tempo_ticks, tempos = [], [], [], [], [], [], []
+        tick = 0
+        for msg in track:
+            tick += msg.time
+            if msg.type == 'note_on' or msg.type == 'note_off':
+                ticks.append(tick)
+                types.append(EVENT_NOTE_ON if msg.type == 'note_on' else EVENT_NOTE_OFF)
+                channels.append(msg.channel)
+                notes.append(msg.note)
+                velocities.append(msg.velocity)
+            elif msg.type == 'set_tempo':
+                tempo_ticks.append(tick)
+                tempos.append(msg.tempo)
+        tracks.append(_build_note_track(track.name, ticks, types, channels, notes, velocities, tempo_ticks, tempos, tick))
+    return MidiNoteData(mid.type, mid.ticks_per_beat, tracks)
+
+def _load_midi_notes(path):
+    with open(path, 'rb') as f:
+        data = f.read()
+    try:
+        return parse_smf_notes(data)
+    except (ValueError, IndexError, struct.error) as e:
+        # Odd or slightly broken files: let mido have a go at them instead
+        log.warning("Fast MIDI reader failed (%s), falling back to mido", e)
+        return note_data_from_mido(load_midi(path))
+
+def read_midi_notes(path):
+    '''Shared, read-only MidiNoteData for `path`'''
+    return midi_cache.get(path, kind='notes', loader=_load_midi_notes, sizeof=MidiNoteData.nbytes)
+
+def listed_audio_files(folder, song_name):
+    '''Names of the audio files the song's .rlrr files in `folder` refer to'''
+    names = set()
+    try:
+        rlrr_names = [name for name in os.listdir(folder) if name.startswith(song_name + '_') and name.endswith('.rlrr')]
+    except OSError:
+        return names
+    for name in rlrr_names:
+        try:
+            with open(os.path.join(folder, name), encoding='utf-8') as f:
+                audio = json.load(f).get('audioFileData', {})
+            names.update(audio.get('songTracks', []) + audio.get('drumTracks', []))
+            if audio.get('songPreview'):
+                names.add(audio['songPreview'])
+        except (OSError, ValueError, AttributeError, TypeError) as e:
+            log.debug("Could not read the audio files of %s: %s", name, e)
+    return names
 
 class MidiConverter:
     def __init__(self):
@@ -39,7 +378,7 @@ class MidiConverter:
         # TODO: Replace filenames, this is gonna be a python package
         script_dir = os.path.dirname(os.path.realpath(__file__))
         self.drum_set_file = os.path.join(script_dir,'drum_sets','defaultset.rlrr')
-        self.drum_set_dict = None
+        self.drum_kit = None # DrumKit, see analyze_drum_set
         self.midi_file = ''
         self.output_rlrr_dir = ''
         self.song_tracks = [""] * 5
@@ -56,6 +395,7 @@ class MidiConverter:
         self.convert_track_index = 0
         self.note_to_drum_maps = [] # in order of difficulty
         self.toggle_to_drum_maps = [] # example: [{111: Snare, 110: HiHat}, {100: Kick}]
+        self.compiled_mappings = {} # map index -> CompiledMapping for the current kit
 
         self.audio_file_data = {
             'songTracks' : [],
@@ -76,6 +416,20 @@ class MidiConverter:
 
         self.song_name = ''
 
+        # Write .rlrr files without indentation (much smaller for big charts)
+        self.compact_output = False
+        # Transcode audio to OGG/Vorbis and shrink the cover image when packaging
+        self.optimize_audio = False
+        # Skip conversions whose inputs and output files haven't changed
+        self.use_conversion_cache = True
+        self.audio_workers = None # processes for transcoding, None = one per core
+
+        # Stage timings and counters, handed out with each ConversionResult
+        self.timer = StageTimer()
+        self.written_files = []
+        self.written_assets = []
+        self.last_result = None
+
         # FIXME: Replace with index of difficulty_names
         self.song_complexity = 1
         self.artist_name = ''
@@ -87,204 +441,120 @@ class MidiConverter:
     # a tuple of (drum class, location) instead (or just drum class if we want to use a default location value of 0)
 
     def analyze_drum_set(self, drum_set_filename):
-        self.drum_set_dict = None
+        self.drum_kit = None
+        self.compiled_mappings.clear()
 
         if drum_set_filename == '':
-            self.default_set_name = "drum_sets/defaultset.rlrr"
-            self.default_set_full_path = os.path.join(self.script_dir, self.default_set_name)
-            print(self.default_set_full_path)
-            drum_set_filename = self.default_set_full_path
-
-
-        with open(drum_set_filename) as f:
-            self.drum_set_dict = json.load(f)
-            print("Kit Length: " + str(len(self.drum_set_dict["instruments"])))
-            #TODO handle drum layout formats with version 0 and 0.5 here
-            # need to go throuh all instruments, see if their midi notes have been changed or set
-            # for mallets, need to check the first key index and number of notes?
+            log.debug("Default drum set: %s", DEFAULT_KIT)
+            drum_set_filename = DEFAULT_KIT
+
+
+        if not os.path.exists(drum_set_filename) and drum_set_filename in kit_library.names():
+            self.drum_kit = kit_library.get(drum_set_filename) # a kit name instead of a path
+        else:
+            self.drum_kit = get_kit(drum_set_filename)
+        log.info("Kit Length: %d", len(self.drum_kit.instruments))
+        #TODO handle drum layout formats with version 0 and 0.5 here
+        # need to go throuh all instruments, see if their midi notes have been changed or set
+        # for mallets, need to check the first key index and number of notes?
+
+    @property
+    def drum_set_dict(self):
+        '''The whole drum kit file, only read once a song is written'''
+        return self.drum_kit.load() if self.drum_kit else None
+
+    def missing_kit_classes(self):
+        '''Drum classes the current MIDI map uses that the kit doesn't have'''
+        if not self.drum_kit:
+            return set()
+        return self.drum_kit.missing_classes(self.note_to_drum_maps, self.toggle_to_drum_maps)
 
     # Returns a tuple of the default midi track we want to use in the form of
     # (midi track object, track index)
     def get_default_midi_track(self):
-        mid = MidiFile(self.midi_file, clip=True)
+        # A new file was selected, anything timed before belongs to the last one
+        self.timer.take()
+        with self.timer.span('read_midi'):
+            mid = read_midi_notes(self.midi_file)
 
         self.midi_track_names.clear()
 
-        print('Midi file type: ' + str(mid.type))
-        default_index = 0 if mid.type == 0 else (1 if len(mid.tracks) > 1 else 0)
-        track_to_convert = mid.tracks[default_index]
-
-        for i, track in enumerate(mid.tracks):
-            print('Track {}: {}'.format(i, track.name))
-            self.midi_track_names.append(track.name)
-            if ("drum" in track.name.lower()): # default to a midi track if it has 'drum' in the name
-                track_to_convert = track
-                default_index = i
-                print("found drum in " + str(track_to_convert) + " " + str(default_index))
-        return (track_to_convert, default_index)
-
-    def analyze_midi_file(self):
-        self.out_dict["instruments"] = []
-        self.out_dict["events"] = []
-        self.out_dict["bpmEvents"] = []
-        mid = MidiFile(self.midi_file, clip=True)
-
-        try:
-            # print("Mid length: " + str(mid.length))
-            midi_len = mid.length
-            if self.length < midi_len:
-                self.length = midi_len
-        except ValueError:
-            print("Invalid midi file type to get length")
-
-        tempo = 500000
-        #list of tuples in the form of (total_ticks, total_seconds, new_tempo)
-        tempo_events = [(0.0, 0.0, tempo)]
-        total_time = 0.0
-        total_ticks = 0.0
-        longest_time = 0.0
-
-        # note_to_drums_map = pdtracks_notes
-        diff_index = self.difficulty_names.index(self.difficulty)
+        log.info('Midi file type: %d', mid.type)
+        for profile in mid.track_profiles:
+            log.info('Track %d: %s (%d notes, %.0f%% on drum channel)', profile.index, profile.name, profile.note_ons, 100 * profile.drum_channel_density())
+            self.midi_track_names.append(profile.name)
+
+        # default to the track that looks most like drums, by name or channel
+        with self.timer.span('select_track'):
+            default_index = mid.default_drum_track()
+        log.info("Default drum track: %d", default_index)
+        return (mid.tracks[default_index], default_index)
+
+    def compiled_mapping(self, difficulty):
+        """CompiledMapping of the MIDI map for `difficulty` against the current
+        drum kit. Built once and reused until the map or the kit changes."""
+        diff_index = self.difficulty_names.index(difficulty)
         # fall back to highest difficulty map if our difficulty isn't in the map
-        # print(note_to_drum_maps)
-        note_map = copy.deepcopy(self.note_to_drum_maps[min(len(self.note_to_drum_maps)-1, diff_index)])
-        toggle_map = copy.deepcopy(self.toggle_to_drum_maps[min(len(self.toggle_to_drum_maps)-1, diff_index)])
+        map_index = min(len(self.note_to_drum_maps)-1, diff_index)
+        if map_index not in self.compiled_mappings:
+            self.compiled_mappings[map_index] = CompiledMapping(self.note_to_drum_maps[map_index],
+                                                                self.toggle_to_drum_maps[map_index],
+                                                                self.drum_kit.instruments)
+        return self.compiled_mappings[map_index]
+
+    def analyze_difficulties(self, difficulties):
+        """Walks the track to convert once and maps it for every difficulty in
+        `difficulties` at the same time. Returns a dict of difficulty name to
+        its DrumEventStore."""
+        with self.timer.span('read_midi'):
+            mid = read_midi_notes(self.midi_file)
+        tempo_map = mid.tempo_map
+
+        if self.length < mid.length:
+            self.length = mid.length
 
-        # print(note_map)
         self.track_to_convert = mid.tracks[self.convert_track_index]
-        # print(track_to_convert)
-
-        print("Kit layout again: " + str(self.drum_set_dict["instruments"]))
-        # if drum_set_dict is None:
-        #     for drum_class in class_to_default_notes:
-        #         print(drum_class)
-        #         note_to_drums_map[class_to_default_notes[drum_class]]= [str(drum_class)+"Default"]
-        # else:
-        # TODO for now assume all drums will be in the drum kit file
-        kit_instruments = self.drum_set_dict["instruments"]
-        for note in note_map:
-            for drum in note_map[note]:
-                drum_class = drum["drum"]
-                print("Drum class: " + drum_class)
-                drums = [d for d in kit_instruments if d["class"] == drum_class]
-                if(len(drums) > 0):
-                    drum["drum"] = drums[0]["name"]
-                else:
-                    drum["drum"] =  drum_class+"Default"
-                    print(drum_class+"Default")
-        # print(toggle_map)
-        toggle_map_rev = {}
-        for toggle in toggle_map:
-            drum_class = toggle_map[toggle]
-            drums = [d for d in kit_instruments if d["class"] == drum_class]
-            if(len(drums) > 0):
-                toggle_map[toggle] = drums[0]["name"]
-            else:
-                toggle_map[toggle] =  drum_class+"Default"
-            toggle_map_rev[toggle_map[toggle]] = toggle
-        # print('Updated toggle map: ' + str(toggle_map))
-        # print('toggle map rev: ' + str(toggle_map_rev))
-        self.out_dict["instruments"] = self.drum_set_dict["instruments"]
-        # print(note_map)
-
-        # Tempo changes
-        tempo_total_ticks = 0
-        tempo_total_seconds = 0
-        tempo_index = 0
-        tempo = 500000
-        default_tempo = 500000
-        active_toggles = []
-        for i, track in enumerate(mid.tracks):
-            for msg in track:
-                # print(msg.type + " " + str(msg.time))
-                tempo_total_seconds += mido.tick2second(msg.time, mid.ticks_per_beat, tempo)
-                tempo_total_ticks += msg.time
-                if msg.is_meta:
-                    if msg.type == "set_tempo":
-                        tempo = msg.tempo
-                        tempo_events.append((tempo_total_ticks, tempo_total_seconds, msg.tempo))
-                        print('Tempo change: ' + str(tempo2bpm(msg.tempo)) + ' time: ' + str(tempo_total_seconds) + ' ticks: ' + str(tempo_total_ticks))
-                        self.out_dict["bpmEvents"].append({"bpm" : tempo2bpm(msg.tempo), "time" : tempo_total_seconds})
-        if len(tempo_events) == 0:
-            tempo_events = [(0.0, 0.0, default_tempo)]
-            self.out_dict["bpmEvents"].append({"bpm" : default_tempo, "time" : 0})
-
-        # print("Ticks per beat: " + str(mid.ticks_per_beat))
-        # print("Tempo Changes: " + str(tempo_events))
-        queued_msgs = []
-        total_time = 0
-        print('Track len: ' + str(len(self.track_to_convert)))
-        for msg in self.track_to_convert:
-            if msg.time > 0:
-                for queued_msg in queued_msgs:
-                    note = queued_msg.note
-                    # print('queued')
-                    # print(queued_msg.note)
-                    toggle_active = False
-                    notoggle_hits = []
-                    for drum in note_map[note]:
-                        drum_name = drum["drum"]
-                        drum_hit = {"name" : drum_name, "vel" : queued_msg.velocity, "loc": 0, "time": '%.4f'%total_time}
-                        if drum_name in toggle_map_rev and toggle_map_rev[drum_name] in active_toggles:
-                            toggle_active = True
-                            self.out_dict["events"].append(drum_hit)
-                        if drum_name not in toggle_map_rev:
-                            notoggle_hits.append(drum_hit)
-                    if not toggle_active:
-                        for hit in notoggle_hits:
-                            self.out_dict["events"].append(hit)
-                queued_msgs.clear()
-
-            total_ticks += msg.time
-            # print('Total ticks: ' + str(total_ticks) + ' Msg time: ' + str(msg.time))
-            while (tempo_index+1 < len(tempo_events)) and (total_ticks > tempo_events[tempo_index+1][0]):
-                tempo_index += 1
-            tempo = tempo_events[tempo_index][2]
-            # print('Tempo: ' + str(tempo))
-            # total_time = total_time + mido.tick2second(msg.time, mid.ticks_per_beat, tempo) # old method of computing time, was slightly off
-            total_time = tempo_events[tempo_index][1] + mido.tick2second(total_ticks - tempo_events[tempo_index][0], mid.ticks_per_beat, tempo)
-            # print(str(msg.type) + " " + str(msg.time) + " total ticks: " + str(total_ticks) + " total time: " + str(total_time))
-            if(total_time > longest_time):
-                longest_time = total_time
-            if not msg.is_meta:
-                if msg.type == "note_on":
-                    note = msg.note
-                    # print(msg.note)
-                    #we ignore velocity 0 notes here?
-                    if note in toggle_map:
-                        if note not in active_toggles:
-                            active_toggles.append(note)
-                    if note in note_map and msg.velocity > 0:
-                        hits = []
-                        has_toggle = False
-                        for drum in note_map[note]:
-                            # if this drum has to be toggled on by a note,
-                            # check to see if the toggle note is active right now.
-                            # might have to go ahead and look at all the other notes
-                            # at this tick first before doing this
-                            drum_name = drum["drum"]
-                            # print(drum_name)
-                            if drum_name in toggle_map_rev:
-                                has_toggle = True
-                                if msg not in queued_msgs:
-                                    queued_msgs.append(copy.deepcopy(msg))
-                            else:
-                                drum_hit = {"name" : drum_name, "vel" : msg.velocity, "loc": 0, "time": '%.4f'%total_time}
-                                hits.append(drum_hit)
-                            # print(str(drum_hit) + " tempo: " + str(tempo) + " total ticks: " + str(total_ticks))
-                        if not has_toggle:
-                            for hit in hits:
-                                self.out_dict["events"].append(hit)
-                if msg.type == "note_off" or (msg.type == "note_on" and msg.velocity == 0):
-                    note = msg.note
-                    if note in toggle_map:
-                        active_toggles.remove(note)
-        # print(tempo_index)
-        print("Ticks Per Beat " + str(mid.ticks_per_beat) + ", Tempo " + str(tempo) + ", BPM " + '%.2f'%tempo2bpm(tempo))
-        print("Midi File Length " + str(mid.length))
-        print("Our totaled file length " + str(longest_time))
-        # print(out_dict)
+        log.debug("Kit layout: %s", self.drum_kit.instruments)
+
+        # Difficulties that fall back to the same map share their hits
+        with self.timer.span('compile_mapping'):
+            mappings = {}
+            for difficulty in difficulties:
+                mapping = self.compiled_mapping(difficulty)
+                mappings.setdefault(id(mapping), mapping)
+            mappings = list(mappings.values())
+
+        events = self.track_to_convert.events
+        log.debug('Track len: %d', len(self.track_to_convert))
+        self.timer.count('midi_events', len(events))
+        with self.timer.span('resolve_hits'):
+            hits = resolve_drum_hits(mappings, events)
+        with self.timer.span('tempo'):
+            event_times = tempo_map.ticks_to_seconds(events['tick'])
+        stores = {}
+        with self.timer.span('build_events'):
+            for mapping, (event_indices, slots) in zip(mappings, hits):
+                stores[id(mapping)] = DrumEventStore(mapping.instrument_names,
+                                                     event_times[event_indices],
+                                                     mapping.note_ids[events['note'][event_indices], slots],
+                                                     events['velocity'][event_indices])
+                self.timer.count('drum_hits', len(event_indices))
+        tempo = tempo_map.tempo_at_tick(self.track_to_convert.end_tick)
+        log.info("Ticks Per Beat %d, Tempo %d, BPM %.2f", mid.ticks_per_beat, tempo, tempo_to_bpm(tempo))
+        log.info("Midi File Length %s", mid.length)
+        log.debug("Our totaled file length %s", tempo_map.tick_to_seconds(self.track_to_convert.end_tick))
+
+        return {difficulty: stores[id(self.compiled_mapping(difficulty))] for difficulty in difficulties}
+
+    def analyze_midi_file(self):
+        self.out_dict["events"] = self._analyze([self.difficulty])[self.difficulty]
+
+    def _analyze(self, difficulties):
+        with self.timer.span('analyze'):
+            self.out_dict["instruments"] = self.drum_set_dict["instruments"]
+            with self.timer.span('bpm_events'):
+                self.out_dict["bpmEvents"] = read_midi_notes(self.midi_file).tempo_map.bpm_events()
+            return self.analyze_difficulties(difficulties)
         
     def count_converted_events(self) -> int:
         """Count how many events would be in the converted RLRR file without doing full conversion"""
@@ -295,140 +565,176 @@ class MidiConverter:
             return 0
             
         try:
-            mid = MidiFile(self.midi_file, clip=True)
-            diff_index = self.difficulty_names.index(self.difficulty)
-            note_map = copy.deepcopy(self.note_to_drum_maps[min(len(self.note_to_drum_maps)-1, diff_index)])
-            toggle_map = copy.deepcopy(self.toggle_to_drum_maps[min(len(self.toggle_to_drum_maps)-1, diff_index)])
-            
-            # Create reverse toggle map for lookup
-            toggle_map_rev = {}
-            for note in toggle_map:
-                for drum in toggle_map[note]:
-                    toggle_map_rev[drum["drum"]] = note
-                    
+            mid = read_midi_notes(self.midi_file)
             track_to_convert = mid.tracks[self.convert_track_index]
-            event_count = 0
-            active_toggles = []
-            
-            for msg in track_to_convert:
-                if msg.type == "note_on" and msg.velocity > 0:
-                    note = msg.note
-                    if note in note_map:
-                        toggle_active = False
-                        notoggle_hits = []
-                        
-                        for drum in note_map[note]:
-                            drum_name = drum["drum"]
-                            
-                            if drum_name in toggle_map_rev and toggle_map_rev[drum_name] in active_toggles:
-                                toggle_active = True
-                                event_count += 1
-                            if drum_name not in toggle_map_rev:
-                                notoggle_hits.append(drum_name)
-                                
-                        if not toggle_active:
-                            event_count += len(notoggle_hits)
-                            
-                    elif note in toggle_map:
-                        active_toggles.append(note)
-                        
-                elif msg.type == "note_off" or (msg.type == "note_on" and msg.velocity == 0):
-                    note = msg.note
-                    if note in toggle_map and note in active_toggles:
-                        active_toggles.remove(note)
-                        
-            return event_count
+            (event_indices, slots), = resolve_drum_hits([self.compiled_mapping(self.difficulty)], track_to_convert.events)
+            return len(event_indices)
             
         except Exception as e:
-            print(f"Error counting converted events: {e}")
+            log.error("Error counting converted events: %s", e)
             return 0
 
     def create_midi_map(self, midi_yaml):
         '''Construct dicts for each difficulty that
         are in the form [note] : {'drum': [drum_class]}
         This makes lookups easier later on when we analyze the midi file.'''
-        self.note_to_drum_maps.clear()
-        self.toggle_to_drum_maps.clear()
-        for diff in self.difficulty_names:
-            note_map = {}
-            toggle_map = {}
-            print(midi_yaml[diff.lower()])
-            diff_map = midi_yaml[diff.lower()]
-            if not diff_map or len(diff_map) == 0:
-                continue
-            for drum in diff_map:
-                if type(diff_map[drum]) == list:
-                    self.extract_midi_notes(note_map, diff_map[drum], drum)
-                else:
-                    drum_map = diff_map[drum]
-                    if 'toggle_note' in drum_map:
-                        toggle_map[drum_map['toggle_note']] = 'BP_%s_C' % drum
-                    if 'notes' in drum_map:
-                        self.extract_midi_notes(note_map, drum_map['notes'], drum)
-            self.note_to_drum_maps.append(note_map)
-            self.toggle_to_drum_maps.append(toggle_map)
+        self._set_midi_maps(*compile_midi_map(midi_yaml, self.difficulty_names))
+
+    def load_midi_map(self, path):
+        '''Same as create_midi_map for a .yaml file, reusing the compiled maps
+        if the file was loaded before'''
+        midi_map = get_midi_map(path, self.difficulty_names)
+        self._set_midi_maps(midi_map.note_maps, midi_map.toggle_maps)
+        return midi_map
+
+    def _set_midi_maps(self, note_maps, toggle_maps):
+        self.note_to_drum_maps = list(note_maps)
+        self.toggle_to_drum_maps = list(toggle_maps)
+        self.compiled_mappings.clear()
 
     def extract_midi_notes(self, note_map, note_list, drum_name):
-        for note in note_list:
-            if type(note) == str:
-                note.replace(' ', '')
-                if len(note.split('-')) > 1:
-                    min_note = int(note.split('-')[0])
-                    max_note = int(note.split('-')[1])
-                    for range_note in range(min_note, max_note+1):
-                        if range_note not in note_map:
-                            note_map[range_note] = []
-                        note_map[range_note].append({'drum': 'BP_%s_C' % (drum_name)})
-                else:
-                    try:
-                        str_note = int(note)
-                        if str_note not in note_map:
-                            note_map[str_note] = []
-                        note_map[str_note].append({'drum' : 'BP_%s_C' % drum_name})
-                    except ValueError:
-                        print("Not a valid number!")
-            else:
-                if note not in note_map:
-                    note_map[note] = []
-                note_map[note].append({'drum' : 'BP_%s_C' % drum_name})
+        add_notes(note_map, note_list, drum_name)
 
     def convert_to_rlrr(self) -> str:
-        print("Converting to rlrr...")
-        if not self.midi_file:
-            return "Please slect a MIDI file first."
-        self.analyze_midi_file()
+        log.info("Converting to rlrr...")
+        return self.run_conversion([self.difficulty]).status
+
+    def convert_all_difficulties(self) -> str:
+        """Converts every difficulty from a single pass over the MIDI track and
+        writes one .rlrr file per difficulty, copying the audio files once."""
+        log.info("Converting all difficulties to rlrr...")
+        return self.run_conversion(self.difficulty_names).status
+
+    def run_conversion(self, difficulties) -> ConversionResult:
+        """Converts `difficulties` and returns a ConversionResult with the
+        status message, the files written and the time spent in each stage.
+        Stages timed since the MIDI file was selected with
+        get_default_midi_track (e.g. loading it) are included. Set PDU_PROFILE to capture a cProfile of the run."""
+        self.written_files = []
+        self.written_assets = []
+        profile_path = profile_output_path(self.song_name)
+        start = time.perf_counter()
+        with maybe_profile(profile_path):
+            with self.timer.span('convert'):
+                if not self.midi_file:
+                    status = "Please slect a MIDI file first."
+                else:
+                    status = self._convert_cached(difficulties)
+        spans, counters = self.timer.take()
+        self.last_result = ConversionResult(status, status == CONVERSION_DONE, list(self.written_files),
+                                            spans, counters, time.perf_counter() - start, profile_path)
+        return self.last_result
+
+    def _convert_cached(self, difficulties) -> str:
+        if not self.use_conversion_cache:
+            return self._write_song(self._analyze(difficulties))
+        with self.timer.span('cache_lookup'):
+            key = conversion_cache.key(self.conversion_key(difficulties))
+            cached = conversion_cache.lookup(key)
+        if cached is not None:
+            log.info("%s is unchanged since it was last converted, skipping it", self.song_name)
+            self.written_files = cached
+            self.timer.count('cache_hits')
+            return CONVERSION_DONE
+        status = self._write_song(self._analyze(difficulties))
+        if status == CONVERSION_DONE:
+            conversion_cache.store(key, self.written_files, self.written_assets)
+        return status
+
+    def conversion_key(self, difficulties):
+        '''Everything the output of converting `difficulties` depends on'''
+        def file_state(path):
+            try:
+                st = os.stat(path)
+                return [os.path.realpath(path), st.st_size, st.st_mtime_ns]
+            except OSError:
+                return [path, None, None]
+        map_indices = sorted({min(len(self.note_to_drum_maps)-1, self.difficulty_names.index(d)) for d in difficulties}) if self.note_to_drum_maps else []
+        return {
+            'midi': file_digest(self.midi_file).hex(),
+            'track': self.convert_track_index,
+            'difficulties': list(difficulties),
+            'maps': [[sorted(self.note_to_drum_maps[i].items()), sorted(self.toggle_to_drum_maps[i].items())] for i in map_indices],
+            'kit': self.drum_kit.digest if self.drum_kit else None,
+            'metadata': [self.song_name, self.artist_name, self.author_name, self.recording_description,
+                         self.song_complexity, self.calibration_offset],
+            # the audio files decide the song length as well as what's copied
+            'assets': [file_state(path) for path in self.drum_tracks + self.song_tracks + [self.song_preview_track, self.cover_image_path] if path.strip()],
+            'output': [os.path.realpath(self.output_rlrr_dir), self.compact_output,
+                       audio_settings() if self.optimize_audio else False]
+        }
+
+    def _write_song(self, events_by_difficulty) -> str:
+        with self.timer.span('write_song'):
+            return self._write_song_files(events_by_difficulty)
+
+    def _write_song_files(self, events_by_difficulty) -> str:
         # Filter out empty strings from track lists
         flt_drum_tracks = [x for x in self.drum_tracks if x.strip()]
         flt_song_tracks = [x for x in self.song_tracks if x.strip()]
 
         # use whichever is longer for our overall song length
-        last_event_time = 0
-        if "events" in self.out_dict and len(self.out_dict["events"]):
-            last_event_time = float(self.out_dict["events"][-1]["time"])
         track_to_load = flt_song_tracks[0] if len(flt_song_tracks) else (flt_drum_tracks[0] if len(flt_drum_tracks) else None)
-        length = last_event_time
+
+        output_folder_path = os.path.join(self.output_rlrr_dir, self.song_name)
+        if not os.path.isdir(output_folder_path):
+            try:
+                os.makedirs(output_folder_path)
+            except Exception as e:
+                log.error("Error creating directory: %s", e)
+                return f"Failed to create output directory `{output_folder_path}`"
+        with self.timer.span('previous_assets'):
+            previous_audio = listed_audio_files(output_folder_path, self.song_name)
+
+        if self.optimize_audio:
+            # Transcode the audio to OGG and shrink the cover, the .rlrr
+            # files then refer to the new file names
+            preview_tracks = [self.song_preview_track] if self.song_preview_track else []
+            with self.timer.span('package_audio'):
+                audio_names = package_audio(flt_drum_tracks + flt_song_tracks + preview_tracks, output_folder_path, self.audio_workers)
+            self.timer.count('assets_packaged', len(audio_names))
+            short_dtracks = [audio_names[x] for x in flt_drum_tracks]
+            short_stracks = [audio_names[x] for x in flt_song_tracks]
+            short_preview = audio_names[self.song_preview_track] if self.song_preview_track else ''
+            with self.timer.span('package_cover'):
+                cover_image_short = package_cover(self.cover_image_path, output_folder_path) if self.cover_image_path else ''
+            self.written_assets = [os.path.join(output_folder_path, name) for name in audio_names.values()]
+            if cover_image_short:
+                self.written_assets.append(os.path.join(output_folder_path, cover_image_short))
+        else:
+            short_dtracks = [x.split('/')[-1] for x in flt_drum_tracks]
+            short_stracks = [x.split('/')[-1] for x in flt_song_tracks]
+            short_preview = self.song_preview_track.split('/')[-1] if self.song_preview_track else ''
+            cover_image_short = self.cover_image_path.split('/')[-1]
+            all_assets = flt_drum_tracks + flt_song_tracks
+            if self.cover_image_path:
+                all_assets.append(self.cover_image_path)
+            with self.timer.span('copy_assets'):
+                placed = sync_assets(all_assets, output_folder_path)
+            for src, dest, outcome in placed:
+                log.info("%s %s", outcome.capitalize(), dest)
+                self.timer.count('assets_' + outcome)
+            self.written_assets = [dest for src, dest, outcome in placed]
+
+        track_len = 0
         if track_to_load:
+            # measure what's shipped, packaging may have trimmed it
+            if self.optimize_audio:
+                track_to_load = os.path.join(output_folder_path, audio_names[track_to_load])
             try:
-                print("Track to load: " + track_to_load)
-                track_sf = sf.SoundFile(track_to_load)
-                track_len = len(track_sf) / track_sf.samplerate
-                print('audio track seconds = {}'.format(track_len))
-                length = track_len if last_event_time < track_len else last_event_time
+                log.debug("Track to load: %s", track_to_load)
+                with self.timer.span('audio_length'):
+                    import soundfile as sf # only needed when writing songs
+                    track_sf = sf.SoundFile(track_to_load)
+                    track_len = len(track_sf) / track_sf.samplerate
+                log.info('audio track seconds = %s', track_len)
             except Exception as e:
-                print("Error loading audio track: " + str(e))
-        print("last event time: " + str(last_event_time) + " length: " + str(length))
-
-        short_dtracks = [x.split('/')[-1] for x in flt_drum_tracks]
-        short_stracks = [x.split('/')[-1] for x in flt_song_tracks]
+                log.error("Error loading audio track: %s", e)
 
-        # check the length of one of the audio files vs the last event's timestamp in rlrr
-
-        # audio_file_short = audio_file.split('/')[-1]
-        cover_image_short = self.cover_image_path.split('/')[-1]
         self.audio_file_data['songTracks'] = short_stracks
         self.audio_file_data['drumTracks'] = short_dtracks
         self.audio_file_data['calibrationOffset'] = self.calibration_offset
-        self.audio_file_data['songPreview'] = self.song_preview_track.split('/')[-1] if self.song_preview_track else ''
+        self.audio_file_data['songPreview'] = short_preview
         self.out_dict["audioFileData"] = self.audio_file_data
 
         self.recording_metadata['title'] = self.song_name
@@ -437,24 +743,111 @@ class MidiConverter:
         self.recording_metadata['artist'] = self.artist_name
         self.recording_metadata['creator'] = self.author_name
         self.recording_metadata['complexity'] = self.song_complexity
-        if self.length > 0:
-            self.recording_metadata['length'] = length
         self.out_dict["recordingMetadata"] = self.recording_metadata
 
-        output_folder_path = os.path.join(self.output_rlrr_dir, self.song_name)
-        if not os.path.isdir(output_folder_path):
-            try:
-                os.makedirs(output_folder_path)
-            except Exception as e:
-                print("Error creating directory:", str(e))
-                return f"Failed to create output directory `{output_folder_path}`"
-
-        all_tracks = flt_drum_tracks + flt_song_tracks
-        for track in all_tracks:
-            copyfile(track, output_folder_path + '/' + track.split('/')[-1])
-        if self.cover_image_path:
-            copyfile(self.cover_image_path, output_folder_path + '/' + cover_image_short)
-
-        with open(os.path.join(self.output_rlrr_dir,self.song_name) + '/' + self.song_name + '_' + self.difficulty + '.rlrr', 'w') as outfile:
-            json.dump(self.out_dict, outfile, indent=4)
-            return "Conversion done!"
\ No newline at end of file
+        for difficulty, events in events_by_difficulty.items():
+            # compare against the time as it's written out in the file
+            last_event_time = float('%.4f'%events.last_time()) if len(events) else 0
+            length = track_len if last_event_time < track_len else last_event_time
+            log.info("last event time: %s length: %s", last_event_time, length)
+            if self.length > 0:
+                self.recording_metadata['length'] = length
+            self.out_dict["events"] = events
+            rlrr_path = os.path.join(self.output_rlrr_dir,self.song_name) + '/' + self.song_name + '_' + difficulty + '.rlrr'
+            with self.timer.span('write_rlrr'):
+                self.write_rlrr(rlrr_path)
+            self.written_files.append(rlrr_path)
+            self.timer.count('bytes_written', os.path.getsize(rlrr_path))
+
+        # audio the last conversion packaged that these .rlrr files don't use,
+        # like the .wav files left behind when switching to optimized audio
+        listed = short_stracks + short_dtracks + ([short_preview] if short_preview else [])
+        sources = flt_drum_tracks + flt_song_tracks + ([self.song_preview_track] if self.song_preview_track else [])
+        for path in remove_unlisted_files(output_folder_path, previous_audio, listed, sources):
+            log.info("Removed %s", path)
+        return CONVERSION_DONE
+
+    def write_rlrr(self, path):
+        """Writes out_dict to `path`, encoding the instruments, events and
+        bpmEvents arrays item by item. The events are already resolved, only
+        their dicts are built while writing."""
+        with RLRRWriter(path, compact=self.compact_output) as writer:
+            for key, value in self.out_dict.items():
+                if key in ('instruments', 'events', 'bpmEvents'):
+                    writer.write_array(key, value)
+                else:
+                    writer.write_field(key, value)
+
+# Toggle state for one CompiledMapping while walking a track. A note that
+# maps to a toggled drum is queued until every event at its tick has been
+# seen, since the toggle note may come after it; the drums it ends up hitting
+# depend on which toggle notes are held once the tick is over.
+class ToggleResolver:
+    def __init__(self, mapping):
+        self.notes = mapping.notes
+        self.toggles = mapping.toggles
+        self.slot_toggles = mapping.slot_toggles
+        self.deferred = mapping.deferred
+        self.active_toggles = 0 # bitmask of held toggle notes
+        self.queued = {} # (note, velocity, channel) -> event index, in arrival order
+        self.hit_events = array('q')
+        self.hit_slots = array('B')
+
+    def note_on(self, index, note, velocity, channel):
+        if note in self.toggles:
+            self.active_toggles |= 1 << note
+        if velocity > 0 and self.notes[note]:
+            if self.deferred[note]:
+                self.queued.setdefault((note, velocity, channel), index)
+            else:
+                for slot in range(len(self.notes[note])):
+                    self.hit_events.append(index)
+                    self.hit_slots.append(slot)
+
+    def note_off(self, note):
+        if note in self.toggles:
+            self.active_toggles &= ~(1 << note)
+
+    def end_tick(self):
+        active_toggles = self.active_toggles
+        for (note, velocity, channel), index in self.queued.items():
+            toggle_active = False
+            for slot, toggle_note in enumerate(self.slot_toggles[note]):
+                if toggle_note >= 0 and (active_toggles >> toggle_note) & 1:
+                    toggle_active = True
+                    self.hit_events.append(index)
+                    self.hit_slots.append(slot)
+            if not toggle_active:
+                for slot, toggle_note in enumerate(self.slot_toggles[note]):
+                    if toggle_note < 0:
+                        self.hit_events.append(index)
+                        self.hit_slots.append(slot)
+        self.queued.clear()
+
+    def hits(self):
+        return (np.frombuffer(self.hit_events, dtype=np.int64).copy(),
+                np.frombuffer(self.hit_slots, dtype=np.uint8).copy())
+
+def resolve_drum_hits(mappings, events):
+    """Walks a track's NOTE_EVENT_DTYPE events once and resolves the drum hits
+    of every CompiledMapping in `mappings`. Returns one (event indices, drum
+    slots) pair of arrays per mapping: hit i plays drum slots[i] of the note
+    at events[event_indices[i]]. The converter, event counts and the mapped
+    song display all go through here so they always agree."""
+    resolvers = [ToggleResolver(mapping) for mapping in mappings]
+    prev_tick = None
+    for index, (tick, event_type, channel, note, velocity) in enumerate(events.tolist()):
+        if tick != prev_tick:
+            for resolver in resolvers:
+                if resolver.queued:
+                    resolver.end_tick()
+            prev_tick = tick
+        if event_type == EVENT_NOTE_ON:
+            for resolver in resolvers:
+                resolver.note_on(index, note, velocity, channel)
+        if event_type == EVENT_NOTE_OFF or velocity == 0:
+            for resolver in resolvers:
+                resolver.note_off(note)
+    for resolver in resolvers:
+        resolver.end_tick()
+    return [resolver.hits() for resolver in resolvers]
@@ -0,0 +1,190 @@
+# Copyright (C) 2020 Emre Tanirgan <emre@paradiddleapp.com>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+# Loads MIDI map .yaml files into the per difficulty note and toggle maps
+# used by MidiConverter. Compiled maps are kept in memory and on disk, keyed
+# by a hash of the .yaml file, so a map is only parsed the first time it's
+# seen. midi_map_registry lists the maps shipped in midi_maps/.
+
+import os
+import threading
+from assets import file_digest
+from pdcache import cache_path, read_json, write_json
+from pdlog import get_logger
+
+log = get_logger(__name__)
+
+project_dir = os.path.dirname(os.path.realpath(__file__))
+MIDI_MAPS_DIR = os.path.join(project_dir, 'midi_maps')
+MIDI_MAP_EXTENSIONS = ('.yaml', '.yml')
+DIFFICULTY_NAMES = ('Easy', 'Medium', 'Hard', 'Expert')
+# Bump when the compiled format changes so old cache files are ignored
+MAP_CACHE_VERSION = 1
+
+def load_yaml(path):
+    # Imported here since compiled maps usually come from the cache
+    import yaml
+    # libyaml's parser is several times faster than the pure Python one
+    loader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+    with open(path, encoding='utf-8') as f:
+        return yaml.load(f, Loader=loader)
+
+def drum_instrument(drum_name):
+    return 'BP_%s_C' % drum_name
+
+def parse_notes(note_list):
+    '''MIDI notes in a map entry, where a string is a note or a range like "35-39"'''
+    notes = []
+    for note in note_list:
+        if type(note) != str:
+            notes.append(note)
+            continue
+        parts = note.split('-')
+        try:
+            if len(parts) > 1:
+                notes.extend(range(int(parts[0]), int(parts[1]) + 1))
+            else:
+                notes.append(int(note))
+        except ValueError:
+            log.warning("Not a valid MIDI note: %s", note)
+    return notes
+
+def add_notes(note_map, note_list, drum_name):
+    instrument = {'drum': drum_instrument(drum_name)}
+    for note in parse_notes(note_list):
+        note_map.setdefault(note, []).append(dict(instrument))
+
+def compile_midi_map(midi_yaml, difficulty_names=DIFFICULTY_NAMES):
+    '''Construct dicts for each difficulty that
+    are in the form [note] : [{'drum': drum_class}, ...]
+    plus the toggle notes of each difficulty. Difficulties with an empty map
+    are left out. Returns (note_maps, toggle_maps).'''
+    note_maps = []
+    toggle_maps = []
+    for diff in difficulty_names:
+        note_map = {}
+        toggle_map = {}
+        diff_map = midi_yaml[diff.lower()]
+        log.debug("%s map: %s", diff, diff_map)
+        if not diff_map:
+            continue
+        for drum in diff_map:
+            if type(diff_map[drum]) == list:
+                add_notes(note_map, diff_map[drum], drum)
+            else:
+                drum_map = diff_map[drum]
+                if 'toggle_note' in drum_map:
+                    toggle_map[drum_map['toggle_note']] = drum_instrument(drum)
+                if 'notes' in drum_map:
+                    add_notes(note_map, drum_map['notes'], drum)
+        note_maps.append(note_map)
+        toggle_maps.append(toggle_map)
+    return note_maps, toggle_maps
+
+# A compiled MIDI map file. note_maps and toggle_maps are shared between
+# everyone who loads the same file and must be treated as read-only.
+class MidiMap:
+    def __init__(self, path, digest, note_maps, toggle_maps):
+        self.path = path
+        self.name = os.path.basename(path)
+        self.digest = digest
+        self.note_maps = note_maps
+        self.toggle_maps = toggle_maps
+
+    def to_json(self, difficulty_names):
+        # JSON object keys are strings, so the maps are stored as pair lists
+        return {
+            'version': MAP_CACHE_VERSION,
+            'difficulties': list(difficulty_names),
+            'note_maps': [[[note, [i['drum'] for i in instruments]] for note, instruments in m.items()] for m in self.note_maps],
+            'toggle_maps': [list(m.items()) for m in self.toggle_maps]
+        }
+
+    @classmethod
+    def from_json(cls, path, digest, data):
+        note_maps = [{note: [{'drum': drum} for drum in drums] for note, drums in m} for m in data['note_maps']]
+        toggle_maps = [{note: drum for note, drum in m} for m in data['toggle_maps']]
+        return cls(path, digest, note_maps, toggle_maps)
+
+def _compiled_cache_path(digest):
+    return cache_path('midi_maps', digest + '.json')
+
+def _compile_file(path, difficulty_names):
+    digest = file_digest(path)[:16].hex()
+    cache_file = _compiled_cache_path(digest)
+    data = read_json(cache_file)
+    if data and data.get('version') == MAP_CACHE_VERSION and data.get('difficulties') == list(difficulty_names):
+        try:
+            return MidiMap.from_json(path, digest, data)
+        except (KeyError, TypeError, ValueError):
+            pass # damaged cache file, compile it again
+    note_maps, toggle_maps = compile_midi_map(load_yaml(path), difficulty_names)
+    midi_map = MidiMap(path, digest, note_maps, toggle_maps)
+    write_json(cache_file, midi_map.to_json(difficulty_names))
+    return midi_map
+
+_loaded = {} # (path, difficulty names) -> (mtime_ns, size, MidiMap)
+_loaded_lock = threading.Lock()
+
+def get_midi_map(path, difficulty_names=DIFFICULTY_NAMES):
+    '''Compiled MidiMap for the .yaml file at `path`'''
+    full_path = os.path.realpath(path)
+    st = os.stat(full_path)
+    key = (full_path, tuple(difficulty_names))
+    with _loaded_lock:
+        entry = _loaded.get(key)
+    if entry is not None and entry[0] == st.st_mtime_ns and entry[1] == st.st_size:
+        return entry[2]
+    midi_map = _compile_file(full_path, difficulty_names)
+    with _loaded_lock:
+        _loaded[key] = (st.st_mtime_ns, st.st_size, midi_map)
+    return midi_map
+
+# The MIDI maps in a folder, by file name. The folder is only listed when a
+# map is first asked for, and each map is only compiled when it's used.
+class MidiMapRegistry:
+    def __init__(self, directory=MIDI_MAPS_DIR):
+        self.directory = directory
+        self._paths = None
+
+    def _scan(self):
+        if self._paths is None:
+            paths = {}
+            if os.path.isdir(self.directory):
+                for name in sorted(os.listdir(self.directory)):
+                    if name.lower().endswith(MIDI_MAP_EXTENSIONS):
+                        paths[name] = os.path.join(self.directory, name)
+            self._paths = paths
+        return self._paths
+
+    def rescan(self):
+        self._paths = None
+
+    def names(self):
+        return list(self._scan())
+
+    def path(self, name):
+        return self._scan()[name]
+
+    def get(self, name, difficulty_names=DIFFICULTY_NAMES):
+        return get_midi_map(self.path(name), difficulty_names)
+
+    def __contains__(self, name):
+        return name in self._scan()
+
+    def __iter__(self):
+        return iter(self._scan())
+
+midi_map_registry = MidiMapRegistry()
@@ -1,41 +1,54 @@
-from packaging import version
 from PyQt5.QtGui import QIcon
-from PyQt5 import QtWidgets, uic
+from PyQt5 import QtWidgets
 from PyQt5.QtWidgets import QFileDialog, QMessageBox
-from midiconvert import MidiConverter
+from PyQt5.QtCore import pyqtSignal
+from midiconvert import MidiConverter, read_midi_notes
+from eventcounts import event_count_index
+from midimaps import midi_map_registry
+from drumkits import kit_library
+from updatecheck import newer_release, RELEASES_PAGE
 from midicompanion import MidiCompanion
-from song_display import SongDisplay_GUI
-import mido
-import yaml
+from pdlog import get_logger
+from uiloader import load_ui
 import json
 import os
-import requests
-import importlib
 import time
 import threading
-import sounddevice
-import soundfile
 
 project_dir = os.path.dirname(os.path.realpath(__file__))
+log = get_logger(__name__)
 
 # Paradiddle GUI
 class PD_GUI(QtWidgets.QMainWindow):
+    # Emitted from the worker thread with a built EventCountIndex
+    eventCountsReady = pyqtSignal(object)
+    # Emitted from the worker thread with the pending (file, mappings) it failed to count
+    eventCountsFailed = pyqtSignal(object)
+    # Emitted from the update check thread with (new version, current version)
+    updateAvailable = pyqtSignal(str, str)
+
     def __init__(self):
         super(PD_GUI, self).__init__()
 
-        check_for_updates()
-
         self.play_obj = None
         self.mc = MidiConverter()
-        self.sd_gui = SongDisplay_GUI(self.mc)
+        self.sd_gui = None # created when the song display is first opened
         self.midicompanion = MidiCompanion()
         self.midicompanion.midi_msg_cb = self._midi_msg_callback
         self.midicompanion.connection_cb = self._connection_callback
+
+        # Converted event counts for every track and difficulty of the current file
+        self.event_counts = None
+        self.event_counts_pending = None
+        self.eventCountsReady.connect(self._event_counts_ready)
+        self.eventCountsFailed.connect(self._event_counts_failed)
+        self.updateAvailable.connect(self._update_available)
+        threading.Thread(target=self._check_for_updates, daemon=True).start()
         # Sets the window icon
         self.setWindowIcon(QIcon(os.path.join(project_dir, "assets", "favicon.ico")))
 
         # Loads the .ui file
-        uic.loadUi(os.path.join(project_dir, "ui_layouts", "pd_gui_layout.ui"), self)
+        load_ui("pd_gui_layout", self)
         # self.songCreatorWidget.hide()
 
         # Load IP address from save json file
@@ -103,25 +116,63 @@ class PD_GUI(QtWidgets.QMainWindow):
         self.show()
 
     def count_track_notes(self):
-        mid = mido.MidiFile(self.mc.midi_file)
-        note_count = 0
-        for msg in mid.tracks[self.mc.convert_track_index]:
-            if msg.type == 'note_on':
-                note_count+=1
-        return note_count
+        return read_midi_notes(self.mc.midi_file).track_profiles[self.mc.convert_track_index].note_ons
 
     def count_all_notes(self):
-        mid = mido.MidiFile(self.mc.midi_file)
-        note_count = 0
-        for i, track in enumerate(mid.tracks):
-            for msg in track:
-                if msg.type == 'note_on':
-                    note_count+=1
-        return note_count
+        return read_midi_notes(self.mc.midi_file).count_note_ons()
         
     def count_converted_events(self):
         """Count how many events will be in the converted RLRR file"""
-        return self.mc.count_converted_events()  
+        return self.mc.count_converted_events()
+
+    def _current_mappings(self):
+        return [self.mc.compiled_mapping(d) for d in self.mc.difficulty_names]
+
+    def _update_converted_events(self):
+        """Shows the converted event count for the current track and difficulty.
+        Counts for the whole file are built on a background thread the first
+        time, after that switching tracks or difficulties is just a lookup."""
+        if not self.mc.midi_file or not self.mc.note_to_drum_maps:
+            self.convertedEventsNum.setText("0")
+            return
+        mappings = self._current_mappings()
+        if self.event_counts is not None and self.event_counts.matches(self.mc.midi_file, mappings):
+            self.convertedEventsNum.setText(str(self.event_counts.get(self.mc.convert_track_index, self.mc.difficulty)))
+            return
+
+        self.convertedEventsNum.setText("...")
+        pending = (self.mc.midi_file, mappings)
+        if self.event_counts_pending is not None and self.event_counts_pending[0] == pending[0] \
+                and all(a is b for a, b in zip(self.event_counts_pending[1], mappings)):
+            return # already being counted
+        self.event_counts_pending = pending
+        thread = threading.Thread(target=self._build_event_counts, args=(pending, list(self.mc.difficulty_names)), daemon=True)
+        thread.start()
+
+    def _build_event_counts(self, pending, difficulty_names):
+        # Runs on a worker thread, the result is handed back through a signal
+        midi_file, mappings = pending
+        try:
+            self.eventCountsReady.emit(event_count_index(midi_file, difficulty_names, mappings))
+        except Exception as e:
+            log.error("Error counting converted events: %s", e)
+            self.eventCountsFailed.emit(pending)
+
+    def _event_counts_failed(self, pending):
+        # Only the latest request matters, an older one failing doesn't change what's shown
+        if pending is not self.event_counts_pending:
+            return
+        self.event_counts_pending = None # selecting the file or map again retries
+        self.convertedEventsNum.setText("Error")
+
+    def _event_counts_ready(self, event_counts):
+        # Ignore counts for a file, map or kit that's no longer selected
+        if not self.mc.midi_file or not self.mc.note_to_drum_maps:
+            return
+        if event_counts.matches(self.mc.midi_file, self._current_mappings()):
+            self.event_counts = event_counts
+            self.event_counts_pending = None
+            self._update_converted_events()
 
     def closeEvent(self, event):
         if self.midicompanion.connected_to_host:
@@ -142,15 +193,13 @@ class PD_GUI(QtWidgets.QMainWindow):
         # Sets the last open folder to drum_sets directory
         self.lastOpenFolder = os.path.dirname(default_set)
 
-        midi_yaml = os.path.join(project_dir, 'midi_maps', 'pdtracks_mapping.yaml')
-        with open(midi_yaml) as file:
-            midi_yaml_dict = yaml.load(file, Loader=yaml.FullLoader)
-            self.mc.create_midi_map(midi_yaml_dict)
-            self.midiMappingLineEdit.setText(os.path.basename(midi_yaml))
+        midi_map = self.mc.load_midi_map(midi_map_registry.path('pdtracks_mapping.yaml'))
+        self.midiMappingLineEdit.setText(midi_map.name)
 
     # LOCAL GUI FUNCTIONS
     def _track_song_player(self, audio_path):
         # self.play_obj.play()
+        import sounddevice, soundfile
         data, fs = soundfile.read(audio_path, dtype="float32")
         sounddevice.play(data[:int(20*fs)], fs)
 
@@ -159,6 +208,7 @@ class PD_GUI(QtWidgets.QMainWindow):
         objName = self.sender().objectName()
         
         if self.play_obj == objName:
+            import sounddevice
             sounddevice.stop()
             self.play_obj = None
             return        
@@ -184,8 +234,14 @@ class PD_GUI(QtWidgets.QMainWindow):
             QMessageBox.warning(self, "Warning", "Please select a MIDI file first!")
             return
             
+        if self.sd_gui is None:
+            from song_display import SongDisplay_GUI
+            self.sd_gui = SongDisplay_GUI(self.mc)
+
         # Initialize song display with current MIDI file
         self.sd_gui.change_midi(self.mc.midi_file)
+        if self.artistNameLineEdit.text():
+            self.sd_gui.update_artist_name(self.artistNameLineEdit.text())
         
         # Load all audio tracks from the MIDI converter
         self.sd_gui.load_audio_tracks_from_converter()
@@ -194,7 +250,7 @@ class PD_GUI(QtWidgets.QMainWindow):
 
     def _difficulty_text_changed(self, text):
         self.mc.difficulty = text
-        self.convertedEventsNum.setText(str(self.count_converted_events()))
+        self._update_converted_events()
 
     def _complexity_text_changed(self, text):
         self.mc.song_complexity = int(text)
@@ -209,78 +265,90 @@ class PD_GUI(QtWidgets.QMainWindow):
         (default_track, default_index) = self.mc.get_default_midi_track()
         self.lastOpenFolder = self.mc.midi_file.rsplit('/', 1)[0]
         self.midiFileLineEdit.setText(self.mc.midi_file.split('/')[-1])
-        for i in range(len(self.mc.midi_track_names)):
-            item_name = 'Track ' + str(i) + ': ' + self.mc.midi_track_names[i]
+        profiles = read_midi_notes(self.mc.midi_file).track_profiles
+        for i, profile in enumerate(profiles):
+            item_name = 'Track ' + str(i) + ': ' + profile.name + ' (' + str(profile.note_ons) + ' notes)'
             if i >= (self.midiTrackComboBox.count()):
                 self.midiTrackComboBox.addItem(item_name)
             else:
                 self.midiTrackComboBox.setItemText(i,item_name)
         self.mc.convert_track_index = default_index
-        print("Convert track index: " + str(self.mc.convert_track_index))
+        log.info("Convert track index: %d", self.mc.convert_track_index)
         self.midiTrackComboBox.setCurrentIndex(self.mc.convert_track_index)
 
         self.midiNotesNum.setText(str(self.count_all_notes()))
         self.trackNotesNum.setText(str(self.count_track_notes()))
-        self.convertedEventsNum.setText(str(self.count_converted_events()))
+        self._update_converted_events()
         
         # Update song display if it's open
-        if hasattr(self, 'sd_gui') and self.sd_gui.isVisible():
+        if self.sd_gui is not None and self.sd_gui.isVisible():
             self.sd_gui.change_midi(self.mc.midi_file)
 
     def _select_midi_map_clicked(self):
         midi_yaml = QFileDialog.getOpenFileName(self, ("Select Midi File"), self.lastOpenFolder, ("Midi Map (*.yaml *yml)"))[0]
         if not midi_yaml:  # User cancelled the dialog
             return
-        with open(midi_yaml) as file:
-            midi_yaml_dict = yaml.load(file, Loader=yaml.FullLoader)
-            self.mc.create_midi_map(midi_yaml_dict)
-            self.midiMappingLineEdit.setText(midi_yaml.split('/')[-1])
+        self.mc.load_midi_map(midi_yaml)
+        self.midiMappingLineEdit.setText(midi_yaml.split('/')[-1])
+        self._check_kit_compatibility()
         
-        # Update song display with new mapping
-        self.sd_gui.change_midi_map(midi_yaml)
+        # Update song display with new mapping, a hidden one catches up when it's opened
+        if self.sd_gui is not None and self.sd_gui.isVisible():
+            self.sd_gui.change_midi_map(midi_yaml)
         
         self.midiNotesNum.setText(str(self.count_all_notes()))
         self.trackNotesNum.setText(str(self.count_track_notes()))
-        self.convertedEventsNum.setText(str(self.count_converted_events()))
+        self._update_converted_events()
 
     def _set_output_clicked(self):
         output_folder = QFileDialog.getExistingDirectory(self, ("Select Folder"), self.lastOpenFolder)
-        print(output_folder)
+        log.info("Output folder: %s", output_folder)
         self.mc.output_rlrr_dir = output_folder
 
     def _midi_track_index_changed(self, index):
         self.mc.convert_track_index = index
         self.trackNotesNum.setText(str(self.count_track_notes()))
-        self.convertedEventsNum.setText(str(self.count_converted_events()))
+        self._update_converted_events()
 
     def _select_drum_set_clicked(self):
         self.mc.drum_set_file = QFileDialog.getOpenFileName(self, ("Select Drum Set File"), self.lastOpenFolder, ("PD Drum Set Files (*.rlrr)"))[0]
-        print(self.mc.drum_set_file)
+        log.info("Drum set: %s", self.mc.drum_set_file)
         self.mc.analyze_drum_set(self.mc.drum_set_file)
         self.lastOpenFolder = self.mc.drum_set_file.rsplit('/', 1)[0]
         self.drumSetLineEdit.setText(self.mc.drum_set_file.split('/')[-1])
+        self._check_kit_compatibility()
+        self._update_converted_events()
+
+    def _check_kit_compatibility(self):
+        # Uses the kit index, so this doesn't re-read the kit file
+        missing = self.mc.missing_kit_classes()
+        if missing:
+            log.warning("The drum kit has no %s, the MIDI map's notes for them will use default drums", ', '.join(sorted(missing)))
+            compatible = kit_library.compatible_kits(self.mc.note_to_drum_maps, self.mc.toggle_to_drum_maps)
+            if compatible:
+                log.warning("Kits in %s with every drum the map uses: %s", kit_library.directory, ', '.join(kit.name for kit in compatible))
 
     def _select_audio_file_clicked(self):
         sender_name = self.sender().objectName()
         is_drum_track = "Drum" in sender_name
         track_index = int(sender_name.split('_')[-1]) - 1
         audio_file = QFileDialog.getOpenFileName(self, ("Select Audio File"), self.lastOpenFolder, ("Audio Files (*.mp3 *.wav *.ogg)"))[0]
-        print(audio_file)
+        log.info("Audio file: %s", audio_file)
         if is_drum_track:
             self.mc.drum_tracks[track_index] = audio_file
-            print(self.mc.drum_tracks)
+            log.debug("Drum tracks: %s", self.mc.drum_tracks)
         else:
             self.mc.song_tracks[track_index] = audio_file
-            print(self.mc.song_tracks)
+            log.debug("Song tracks: %s", self.mc.song_tracks)
 
         self.lastOpenFolder = audio_file.rsplit('/', 1)[0]
         line_edit = getattr(self, ('drum' if is_drum_track else 'song') + 'TrackLineEdit_' + str(track_index+1))
-        print(line_edit)
+        log.debug("Line edit: %s", line_edit)
         line_edit.setText(audio_file.split('/')[-1])
 
     def _select_cover_image_clicked(self):
         self.mc.cover_image_path = QFileDialog.getOpenFileName(self, ("Select Cover Image"), self.lastOpenFolder, ("Image Files (*.png *.jpg)"))[0]
-        print(self.mc.cover_image_path)
+        log.info("Cover image: %s", self.mc.cover_image_path)
         self.lastOpenFolder = self.mc.cover_image_path.rsplit('/', 1)[0]
         self.coverImageLineEdit.setText(self.mc.cover_image_path.split('/')[-1])
 
@@ -288,7 +356,7 @@ class PD_GUI(QtWidgets.QMainWindow):
         audio_file = QFileDialog.getOpenFileName(self, ("Select Song Preview Track"), self.lastOpenFolder, ("Audio Files (*.mp3 *.wav *.ogg)"))[0]
         if audio_file:
             self.mc.song_preview_track = audio_file
-            print(f"Song preview track: {self.mc.song_preview_track}")
+            log.info("Song preview track: %s", self.mc.song_preview_track)
             self.lastOpenFolder = audio_file.rsplit('/', 1)[0]
             self.songPreviewLineEdit.setText(audio_file.split('/')[-1])
 
@@ -336,7 +404,7 @@ class PD_GUI(QtWidgets.QMainWindow):
                 self.midiConnectionStatus.setText("Connection failed")
 
     def _connection_callback(self, connected):
-        print("Connection state changed: " + str(connected))
+        log.info("Connection state changed: %s", connected)
         """Called when connection state changes"""
         if connected:
             # Successfully connected
@@ -375,7 +443,7 @@ class PD_GUI(QtWidgets.QMainWindow):
         self.midicompanion.midi_input_index = index
 
     def _midi_output_index_changed(self, index):
-        print("index changed to " + str(index))
+        log.debug("MIDI output index changed to %d", index)
         self.midicompanion.midi_output_index = index
 
     def _midi_msg_callback(self, msg):
@@ -398,28 +466,29 @@ class PD_GUI(QtWidgets.QMainWindow):
     #     calibration_offset = self.calibrationSpinBox.value()
 
     def _artist_name_changed(self):
-        self.sd_gui.update_artist_name(self.artistNameLineEdit.text())
-
-def check_for_updates():
-    curVersion = version.parse(importlib.metadata.version("ParadiddleUtilities"))
-    try:
-        newVersion = version.parse(requests.get("https://api.github.com/repos/emretanirgan/ParadiddleUtilities/releases/latest").json()["tag_name"])
-    except requests.exceptions.RequestException as e:
-        print(f"Network error checking updates, skipping check: ({e})")
-        return
-
-    if newVersion > curVersion:
-        widget = QMessageBox()
+        if self.sd_gui is not None:
+            self.sd_gui.update_artist_name(self.artistNameLineEdit.text())
+
+    def _check_for_updates(self):
+        # Runs on a worker thread so a slow or missing network can't hold up the window
+        try:
+            release = newer_release()
+        except Exception as e:
+            log.warning("Update check failed: %s", e)
+            return
+        if release:
+            self.updateAvailable.emit(*release)
+
+    def _update_available(self, new_version, cur_version):
+        widget = QMessageBox(self)
         widget.setIcon(QMessageBox.Question)
         widget.setWindowTitle("New Update Available")
-        widget.setText(f"A new update is available. Would you like to download?\n- New Version: {newVersion}\n- Current Version: {curVersion})")
+        widget.setText(f"A new update is available. Would you like to download?\n- New Version: {new_version}\n- Current Version: {cur_version})")
         widget.setStandardButtons(QMessageBox.Yes | QMessageBox.No)
 
         ret = widget.exec_()
 
         if ret == widget.Yes:
             import webbrowser
-            webbrowser.open("https://www.github.com/emretanirgan/ParadiddleUtilities/releases/latest")
-            exit(0)
-    
-    return
\ No newline at end of file
+            webbrowser.open(RELEASES_PAGE)
+            QtWidgets.QApplication.quit()
@@ -0,0 +1,69 @@
+# Copyright (C) 2020 Emre Tanirgan <emre@paradiddleapp.com>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+# Where PDUtilities keeps files it can rebuild at any time (compiled MIDI
+# maps, ...). Defaults to the user's cache folder, set PDU_CACHE_DIR to use
+# another one.
+
+import json
+import os
+import sys
+
+CACHE_ENV = 'PDU_CACHE_DIR'
+APP_NAME = 'ParadiddleUtilities'
+
+def cache_root():
+    root = os.environ.get(CACHE_ENV)
+    if root:
+        return root
+    if sys.platform == 'win32':
+        base = os.environ.get('LOCALAPPDATA') or os.path.expanduser('~')
+    elif sys.platform == 'darwin':
+        base = os.path.expanduser('~/Library/Caches')
+    else:
+        base = os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache')
+    return os.path.join(base, APP_NAME)
+
+def cache_path(*parts):
+    '''Path of a file in the cache folder, its parent folders are created'''
+    path = os.path.join(cache_root(), *parts)
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    except OSError:
+        pass # read-only home folder, writing the cache file will fail quietly
+    return path
+
+def read_json(path):
+    '''Parsed contents of a cache file, None if it's missing or unreadable'''
+    try:
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def write_json(path, data):
+    '''Writes a cache file atomically. Failing to write a cache is not an error.'''
+    tmp_path = '%s.%d.tmp' % (path, os.getpid())
+    try:
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, separators=(',', ':'))
+        os.replace(tmp_path, path)
+        return True
+    except OSError:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        return False
@@ -0,0 +1,113 @@
+# Copyright (C) 2020 Emre Tanirgan <emre@paradiddleapp.com>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+# Logging for all of PDUtilities. Every module gets its own logger with
+#   log = get_logger(__name__)
+# and logs with %-style arguments (log.debug("note %d", note)), so messages
+# are only formatted if something is going to show them.
+#
+# Info and above goes to stdout like the old print() calls did. Debug output
+# is off by default, which makes a disabled log.debug() call almost free. Set
+# PDU_LOG_LEVEL=DEBUG to print it, or PDU_TRACE=1 to keep the most recent
+# debug records in memory (ring_buffer) without the cost of printing them.
+
+from collections import deque
+import logging
+import os
+import sys
+
+ROOT_LOGGER = 'PDUtilities'
+LEVEL_ENV = 'PDU_LOG_LEVEL'
+TRACE_ENV = 'PDU_TRACE'
+RING_BUFFER_SIZE = 10000
+
+# Keeps the last `capacity` records as they are, they're only formatted when
+# someone asks for them
+class RingBufferHandler(logging.Handler):
+    def __init__(self, capacity=RING_BUFFER_SIZE):
+        super().__init__(logging.DEBUG)
+        self.records = deque(maxlen=capacity)
+        self.setFormatter(logging.Formatter('%(asctime)s %(threadName)s %(name)s %(levelname)s: %(message)s'))
+
+    def handle(self, record):
+        # deque.append is atomic, so there's no need for the handler lock
+        if self.filter(record):
+            self.records.append(record)
+        return True
+
+    def emit(self, record):
+        self.records.append(record)
+
+    def lines(self, count=None):
+        records = list(self.records)
+        if count is not None:
+            records = records[-count:]
+        return [self.format(record) for record in records]
+
+    def dump(self, path):
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write('\n'.join(self.lines()) + '\n')
+
+    def clear(self):
+        self.records.clear()
+
+# Writes to whatever sys.stdout is when the record is emitted, so output can
+# still be captured with contextlib.redirect_stdout
+class _StdoutHandler(logging.StreamHandler):
+    def __init__(self):
+        super().__init__(sys.stdout)
+
+    @property
+    def stream(self):
+        return sys.stdout
+
+    @stream.setter
+    def stream(self, value):
+        pass
+
+ring_buffer = RingBufferHandler()
+_console = _StdoutHandler()
+_console.setFormatter(logging.Formatter('%(message)s'))
+
+def get_logger(name):
+    return logging.getLogger(ROOT_LOGGER + '.' + name.rsplit('.', 1)[-1])
+
+def _parse_level(level):
+    if isinstance(level, str):
+        level = logging.getLevelName(level.upper())
+    return level if isinstance(level, int) else logging.INFO
+
+def setup_logging(level=None, trace=None):
+    '''Prints records at `level` and above (default: $PDU_LOG_LEVEL or INFO).
+    With trace (default: $PDU_TRACE) debug records also go to ring_buffer.'''
+    level = _parse_level(level if level is not None else os.environ.get(LEVEL_ENV, logging.INFO))
+    if trace is None:
+        trace = os.environ.get(TRACE_ENV, '') not in ('', '0')
+
+    root = logging.getLogger(ROOT_LOGGER)
+    root.propagate = False
+    _console.setLevel(level)
+    if _console not in root.handlers:
+        root.addHandler(_console)
+    if trace:
+        if ring_buffer not in root.handlers:
+            root.addHandler(ring_buffer)
+        root.setLevel(min(level, logging.DEBUG))
+    else:
+        if ring_buffer in root.handlers:
+            root.removeHandler(ring_buffer)
+        root.setLevel(level)
+
+setup_logging()
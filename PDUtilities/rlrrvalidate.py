@@ -0,0 +1,630 @@
+# Copyright (C) 2020 Emre Tanirgan <emre@paradiddleapp.com>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+# Checks .rlrr files against docs/rlrrschema.json, for example before
+# publishing a batch of converted songs:
+#   python -m PDUtilities validate rlrr_files/
+# The schema is compiled once per process into plain Python checks for each
+# definition (DrumEvent, BPMEvent, Instrument, AudioFileData, ...). Large
+# arrays like events are read from the file one item at a time instead of
+# loading the whole file, and batches of files are checked on a process pool.
+# Only the parts of JSON Schema the .rlrr schema uses are supported.
+
+from concurrent.futures import ProcessPoolExecutor
+import argparse
+import json
+import os
+import re
+import sys
+import time
+
+project_dir = os.path.dirname(os.path.realpath(__file__))
+if getattr(sys, 'frozen', False):
+    # PDUtil.spec bundles the schema as docs/rlrrschema.json in the app folder
+    SCHEMA_PATH = os.path.join(sys._MEIPASS, 'docs', 'rlrrschema.json')
+else:
+    SCHEMA_PATH = os.path.join(os.path.dirname(project_dir), 'docs', 'rlrrschema.json')
+DEFAULT_MAX_ERRORS = 10
+READ_CHUNK_SIZE = 1024 * 1024
+# Arrays that are checked item by item as they're read
+STREAMED_ARRAYS = ('instruments', 'events', 'bpmEvents')
+# Written by MidiConverter next to events, but not described by the schema yet
+EXTRA_ARRAYS = {'bpmEvents': 'BPMEvent'}
+
+_TYPE_CHECKS = {
+    'object': lambda v: type(v) is dict,
+    'array': lambda v: type(v) is list,
+    'string': lambda v: type(v) is str,
+    'number': lambda v: type(v) is int or type(v) is float,
+    # JSON Schema counts 1.0 as an integer
+    'integer': lambda v: type(v) is int or (type(v) is float and v.is_integer()),
+    'boolean': lambda v: type(v) is bool,
+    'null': lambda v: v is None
+}
+
+# 'integer' only lists int, floats like 1.0 go through the full check
+_SIMPLE_TYPES = {
+    'object': (dict,),
+    'array': (list,),
+    'string': (str,),
+    'number': (int, float),
+    'integer': (int,),
+    'boolean': (bool,),
+    'null': (type(None),)
+}
+
+def _json_type(value):
+    if value is None:
+        return 'null'
+    return {bool: 'boolean', int: 'integer', float: 'number', str: 'string', list: 'array', dict: 'object'}.get(type(value), type(value).__name__)
+
+def _join(path, key):
+    if type(key) is int:
+        return '%s[%d]' % (path, key)
+    return path + '.' + key if path else key
+
+# One compiled (sub)schema. valid(value) is the fast yes/no check used for
+# every value, explain(value, path, errors) is only run on values that
+# failed it and adds (path, message) pairs to errors.
+class _Node:
+    def __init__(self, title=None):
+        self.title = title
+        self.valid = lambda value: True
+        self.explain = lambda value, path, errors: None
+        # kept for the streaming reader, which checks these parts itself
+        self.properties = {}
+        self.required = ()
+        self.allowed = None
+        self.items = None
+        self.min_items = None
+        self.max_items = None
+        # Python types that are always valid, for schemas that are just a type
+        self.simple_types = None
+
+class SchemaCompiler:
+    def __init__(self, schema):
+        self.schema = schema
+        self.definitions = {}
+        self._compiling = set()
+
+    def definition(self, name):
+        if name not in self.definitions:
+            node = _Node(name)
+            self.definitions[name] = node # set before compiling in case it refers to itself
+            self._compiling.add(name)
+            self._compile_into(node, self.schema['definitions'][name])
+            self._compiling.discard(name)
+        return self.definitions[name]
+
+    def compile(self, schema=None):
+        schema = self.schema if schema is None else schema
+        node = _Node(schema.get('title'))
+        self._compile_into(node, schema)
+        return node
+
+    def _compile_into(self, node, schema):
+        if '$ref' in schema:
+            ref = schema['$ref']
+            if not ref.startswith('#/definitions/'):
+                raise ValueError("Unsupported $ref " + ref)
+            name = ref[len('#/definitions/'):]
+            target = self.definition(name)
+            if name in self._compiling:
+                # a definition that refers to itself isn't finished yet
+                node.valid = lambda value: target.valid(value)
+                node.explain = lambda value, path, errors: target.explain(value, path, errors)
+            else:
+                node.__dict__.update(target.__dict__)
+            node.title = node.title or target.title
+            return
+        if 'oneOf' in schema:
+            self._compile_one_of(node, [self.compile(s) for s in schema['oneOf']])
+            return
+
+        checks = [] # (valid, explain) pairs that all have to pass
+        types = schema.get('type')
+        if isinstance(types, str):
+            types = [types]
+        if types is not None:
+            checks.append(self._type_check(types))
+        constraints = set(schema) - {'type', 'title', 'description'}
+        if types is not None and not constraints:
+            node.simple_types = frozenset(t for name in types for t in _SIMPLE_TYPES[name])
+        if 'enum' in schema:
+            options = schema['enum']
+            checks.append((lambda v: v in options,
+                           lambda v, path, errors: errors.append((path, 'expected one of %s' % options))))
+        if 'minimum' in schema or 'maximum' in schema:
+            checks.append(self._range_check(schema.get('minimum'), schema.get('maximum')))
+        valids = [check[0] for check in checks]
+        if 'properties' in schema or 'required' in schema or schema.get('additionalProperties') is False:
+            if types == ['object']:
+                # the object check rejects everything that isn't a dict itself
+                checks.append(self._object_check(node, schema, True))
+                valids = [checks[-1][0]]
+            else:
+                checks.append(self._object_check(node, schema, False))
+                valids.append(checks[-1][0])
+        if 'items' in schema or 'minItems' in schema or 'maxItems' in schema:
+            checks.append(self._array_check(node, schema))
+            valids.append(checks[-1][0])
+
+        if len(valids) == 1:
+            node.valid = valids[0]
+        elif len(valids) == 2:
+            first, second = valids
+            node.valid = lambda value: first(value) and second(value)
+        elif valids:
+            node.valid = lambda value: all(valid(value) for valid in valids)
+
+        def explain(value, path, errors):
+            for valid, check_explain in checks:
+                if not valid(value):
+                    check_explain(value, path, errors)
+                    return # later checks assume the earlier ones passed
+        node.explain = explain
+
+    def _type_check(self, types):
+        type_checks = tuple(_TYPE_CHECKS[t] for t in types)
+        if len(type_checks) == 1:
+            valid = type_checks[0]
+        else:
+            valid = lambda v: any(check(v) for check in type_checks)
+        expected = ' or '.join(types)
+        def explain(value, path, errors):
+            errors.append((path, 'expected %s, got %s' % (expected, _json_type(value))))
+        return valid, explain
+
+    def _range_check(self, minimum, maximum):
+        def valid(value):
+            if type(value) not in (int, float):
+                return True
+            return (minimum is None or value >= minimum) and (maximum is None or value <= maximum)
+        def explain(value, path, errors):
+            if minimum is not None and value < minimum:
+                errors.append((path, '%s is less than the minimum of %s' % (value, minimum)))
+            else:
+                errors.append((path, '%s is more than the maximum of %s' % (value, maximum)))
+        return valid, explain
+
+    def _object_check(self, node, schema, require_dict):
+        node.properties = {key: self.compile(s) for key, s in schema.get('properties', {}).items()}
+        node.required = tuple(schema.get('required', ()))
+        node.allowed = frozenset(node.properties) if schema.get('additionalProperties') is False else None
+        required = frozenset(node.required)
+        allowed = node.allowed
+        property_valid = {key: child.valid for key, child in node.properties.items()}
+        simple_types = {key: child.simple_types for key, child in node.properties.items() if child.simple_types}
+
+        def valid(value):
+            if type(value) is not dict:
+                return not require_dict
+            keys = value.keys()
+            if not required <= keys or (allowed is not None and not keys <= allowed):
+                return False
+            for key, item in value.items():
+                types = simple_types.get(key)
+                if types is not None and type(item) in types:
+                    continue
+                check = property_valid.get(key)
+                if check is not None and not check(item):
+                    return False
+            return True
+
+        if allowed is not None and required == allowed and len(simple_types) == len(allowed):
+            # The usual shape of the event definitions: a fixed set of keys
+            # with plain types, checked without looking anything up
+            fields = tuple((key, simple_types[key], property_valid[key]) for key in node.required)
+            def valid(value):
+                if type(value) is not dict:
+                    return not require_dict
+                if value.keys() != allowed:
+                    return False
+                for key, types, check in fields:
+                    item = value[key]
+                    if type(item) not in types and not check(item):
+                        return False
+                return True
+
+        def explain(value, path, errors):
+            for key in node.required:
+                if key not in value:
+                    errors.append((path, "missing property '%s'" % key))
+            for key, item in value.items():
+                child = node.properties.get(key)
+                if child is None:
+                    if allowed is not None:
+                        errors.append((path, "unexpected property '%s'" % key))
+                elif not child.valid(item):
+                    child.explain(item, _join(path, key), errors)
+        return valid, explain
+
+    def _array_check(self, node, schema):
+        node.items = self.compile(schema['items']) if 'items' in schema else None
+        node.min_items = schema.get('minItems')
+        node.max_items = schema.get('maxItems')
+        items_valid = node.items.valid if node.items else None
+
+        def valid(value):
+            if type(value) is not list:
+                return True
+            if node.min_items is not None and len(value) < node.min_items:
+                return False
+            if node.max_items is not None and len(value) > node.max_items:
+                return False
+            return items_valid is None or all(items_valid(item) for item in value)
+
+        def explain(value, path, errors):
+            _explain_length(node, len(value), path, errors)
+            if node.items:
+                for i, item in enumerate(value):
+                    if not items_valid(item):
+                        node.items.explain(item, _join(path, i), errors)
+        return valid, explain
+
+    def _compile_one_of(self, node, options):
+        option_valids = tuple(option.valid for option in options)
+        names = ', '.join(option.title or 'option %d' % i for i, option in enumerate(options))
+
+        def valid(value):
+            matches = 0
+            for option_valid in option_valids:
+                if option_valid(value):
+                    matches += 1
+            return matches == 1
+
+        if _exclusive(options):
+            # no value can match two options, so the first match is enough
+            def valid(value):
+                for option_valid in option_valids:
+                    if option_valid(value):
+                        return True
+                return False
+
+        def explain(value, path, errors):
+            if any(option_valid(value) for option_valid in option_valids):
+                errors.append((path, 'matches more than one of %s' % names))
+                return
+            # report the option the value came closest to
+            best = None
+            for option in options:
+                option_errors = []
+                option.explain(value, path, option_errors)
+                if best is None or len(option_errors) < len(best[1]):
+                    best = (option, option_errors)
+            errors.append((path, 'not a valid %s' % names.replace(', ', ' or ')))
+            errors.extend(best[1])
+        node.valid = valid
+        node.explain = explain
+
+def _exclusive(options):
+    '''True if the options are objects that can never all match the same value:
+    for each pair, one requires a property the other doesn't allow.'''
+    for i, a in enumerate(options):
+        for b in options[i + 1:]:
+            a_excludes_b = b.allowed is not None and not set(a.required) <= b.allowed
+            b_excludes_a = a.allowed is not None and not set(b.required) <= a.allowed
+            if not (a_excludes_b or b_excludes_a):
+                return False
+    return True
+
+def _explain_length(node, length, path, errors):
+    if node.min_items is not None and length < node.min_items:
+        errors.append((path, 'expected at least %d items, got %d' % (node.min_items, length)))
+    if node.max_items is not None and length > node.max_items:
+        errors.append((path, 'expected at most %d items, got %d' % (node.max_items, length)))
+
+_WHITESPACE = re.compile(r'[ \t\n\r]*')
+_COMMA = re.compile(r'[ \t\n\r]*,')
+_SCALAR_END = re.compile(r'[ \t\n\r,\]}]')
+_decoder = json.JSONDecoder()
+
+# Reads a JSON document a value at a time, so the items of a big array can
+# be handled as they're read.
+class JsonStream:
+    def __init__(self, f, chunk_size=READ_CHUNK_SIZE):
+        self.f = f
+        self.chunk_size = chunk_size
+        self.buf = ''
+        self.pos = 0
+        self.offset = 0 # characters dropped from the front of buf
+        self.eof = False
+
+    def error(self, message, pos=None):
+        return ValueError('%s at character %d' % (message, self.offset + (self.pos if pos is None else pos)))
+
+    def _read_more(self):
+        if self.eof:
+            return False
+        data = self.f.read(self.chunk_size)
+        if not data:
+            self.eof = True
+            return False
+        if self.pos > self.chunk_size:
+            self.offset += self.pos
+            self.buf = self.buf[self.pos:]
+            self.pos = 0
+        self.buf += data
+        return True
+
+    def peek(self):
+        '''Next character that isn't whitespace, '' at the end of the file'''
+        while True:
+            self.pos = _WHITESPACE.match(self.buf, self.pos).end()
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self._read_more():
+                return ''
+
+    def expect(self, char):
+        if self.peek() != char:
+            raise self.error('Expecting %r' % char)
+        self.pos += 1
+
+    def value(self):
+        if self.peek() not in '"{[':
+            # a number like 1.5e3 split between chunks would decode as 1, so
+            # read on until whatever follows the number or literal
+            while not _SCALAR_END.search(self.buf, self.pos) and self._read_more():
+                pass
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self.buf, self.pos)
+                # a number at the end of buf might continue in the next chunk
+                if end < len(self.buf) or self.eof:
+                    self.pos = end
+                    return value
+            except json.JSONDecodeError as e:
+                if self.eof:
+                    raise self.error(e.msg, e.pos)
+            self._read_more()
+
+    def array_items(self):
+        self.expect('[')
+        if self.peek() == ']':
+            self.pos += 1
+            return
+        while True:
+            yield self.value()
+            # fast path for the usual comma between items
+            match = _COMMA.match(self.buf, self.pos)
+            if match and match.end() < len(self.buf):
+                self.pos = match.end()
+                continue
+            char = self.peek()
+            self.pos += 1
+            if char == ']':
+                return
+            if char != ',':
+                raise self.error("Expecting ',' or ']'", self.pos - 1)
+
+    def object_items(self, streamed_keys=()):
+        '''Yields (key, value, is_stream) for each property of an object. For
+        arrays under streamed_keys the value is an iterator over the items,
+        which must be used before moving on to the next property.'''
+        self.expect('{')
+        if self.peek() == '}':
+            self.pos += 1
+            return
+        while True:
+            if self.peek() != '"':
+                raise self.error('Expecting property name enclosed in double quotes')
+            key = self.value()
+            self.expect(':')
+            if key in streamed_keys and self.peek() == '[':
+                items = self.array_items()
+                yield key, items, True
+                for _ in items:
+                    pass # whatever the caller didn't read
+            else:
+                yield key, self.value(), False
+            char = self.peek()
+            self.pos += 1
+            if char == '}':
+                return
+            if char != ',':
+                raise self.error("Expecting ',' or '}'", self.pos - 1)
+
+    def end(self):
+        if self.peek() != '':
+            raise self.error('Extra data')
+
+# Outcome of validating one file
+class ValidationReport:
+    def __init__(self, path):
+        self.path = path
+        self.errors = [] # (JSON path, message)
+        self.events = 0
+        self.seconds = 0.0
+        self.truncated = False # stopped at max_errors
+
+    @property
+    def ok(self):
+        return not self.errors
+
+    def lines(self):
+        return ['%s: %s' % (path or '<root>', message) for path, message in self.errors]
+
+class RLRRValidator:
+    def __init__(self, schema):
+        compiler = SchemaCompiler(schema)
+        self.root = compiler.compile()
+        self.definitions = compiler.definitions
+        self.extra_arrays = {key: compiler.definition(name) for key, name in EXTRA_ARRAYS.items()
+                             if name in schema.get('definitions', {}) and key not in self.root.properties}
+
+    @classmethod
+    def from_file(cls, path=SCHEMA_PATH):
+        with open(path, encoding='utf-8') as f:
+            return cls(json.load(f))
+
+    def validate(self, value, max_errors=DEFAULT_MAX_ERRORS):
+        '''Errors for a .rlrr file that's already loaded'''
+        errors = []
+        if not self.root.valid(value):
+            self.root.explain(value, '', errors)
+        if type(value) is dict:
+            for key, item_node in self.extra_arrays.items():
+                if key not in value:
+                    continue
+                if type(value[key]) is not list:
+                    errors.append((key, 'expected array, got %s' % _json_type(value[key])))
+                else:
+                    self._check_items(enumerate(value[key]), item_node, key, errors, max_errors)
+        return errors[:max_errors]
+
+    def validate_file(self, path, max_errors=DEFAULT_MAX_ERRORS):
+        report = ValidationReport(path)
+        start = time.perf_counter()
+        try:
+            with open(path, encoding='utf-8') as f:
+                self._validate_stream(JsonStream(f), report, max_errors)
+        except (OSError, UnicodeDecodeError, ValueError, RecursionError) as e:
+            report.errors.append(('', str(e)))
+        if len(report.errors) >= max_errors:
+            report.truncated = True
+            del report.errors[max_errors:]
+        report.seconds = time.perf_counter() - start
+        return report
+
+    def _check_items(self, items, item_node, path, errors, max_errors):
+        '''Checks (index, item) pairs, returns how many there were'''
+        count = 0
+        valid = item_node.valid
+        for i, item in items:
+            count += 1
+            if not valid(item):
+                item_node.explain(item, _join(path, i), errors)
+                if len(errors) >= max_errors:
+                    break
+        return count
+
+    def _validate_stream(self, stream, report, max_errors):
+        root = self.root
+        errors = report.errors
+        if stream.peek() != '{':
+            value = stream.value()
+            if not root.valid(value):
+                root.explain(value, '', errors)
+            return
+
+        seen = set()
+        streamed = [key for key in STREAMED_ARRAYS
+                    if (key in root.properties and root.properties[key].items is not None) or key in self.extra_arrays]
+        for key, value, is_stream in stream.object_items(streamed):
+            seen.add(key)
+            node = root.properties.get(key)
+            if is_stream:
+                array_node = node
+                item_node = node.items if node is not None else self.extra_arrays[key]
+                count = self._check_items(enumerate(value), item_node, key, errors, max_errors)
+                if key == 'events':
+                    report.events = count
+                if len(errors) >= max_errors:
+                    return
+                if array_node is not None:
+                    _explain_length(array_node, count, key, errors)
+            elif node is not None:
+                if not node.valid(value):
+                    node.explain(value, key, errors)
+            elif root.allowed is not None:
+                errors.append(('', "unexpected property '%s'" % key))
+            elif key in self.extra_arrays:
+                errors.append((key, 'expected array, got %s' % _json_type(value)))
+            if len(errors) >= max_errors:
+                return
+        stream.end()
+        for key in root.required:
+            if key not in seen:
+                errors.append(('', "missing property '%s'" % key))
+
+_validators = {} # schema path -> RLRRValidator, compiled once per process
+
+def get_validator(schema_path=SCHEMA_PATH):
+    if schema_path not in _validators:
+        _validators[schema_path] = RLRRValidator.from_file(schema_path)
+    return _validators[schema_path]
+
+def validate_file(path, max_errors=DEFAULT_MAX_ERRORS, schema_path=SCHEMA_PATH):
+    return get_validator(schema_path).validate_file(path, max_errors)
+
+def _validate_batch(paths, max_errors, schema_path):
+    validator = get_validator(schema_path)
+    return [validator.validate_file(path, max_errors) for path in paths]
+
+def validate_files(paths, max_errors=DEFAULT_MAX_ERRORS, max_workers=None, schema_path=SCHEMA_PATH, batch_size=16):
+    '''Validates every file in paths on a process pool. Yields a
+    ValidationReport per file, in the order of paths.'''
+    paths = list(paths)
+    if max_workers is None:
+        max_workers = os.cpu_count() or 1
+    max_workers = max(1, min(max_workers, (len(paths) + batch_size - 1) // batch_size))
+    if max_workers == 1:
+        validator = get_validator(schema_path)
+        for path in paths:
+            yield validator.validate_file(path, max_errors)
+        return
+    # files are sent to the workers in batches so each one compiles the
+    # schema once and small files don't cost a round trip each
+    batches = [paths[i:i + batch_size] for i in range(0, len(paths), batch_size)]
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(_validate_batch, batch, max_errors, schema_path) for batch in batches]
+        for future in futures:
+            yield from future.result()
+
+def find_rlrr_files(paths):
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            for dirpath, dirnames, filenames in os.walk(path):
+                dirnames.sort()
+                files.extend(os.path.join(dirpath, f) for f in sorted(filenames) if f.lower().endswith('.rlrr'))
+        else:
+            files.append(path)
+    return files
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m PDUtilities validate',
+                                     description='Check .rlrr files against the RLRR schema.')
+    parser.add_argument('paths', nargs='+', help='.rlrr files or folders to search for them')
+    parser.add_argument('-n', '--max-errors', type=int, default=DEFAULT_MAX_ERRORS, help='errors to report per file (default: %d)' % DEFAULT_MAX_ERRORS)
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count() or 1, help='worker processes (default: all cores)')
+    parser.add_argument('-s', '--schema', default=SCHEMA_PATH, help='schema file (default: docs/rlrrschema.json)')
+    parser.add_argument('-q', '--quiet', action='store_true', help='only list invalid files')
+    args = parser.parse_args(argv)
+
+    files = find_rlrr_files(args.paths)
+    if not files:
+        print("No .rlrr files found")
+        return 1
+    start = time.perf_counter()
+    invalid = 0
+    for report in validate_files(files, max(1, args.max_errors), args.jobs, args.schema):
+        if report.ok:
+            if not args.quiet:
+                print("[ok]      %s (%d events)" % (report.path, report.events))
+            continue
+        invalid += 1
+        print("[INVALID] %s" % report.path)
+        for line in report.lines():
+            print("          " + line)
+        if report.truncated:
+            print("          (stopped after %d errors)" % args.max_errors)
+    print("%d valid, %d invalid in %.2fs" % (len(files) - invalid, invalid, time.perf_counter() - start))
+    return 1 if invalid else 0
+
+if __name__ == '__main__':
+    import sys
+    sys.exit(main())
@@ -0,0 +1,122 @@
+# Copyright (C) 2020 Emre Tanirgan <emre@paradiddleapp.com>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import json
+import os
+
+# orjson is optional, it's only used for compact output when it's installed
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+INDENT = '    '
+# Number of array items encoded per write in compact mode
+CHUNK_SIZE = 4096
+
+# Writes a .rlrr file one top-level field at a time, so large arrays
+# (instruments, events, bpmEvents) are encoded item by item from any iterable
+# instead of as one big JSON string. The converter still resolves every hit
+# into a DrumEventStore first and only builds each event's dict as it's
+# written. The file is written next to `path` and moved into place once it's
+# complete, so a failed write leaves the previous file untouched.
+# The default output is byte for byte what json.dump(out_dict, f, indent=4)
+# used to write; compact=True drops all whitespace.
+class RLRRWriter:
+    def __init__(self, path, compact=False, use_fast_json=True):
+        self.path = path
+        self.tmp_path = path + '.tmp'
+        self.compact = compact
+        self.use_orjson = compact and use_fast_json and orjson is not None
+        self.file = None
+        self.num_fields = 0
+
+    def __enter__(self):
+        self.file = open(self.tmp_path, 'w', encoding='utf-8')
+        self.file.write('{')
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        try:
+            try:
+                if exc_type is None:
+                    self.file.write('}' if self.compact or self.num_fields == 0 else '\n}')
+            finally:
+                self.file.close()
+            if exc_type is None:
+                os.replace(self.tmp_path, self.path)
+        except BaseException:
+            self._remove_tmp()
+            raise
+        if exc_type is not None:
+            self._remove_tmp()
+        return False
+
+    def _remove_tmp(self):
+        try:
+            os.remove(self.tmp_path)
+        except OSError:
+            pass
+
+    def _encode(self, value, level):
+        if self.use_orjson:
+            return orjson.dumps(value).decode('utf-8')
+        if self.compact:
+            return json.dumps(value, separators=(',', ':'))
+        return json.dumps(value, indent=4).replace('\n', '\n' + INDENT * level)
+
+    def _start_field(self, key):
+        if self.compact:
+            self.file.write((',' if self.num_fields else '') + json.dumps(key) + ':')
+        else:
+            self.file.write((',\n' if self.num_fields else '\n') + INDENT + json.dumps(key) + ': ')
+        self.num_fields += 1
+
+    def write_field(self, key, value):
+        self._start_field(key)
+        self.file.write(self._encode(value, 1))
+
+    def write_array(self, key, items):
+        '''Streams every item of the iterable `items` as the array `key`'''
+        self._start_field(key)
+        if self.compact:
+            self._write_compact_items(items)
+            return
+
+        separator = '\n' + INDENT * 2
+        count = 0
+        for item in items:
+            self.file.write(('[' if count == 0 else ',') + separator + self._encode(item, 2))
+            count += 1
+        self.file.write('\n' + INDENT + ']' if count else '[]')
+
+    def _write_compact_items(self, items):
+        self.file.write('[')
+        chunk = []
+        first = True
+        for item in items:
+            chunk.append(item)
+            if len(chunk) == CHUNK_SIZE:
+                self._write_compact_chunk(chunk, first)
+                first = False
+                chunk = []
+        if chunk:
+            self._write_compact_chunk(chunk, first)
+        self.file.write(']')
+
+    def _write_compact_chunk(self, chunk, first):
+        # Encode the whole chunk as one list and drop its brackets
+        encoded = self._encode(chunk, 0)[1:-1]
+        self.file.write(encoded if first else ',' + encoded)
@@ -1,16 +1,20 @@
 from PyQt5.QtGui import QIcon, QPainter, QPen, QColor
-from PyQt5 import QtWidgets, uic
+from PyQt5 import QtWidgets
 from PyQt5.QtWidgets import QFileDialog, QMessageBox, QScrollBar
 from PyQt5.QtCore import Qt, QTimer
 import os
-import mido
-import sounddevice as sd
+import sys
+from midiconvert import read_midi_notes, resolve_drum_hits, EVENT_NOTE_ON
 import soundfile as sf
 import numpy as np
 import threading
 import time
+import logging
+from pdlog import get_logger
+from uiloader import load_ui
 
 project_dir = os.path.dirname(os.path.realpath(__file__))
+log = get_logger(__name__)
 
 class DrumSamplePlayer:
     def __init__(self, sample_rate=44100):
@@ -21,7 +25,7 @@ class DrumSamplePlayer:
     def load_default_samples(self):
         """Load default drum samples from the drum_samples directory"""
         samples_dir = os.path.join(project_dir, "drum_samples")
-        print(f"Loading drum samples from: {samples_dir}")
+        log.info("Loading drum samples from: %s", samples_dir)
         
         # Default sample mappings with fallbacks
         sample_files = {
@@ -60,17 +64,17 @@ class DrumSamplePlayer:
                             audio_data = audio_data / max_val * 0.8  # Scale to 80% to prevent clipping
                     
                     self.samples[drum_type] = audio_data
-                    print(f"✓ Loaded {drum_type} sample: {len(audio_data)} samples at {sr}Hz")
+                    log.debug("✓ Loaded %s sample: %d samples at %dHz", drum_type, len(audio_data), sr)
                 except Exception as e:
-                    print(f"✗ Could not load drum sample {sample_path}: {e}")
+                    log.warning("✗ Could not load drum sample %s: %s", sample_path, e)
             else:
-                print(f"✗ Sample file not found: {sample_path}")
+                log.warning("✗ Sample file not found: %s", sample_path)
                 
-        print(f"Total samples loaded: {len(self.samples)}")
+        log.info("Total samples loaded: %d", len(self.samples))
         
         # Ensure we have at least basic samples
         if len(self.samples) == 0:
-            print("⚠️ No drum samples loaded! Creating silent fallbacks.")
+            log.warning("⚠️ No drum samples loaded! Creating silent fallbacks.")
             # Create silent samples as absolute fallback
             silent_sample = np.zeros(int(self.sample_rate * 0.1))  # 100ms of silence
             for drum_type in sample_files.keys():
@@ -97,7 +101,7 @@ class DrumSamplePlayer:
             self.samples[drum_type] = audio_data
             return True
         except Exception as e:
-            print(f"Could not load custom sample {file_path}: {e}")
+            log.warning("Could not load custom sample %s: %s", file_path, e)
             return False
 
 class SongDisplay_GUI(QtWidgets.QDockWidget):
@@ -105,7 +109,7 @@ class SongDisplay_GUI(QtWidgets.QDockWidget):
         super(SongDisplay_GUI, self).__init__()
         
         self.setWindowIcon(QIcon(os.path.join(project_dir, "assets", "favicon.ico")))
-        uic.loadUi(os.path.join(project_dir, "ui_layouts", "song_display_layout.ui"), self)
+        load_ui("song_display_layout", self)
         
         # Set initial window title
         self.setWindowTitle("Song Display - No Song Loaded")
@@ -121,7 +125,8 @@ class SongDisplay_GUI(QtWidgets.QDockWidget):
         self.current_position = 0
         self.playback_thread = None
         self.stop_playback = False
-        self.drum_sample_player = DrumSamplePlayer()
+        self._drum_sample_player = None # loaded on first playback
+        self._drum_sample_player_lock = threading.Lock()
         self.show_mapped_view = True  # Default to showing mapped drum events
         
         # Audio tracks from MIDI converter
@@ -178,10 +183,10 @@ class SongDisplay_GUI(QtWidgets.QDockWidget):
         self.audioTrackToggle.clicked.connect(self._toggle_audio_track)
         self.instrumentSoundsToggle.clicked.connect(self._toggle_instrument_sounds)
         
-        # Set up timer for updating position
+        # Set up timer for updating position, it only runs while the display is shown
         self.update_timer = QTimer()
+        self.update_timer.setInterval(50)  # Update every 50ms
         self.update_timer.timeout.connect(self._update_position)
-        self.update_timer.start(50)  # Update every 50ms
         
         # Set up MIDI visualization
         self.setMinimumHeight(400)  # Ensure enough space for visualization
@@ -198,6 +203,23 @@ class SongDisplay_GUI(QtWidgets.QDockWidget):
         self.waveform_height = 60  # Height reserved for waveform display
         self.show_waveform = True
         
+    @property
+    def drum_sample_player(self):
+        # Decoding and resampling the samples takes a while, so it's only done
+        # once something is played. Playback threads may get here first.
+        with self._drum_sample_player_lock:
+            if self._drum_sample_player is None:
+                self._drum_sample_player = DrumSamplePlayer()
+            return self._drum_sample_player
+
+    def showEvent(self, event):
+        self.update_timer.start()
+        super().showEvent(event)
+
+    def hideEvent(self, event):
+        self.update_timer.stop()
+        super().hideEvent(event)
+
     def _playState_changed(self):
         if not self.midi_file:
             return
@@ -269,6 +291,9 @@ class SongDisplay_GUI(QtWidgets.QDockWidget):
         self.update()
         
     def _playback_loop(self):
+        # PortAudio is only loaded once something is played
+        import sounddevice as sd
+
         if not self.sample_rate:
             self.sample_rate = 44100  # Default sample rate
             
@@ -423,7 +448,7 @@ class SongDisplay_GUI(QtWidgets.QDockWidget):
                             time.sleep(0.01)
                                 
                 except Exception as e:
-                    print(f"Audio playback error: {e}")
+                    log.error("Audio playback error: %s", e)
                     
         else:
             # MIDI-only playback with drum sounds
@@ -432,7 +457,7 @@ class SongDisplay_GUI(QtWidgets.QDockWidget):
                 total_duration = display_data['duration'] if display_data else 60.0  # Default 60 seconds
                 total_samples = int(total_duration * self.sample_rate)
                 
-                print(f"Pre-generating drum track for {total_duration:.2f} seconds ({total_samples} samples)")
+                log.info("Pre-generating drum track for %.2f seconds (%d samples)", total_duration, total_samples)
                 drum_track = self._generate_full_drum_track(start_time, total_samples, drum_data_source)
                 
                 # Track current frame position for the callback
@@ -498,7 +523,7 @@ class SongDisplay_GUI(QtWidgets.QDockWidget):
                             time.sleep(0.01)
                                 
                 except Exception as e:
-                    print(f"MIDI playback error: {e}")
+                    log.error("MIDI playback error: %s", e)
         
         # Stop playback but don't reset position
         self.is_playing = False
@@ -534,18 +559,17 @@ class SongDisplay_GUI(QtWidgets.QDockWidget):
             events_in_chunk = self._process_raw_midi_events(data_source, start_time, end_time)
         else:
             # Invalid data source type
-            print(f"Warning: Invalid data source type for drum generation: {type(data_source)}")
+            log.warning("Invalid data source type for drum generation: %s", type(data_source))
             return drum_chunk
         
-        if events_in_chunk:
-            print(f"Found {len(events_in_chunk)} drum events in time range {start_time:.2f}-{end_time:.2f}s")
-            
-            # Debug: Show all events
+        debug = log.isEnabledFor(logging.DEBUG)
+        if events_in_chunk and debug:
+            log.debug("Found %d drum events in time range %.2f-%.2fs", len(events_in_chunk), start_time, end_time)
             for event in events_in_chunk:
                 if event.get('is_mapped'):
-                    print(f"  Mapped Event: drum_class={event['drum_class']}, velocity={event['velocity']}")
+                    log.debug("  Mapped Event: drum_class=%s, velocity=%s", event['drum_class'], event['velocity'])
                 else:
-                    print(f"  Raw Event: note={event['note']}, channel={event['channel']}, velocity={event['velocity']}")
+                    log.debug("  Raw Event: note=%s, channel=%s, velocity=%s", event['note'], event['channel'], event['velocity'])
         
         # Generate drum sounds for each event
         for event in events_in_chunk:
@@ -557,11 +581,13 @@ class SongDisplay_GUI(QtWidgets.QDockWidget):
                 if event.get('is_mapped') and event['drum_class']:
                     # Use mapped drum class
                     drum_type = self._map_drum_class_to_sample(event['drum_class'])
-                    print(f"  Using mapped drum class: {event['drum_class']} -> {drum_type}")
+                    if debug:
+                        log.debug("  Using mapped drum class: %s -> %s", event['drum_class'], drum_type)
                 else:
                     # Fall back to raw MIDI note mapping
                     drum_type = self._get_drum_type_from_note(event['note'])
-                    print(f"  Using raw MIDI note: {event['note']} -> {drum_type}")
+                    if debug:
+                        log.debug("  Using raw MIDI note: %s -> %s", event['note'], drum_type)
                 
                 if drum_type:
                     sample = self.drum_sample_player.get_sample(drum_type)
@@ -580,12 +606,12 @@ class SongDisplay_GUI(QtWidgets.QDockWidget):
                             -1.0, 1.0
                         )
                         
-                        if event.get('is_mapped'):
-                            print(f"  Added {drum_type} drum at frame {event_frame} (drum_class {event['drum_class']}, velocity {event['velocity']}, vol={velocity_scale:.2f})")
-                        else:
-                            print(f"  Added {drum_type} drum at frame {event_frame} (note {event['note']}, channel {event['channel']}, velocity {event['velocity']}, vol={velocity_scale:.2f})")
+                        if debug and event.get('is_mapped'):
+                            log.debug("  Added %s drum at frame %d (drum_class %s, velocity %s, vol=%.2f)", drum_type, event_frame, event['drum_class'], event['velocity'], velocity_scale)
+                        elif debug:
+                            log.debug("  Added %s drum at frame %d (note %s, channel %s, velocity %s, vol=%.2f)", drum_type, event_frame, event['note'], event['channel'], event['velocity'], velocity_scale)
                     else:
-                        print(f"  No sample found for drum type: {drum_type}")
+                        log.debug("  No sample found for drum type: %s", drum_type)
         
         return drum_chunk
         
@@ -595,28 +621,17 @@ class SongDisplay_GUI(QtWidgets.QDockWidget):
         
         # Process all tracks in the MIDI file
         for track in data_source.tracks:
-            current_time = 0
-            current_tempo = 500000  # Default tempo (120 BPM)
-            
-            for msg in track:
-                # Update tempo if we encounter a tempo change
-                if msg.type == 'set_tempo':
-                    current_tempo = msg.tempo
-                    
-                # Convert MIDI ticks to seconds with current tempo
-                current_time += mido.tick2second(msg.time, data_source.ticks_per_beat, current_tempo)
-                
-                if msg.type == 'note_on' and msg.velocity > 0:
-                    if start_time <= current_time < end_time:
-                        # Get channel, default to 9 if not specified
-                        channel = getattr(msg, 'channel', 9)
-                        events_in_chunk.append({
-                            'time': current_time,
-                            'note': msg.note,
-                            'velocity': msg.velocity,
-                            'channel': channel,
-                            'is_mapped': False
-                        })
+            events = track.events
+            times = data_source.tempo_map.ticks_to_seconds(events['tick'])
+            in_range = (events['type'] == EVENT_NOTE_ON) & (events['velocity'] > 0) & (times >= start_time) & (times < end_time)
+            for (tick, event_type, channel, note, velocity), current_time in zip(events[in_range].tolist(), times[in_range].tolist()):
+                events_in_chunk.append({
+                    'time': current_time,
+                    'note': note,
+                    'velocity': velocity,
+                    'channel': channel,
+                    'is_mapped': False
+                })
         
         return events_in_chunk
         
@@ -643,7 +658,7 @@ class SongDisplay_GUI(QtWidgets.QDockWidget):
                 drum_class = drum_mapping['drum']
                 # Map drum class to sample type
                 sample_type = self._map_drum_class_to_sample(drum_class)
-                print(f"  MIDI note {midi_note} -> {drum_class} -> {sample_type} (using mapping)")
+                log.debug("  MIDI note %s -> %s -> %s (using mapping)", midi_note, drum_class, sample_type)
                 return sample_type
                 
         # If not found in mapping, use fallback
@@ -761,7 +776,7 @@ class SongDisplay_GUI(QtWidgets.QDockWidget):
             else:
                 drum_type = 'hihat'  # High notes -> hihat
                 
-            print(f"  Unmapped MIDI note {midi_note} -> fallback to {drum_type}")
+            log.debug("  Unmapped MIDI note %s -> fallback to %s", midi_note, drum_type)
         
         return drum_type
             
@@ -996,7 +1011,7 @@ class SongDisplay_GUI(QtWidgets.QDockWidget):
         if not song_path:
             return
             
-        self.midi_file = mido.MidiFile(song_path)
+        self.midi_file = read_midi_notes(song_path)
         self.midi_data = self._process_midi_data()
         self.mapped_midi_data = self._process_mapped_midi_data()
         
@@ -1043,30 +1058,22 @@ class SongDisplay_GUI(QtWidgets.QDockWidget):
         # Process all tracks or specific track
         tracks_to_process = [self.midi_file.tracks[track_index]] if track_index is not None else self.midi_file.tracks
         
+        tempo_map = self.midi_file.tempo_map
         for track in tracks_to_process:
-            current_time = 0
-            current_tempo = 500000  # Default tempo (120 BPM)
-            for msg in track:
-                # Update tempo if we encounter a tempo change
-                if msg.type == 'set_tempo':
-                    current_tempo = msg.tempo
-                    
-                # Convert MIDI ticks to seconds with current tempo
-                current_time += mido.tick2second(msg.time, self.midi_file.ticks_per_beat, current_tempo)
-                
-                if msg.type == 'note_on' and msg.velocity > 0:
-                    active_notes[msg.note] = current_time
-                elif msg.type == 'note_off' or (msg.type == 'note_on' and msg.velocity == 0):
-                    if msg.note in active_notes:
-                        start_time = active_notes[msg.note]
-                        duration = current_time - start_time
-                        notes.append({
-                            'note': msg.note,
-                            'time': start_time,
-                            'duration': max(0.01, duration),  # Ensure minimum duration
-                            'velocity': msg.velocity
-                        })
-                        del active_notes[msg.note]
+            times = tempo_map.ticks_to_seconds(track.events['tick']).tolist()
+            for (tick, event_type, channel, note, velocity), current_time in zip(track.events.tolist(), times):
+                if event_type == EVENT_NOTE_ON and velocity > 0:
+                    active_notes[note] = current_time
+                elif note in active_notes:
+                    start_time = active_notes[note]
+                    duration = current_time - start_time
+                    notes.append({
+                        'note': note,
+                        'time': start_time,
+                        'duration': max(0.01, duration),  # Ensure minimum duration
+                        'velocity': velocity
+                    })
+                    del active_notes[note]
                         
         # Handle any remaining active notes
         for note, start_time in active_notes.items():
@@ -1092,7 +1099,7 @@ class SongDisplay_GUI(QtWidgets.QDockWidget):
             if len(self.audio_data.shape) > 1:
                 self.audio_data = np.mean(self.audio_data, axis=1)
         except Exception as e:
-            print(f"Error loading audio file: {e}")
+            log.error("Error loading audio file: %s", e)
             self.audio_data = None
             self.sample_rate = None
 
@@ -1104,45 +1111,12 @@ class SongDisplay_GUI(QtWidgets.QDockWidget):
         self.update()  # Trigger repaint
 
     def _get_tempo_map(self, midi_file):
-        """Extract tempo changes from MIDI file for accurate timing"""
-        tempo_changes = []
-        current_time = 0
-        current_tempo = 500000  # Default tempo (120 BPM)
-        
-        # Scan all tracks for tempo changes
-        for track in midi_file.tracks:
-            track_time = 0
-            track_tempo = 500000
-            
-            for msg in track:
-                if msg.type == 'set_tempo':
-                    track_tempo = msg.tempo
-                    tempo_changes.append({
-                        'time': track_time,
-                        'tempo': track_tempo
-                    })
-                
-                # Convert MIDI ticks to seconds with current tempo
-                track_time += mido.tick2second(msg.time, midi_file.ticks_per_beat, track_tempo)
-        
-        # Sort by time and return
-        tempo_changes.sort(key=lambda x: x['time'])
-        if not tempo_changes:
-            tempo_changes = [{'time': 0, 'tempo': 500000}]  # Default if no tempo found
-            
-        return tempo_changes
+        """Tempo map shared by every track of the MIDI file"""
+        return midi_file.tempo_map
     
     def _get_tempo_at_time(self, tempo_map, time):
         """Get the tempo that should be active at a given time"""
-        active_tempo = 500000  # Default
-        
-        for tempo_change in tempo_map:
-            if tempo_change['time'] <= time:
-                active_tempo = tempo_change['tempo']
-            else:
-                break
-                
-        return active_tempo
+        return tempo_map.tempo_at_seconds(time)
     
     def _process_mapped_midi_data(self, track_index=None):
         """Process MIDI data through the mapping system to get drum events"""
@@ -1150,99 +1124,47 @@ class SongDisplay_GUI(QtWidgets.QDockWidget):
             return None
             
         # Get the current difficulty and mapping
-        difficulty = getattr(self.midi_converter, 'difficulty', 'Easy')
-        diff_index = self.midi_converter.difficulty_names.index(difficulty)
-        
-        # Get the note mapping for current difficulty
-        if diff_index < len(self.midi_converter.note_to_drum_maps):
-            note_map = self.midi_converter.note_to_drum_maps[diff_index]
-            toggle_map = self.midi_converter.toggle_to_drum_maps[diff_index] if diff_index < len(self.midi_converter.toggle_to_drum_maps) else {}
-        else:
+        if not self.midi_converter.note_to_drum_maps or self.midi_converter.drum_kit is None:
             return None
+        difficulty = getattr(self.midi_converter, 'difficulty', 'Easy')
+        mapping = self.midi_converter.compiled_mapping(difficulty)
             
         mapped_notes = []
-        active_notes = {}
-        active_toggles = []
         
         # Process the selected track or all tracks
         tracks_to_process = [self.midi_file.tracks[track_index]] if track_index is not None else self.midi_file.tracks
         
+        tempo_map = self.midi_file.tempo_map
         for track in tracks_to_process:
-            current_time = 0
-            current_tempo = 500000  # Default tempo (120 BPM)
-            for msg in track:
-                # Update tempo if we encounter a tempo change
-                if msg.type == 'set_tempo':
-                    current_tempo = msg.tempo
-                    
-                # Convert MIDI ticks to seconds with current tempo
-                current_time += mido.tick2second(msg.time, self.midi_file.ticks_per_beat, current_tempo)
-                
-                if msg.type == 'note_on' and msg.velocity > 0:
-                    note = msg.note
-                    
-                    # Handle toggle notes
-                    if note in toggle_map:
-                        if note not in active_toggles:
-                            active_toggles.append(note)
-                    
-                    # Handle mapped drum notes
-                    if note in note_map:
-                        for drum_mapping in note_map[note]:
-                            drum_class = drum_mapping['drum']
-                            
-                            # Check if this drum requires a toggle
-                            toggle_required = False
-                            for toggle_note, toggle_drum in toggle_map.items():
-                                if toggle_drum == drum_class:
-                                    toggle_required = True
-                                    if toggle_note in active_toggles:
-                                        # Create mapped note with drum class info
-                                        mapped_note = {
-                                            'note': self._get_drum_display_note(drum_class),
-                                            'time': current_time,
-                                            'duration': 0.1,  # Will be updated on note_off
-                                            'velocity': msg.velocity,
-                                            'drum_class': drum_class,
-                                            'original_note': note
-                                        }
-                                        active_notes[f"{note}_{drum_class}"] = mapped_note
-                                    break
-                            
-                            if not toggle_required:
-                                # Create mapped note without toggle requirement
-                                mapped_note = {
-                                    'note': self._get_drum_display_note(drum_class),
-                                    'time': current_time,
-                                    'duration': 0.1,  # Will be updated on note_off
-                                    'velocity': msg.velocity,
-                                    'drum_class': drum_class,
-                                    'original_note': note
-                                }
-                                active_notes[f"{note}_{drum_class}"] = mapped_note
-                                
-                elif msg.type == 'note_off' or (msg.type == 'note_on' and msg.velocity == 0):
-                    note = msg.note
-                    
-                    # Handle toggle note off
-                    if note in toggle_map and note in active_toggles:
-                        active_toggles.remove(note)
-                    
-                    # Handle mapped drum note off
-                    if note in note_map:
-                        for drum_mapping in note_map[note]:
-                            drum_class = drum_mapping['drum']
-                            key = f"{note}_{drum_class}"
-                            if key in active_notes:
-                                mapped_note = active_notes[key]
-                                mapped_note['duration'] = max(0.01, current_time - mapped_note['time'])
-                                mapped_notes.append(mapped_note)
-                                del active_notes[key]
-        
-        # Handle any remaining active notes
-        for key, mapped_note in active_notes.items():
-            mapped_note['duration'] = 0.1  # Default duration
-            mapped_notes.append(mapped_note)
+            events = track.events
+            times = tempo_map.ticks_to_seconds(events['tick']).tolist()
+            (event_indices, slots), = resolve_drum_hits([mapping], events)
+
+            notes = events['note'].tolist()
+            velocities = events['velocity'].tolist()
+            is_off = ((events['type'] != EVENT_NOTE_ON) | (events['velocity'] == 0)).tolist()
+
+            # A hit lasts until the next note off of its note
+            note_off_times = [None] * len(events)
+            next_off = {}
+            for index in range(len(events) - 1, -1, -1):
+                note_off_times[index] = next_off.get(notes[index])
+                if is_off[index]:
+                    next_off[notes[index]] = times[index]
+
+            for index, slot in zip(event_indices.tolist(), slots.tolist()):
+                note = notes[index]
+                drum_class = mapping.note_classes[note][slot]
+                current_time = times[index]
+                off_time = note_off_times[index]
+                mapped_notes.append({
+                    'note': self._get_drum_display_note(drum_class),
+                    'time': current_time,
+                    'duration': max(0.01, off_time - current_time) if off_time is not None else 0.1,
+                    'velocity': velocities[index],
+                    'drum_class': drum_class,
+                    'original_note': note
+                })
             
         return {
             'notes': mapped_notes,
@@ -1534,48 +1456,36 @@ class SongDisplay_GUI(QtWidgets.QDockWidget):
             # Fall back to raw MIDI processing
             # Process all tracks in the MIDI file
             for track in data_source.tracks:
-                current_time = 0
-                current_tempo = 500000  # Default tempo (120 BPM)
-                
-                for msg in track:
-                    # Update tempo if we encounter a tempo change
-                    if msg.type == 'set_tempo':
-                        current_tempo = msg.tempo
-                        
-                    # Convert MIDI ticks to seconds with current tempo
-                    current_time += mido.tick2second(msg.time, data_source.ticks_per_beat, current_tempo)
-                    
-                    if msg.type == 'note_on' and msg.velocity > 0:
-                        # Only process drum channel (channel 9 in 0-based indexing)
-                        if getattr(msg, 'channel', 9) != 9:
-                            continue
-                            
-                        if start_time <= current_time < end_time:
-                            # Calculate frame position (relative to start_time)
-                            relative_time = current_time - start_time
-                            event_frame = int(relative_time * self.sample_rate)
-                            if 0 <= event_frame < total_samples:
-                                # Get drum type from note
-                                drum_type = self._get_drum_type_from_note(msg.note)
-                                if drum_type:
-                                    sample = self.drum_sample_player.get_sample(drum_type)
-                                    if sample is not None and len(sample) > 0:
-                                        # Calculate velocity scaling (ensure minimum volume)
-                                        velocity_scale = max(0.3, msg.velocity / 127.0)  # Minimum 30% volume
-                                        
-                                        # Add sample to track
-                                        end_frame = min(event_frame + len(sample), total_samples)
-                                        sample_length = end_frame - event_frame
-                                        
-                                        # Use addition with clipping to prevent overflow
-                                        sample_data = sample[:sample_length] * velocity_scale
-                                        drum_track[event_frame:end_frame] = np.clip(
-                                            drum_track[event_frame:end_frame] + sample_data,
-                                            -1.0, 1.0
-                                        )
+                events = track.events
+                times = data_source.tempo_map.ticks_to_seconds(events['tick'])
+                # Only process drum channel (channel 9 in 0-based indexing)
+                in_range = (events['type'] == EVENT_NOTE_ON) & (events['velocity'] > 0) & (events['channel'] == 9) & (times >= start_time) & (times < end_time)
+                for (tick, event_type, channel, note, velocity), current_time in zip(events[in_range].tolist(), times[in_range].tolist()):
+                    # Calculate frame position (relative to start_time)
+                    relative_time = current_time - start_time
+                    event_frame = int(relative_time * self.sample_rate)
+                    if 0 <= event_frame < total_samples:
+                        # Get drum type from note
+                        drum_type = self._get_drum_type_from_note(note)
+                        if drum_type:
+                            sample = self.drum_sample_player.get_sample(drum_type)
+                            if sample is not None and len(sample) > 0:
+                                # Calculate velocity scaling (ensure minimum volume)
+                                velocity_scale = max(0.3, velocity / 127.0)  # Minimum 30% volume
+                                
+                                # Add sample to track
+                                end_frame = min(event_frame + len(sample), total_samples)
+                                sample_length = end_frame - event_frame
+                                
+                                # Use addition with clipping to prevent overflow
+                                sample_data = sample[:sample_length] * velocity_scale
+                                drum_track[event_frame:end_frame] = np.clip(
+                                    drum_track[event_frame:end_frame] + sample_data,
+                                    -1.0, 1.0
+                                )
         else:
             # Invalid data source type
-            print(f"Warning: Invalid data source type for full drum track generation: {type(data_source)}")
+            log.warning("Invalid data source type for full drum track generation: %s", type(data_source))
                                 
         return drum_track
 
@@ -1594,9 +1504,11 @@ class SongDisplay_GUI(QtWidgets.QDockWidget):
             
         # Stop any active audio streams
         try:
-            sd.stop()  # Stop all active sounddevice streams
+            sd = sys.modules.get('sounddevice') # nothing to stop if it was never loaded
+            if sd is not None:
+                sd.stop()  # Stop all active sounddevice streams
         except Exception as e:
-            print(f"Error stopping audio streams: {e}")
+            log.error("Error stopping audio streams: %s", e)
             
         # Accept the close event
         event.accept()
@@ -1615,7 +1527,7 @@ class SongDisplay_GUI(QtWidgets.QDockWidget):
         else:
             self.drumSoundsToggle.setText("Drums: OFF")
         
-        print(f"Drum sounds toggled: {'ON' if self.drum_sounds_enabled else 'OFF'}")
+        log.info("Drum sounds toggled: %s", 'ON' if self.drum_sounds_enabled else 'OFF')
             
     def _toggle_audio_track(self):
         """Toggle audio track on/off"""
@@ -1628,7 +1540,7 @@ class SongDisplay_GUI(QtWidgets.QDockWidget):
         else:
             self.audioTrackToggle.setText("Audio: OFF")
         
-        print(f"Audio tracks toggled: {'ON' if self.audio_track_enabled else 'OFF'}")
+        log.info("Audio tracks toggled: %s", 'ON' if self.audio_track_enabled else 'OFF')
             
     def _toggle_instrument_sounds(self):
         """Toggle instrument sounds on/off"""
@@ -1641,7 +1553,7 @@ class SongDisplay_GUI(QtWidgets.QDockWidget):
         else:
             self.instrumentSoundsToggle.setText("MIDI: OFF")
         
-        print(f"Instrument sounds toggled: {'ON' if self.instrument_sounds_enabled else 'OFF'}")
+        log.info("Instrument sounds toggled: %s", 'ON' if self.instrument_sounds_enabled else 'OFF')
 
     def load_audio_tracks_from_converter(self):
         """Load all song tracks and drum tracks from the MIDI converter"""
@@ -1670,9 +1582,9 @@ class SongDisplay_GUI(QtWidgets.QDockWidget):
                         )
                     self.song_tracks.append(audio_data)
                     self.track_sample_rates.append(sr)
-                    print(f"✓ Loaded song track {i+1}: {len(audio_data)} samples at {sr}Hz")
+                    log.info("✓ Loaded song track %d: %d samples at %dHz", i+1, len(audio_data), sr)
                 except Exception as e:
-                    print(f"✗ Could not load song track {i+1} ({track_path}): {e}")
+                    log.warning("✗ Could not load song track %d (%s): %s", i+1, track_path, e)
                     self.song_tracks.append(None)
                     self.track_sample_rates.append(self.sample_rate)
             else:
@@ -1696,23 +1608,23 @@ class SongDisplay_GUI(QtWidgets.QDockWidget):
                         )
                     self.drum_tracks.append(audio_data)
                     self.track_sample_rates.append(sr)
-                    print(f"✓ Loaded drum track {i+1}: {len(audio_data)} samples at {sr}Hz")
+                    log.info("✓ Loaded drum track %d: %d samples at %dHz", i+1, len(audio_data), sr)
                 except Exception as e:
-                    print(f"✗ Could not load drum track {i+1} ({track_path}): {e}")
+                    log.warning("✗ Could not load drum track %d (%s): %s", i+1, track_path, e)
                     self.drum_tracks.append(None)
                     self.track_sample_rates.append(self.sample_rate)
             else:
                 self.drum_tracks.append(None)
                 self.track_sample_rates.append(self.sample_rate)
                 
-        print(f"Loaded {len([t for t in self.song_tracks if t is not None])} song tracks and {len([t for t in self.drum_tracks if t is not None])} drum tracks")
+        log.info("Loaded %d song tracks and %d drum tracks", sum(t is not None for t in self.song_tracks), sum(t is not None for t in self.drum_tracks))
         
         # Set the main audio data to the longest track for duration calculation
         all_tracks = [t for t in self.song_tracks + self.drum_tracks if t is not None]
         if all_tracks:
             longest_track = max(all_tracks, key=len)
             self.audio_data = longest_track
-            print(f"Set main audio data to longest track: {len(longest_track)} samples")
+            log.debug("Set main audio data to longest track: %d samples", len(longest_track))
             
         # Generate combined audio and waveform after loading tracks
         self._combine_audio_tracks()
@@ -1755,7 +1667,7 @@ class SongDisplay_GUI(QtWidgets.QDockWidget):
             if max_val > 0:
                 self.combined_audio = self.combined_audio / max_val
                 
-        print(f"✓ Combined audio tracks: {len(self.combined_audio)} samples")
+        log.debug("✓ Combined audio tracks: %d samples", len(self.combined_audio))
         
     def _generate_waveform_data(self, target_width=2000):
         """Generate downsampled waveform data for visualization"""
@@ -1785,7 +1697,7 @@ class SongDisplay_GUI(QtWidgets.QDockWidget):
                     
             self.waveform_data = np.array(waveform)
             
-        print(f"✓ Generated waveform data: {len(self.waveform_data)} points")
+        log.debug("✓ Generated waveform data: %d points", len(self.waveform_data))
         
         # Trigger a repaint to show the new waveform
         self.update()
@@ -0,0 +1,132 @@
+# Copyright (C) 2020 Emre Tanirgan <emre@paradiddleapp.com>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+# Shows where startup time goes:
+#   python -m PDUtilities profile-startup [--headless] [-r 5] [-n 15]
+# Starts the app in a new process with Python's -X importtime, which quits
+# as soon as its window is shown, and prints the time to the first window
+# and the import time of each package and of the slowest modules. With
+# --headless it times creating a MidiConverter instead, the way batch
+# conversions and scripts start.
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+from collections import defaultdict
+
+project_dir = os.path.dirname(os.path.realpath(__file__))
+STARTUP_ENV = 'PDU_STARTUP_PROFILE' # set in the profiled process
+READY_MARKER = 'pdu-startup-ready'
+
+HEADLESS_CODE = '''import sys, time
+sys.path.insert(0, %r)
+from midiconvert import MidiConverter
+MidiConverter()
+print(%r, time.time(), file=sys.stderr, flush=True)
+''' % (project_dir, READY_MARKER)
+
+def report_first_window(app):
+    '''Called by the profiled app once its window exists. Reports the time
+    after the event loop shows it and quits.'''
+    from PyQt5.QtCore import QTimer
+    def ready():
+        print(READY_MARKER, time.time(), file=sys.stderr, flush=True)
+        app.quit()
+    QTimer.singleShot(0, ready)
+
+# One line of -X importtime output
+class ImportRecord:
+    def __init__(self, line):
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        self.self_us = int(self_us)
+        self.cumulative_us = int(cumulative_us)
+        self.depth = (len(name) - len(name.lstrip(' ')) - 1) // 2
+        self.name = name.strip()
+
+    @property
+    def package(self):
+        return self.name.split('.')[0]
+
+def parse_importtime(stderr):
+    '''(import records, time.time() when the app was ready or None)'''
+    records = []
+    ready_at = None
+    for line in stderr.splitlines():
+        if line.startswith('import time:') and not line.rstrip().endswith('imported package'):
+            try:
+                records.append(ImportRecord(line))
+            except ValueError:
+                pass
+        elif line.startswith(READY_MARKER):
+            ready_at = float(line.split()[1])
+    return records, ready_at
+
+def profile_once(headless):
+    env = dict(os.environ)
+    env[STARTUP_ENV] = '1'
+    if headless:
+        command = [sys.executable, '-X', 'importtime', '-c', HEADLESS_CODE]
+    else:
+        command = [sys.executable, '-X', 'importtime', project_dir]
+    start = time.time()
+    result = subprocess.run(command, env=env, capture_output=True, text=True)
+    records, ready_at = parse_importtime(result.stderr)
+    if ready_at is None:
+        sys.stderr.write(result.stderr[-2000:])
+        raise RuntimeError("The app exited with code %d before it was ready" % result.returncode)
+    return ready_at - start, records
+
+def print_report(ready_times, records, top, headless):
+    label = 'MidiConverter ready' if headless else 'First window shown'
+    print("%s after %.0f ms (median of %d)" % (label, statistics.median(ready_times) * 1000, len(ready_times)))
+    total_us = sum(r.cumulative_us for r in records if r.depth == 0)
+    print("Imports took %.0f ms" % (total_us / 1000))
+
+    by_package = defaultdict(int)
+    for r in records:
+        by_package[r.package] += r.self_us
+    print("\nImport time by package:")
+    for package, us in sorted(by_package.items(), key=lambda item: -item[1])[:top]:
+        print("  %-30s %8.1f ms" % (package, us / 1000))
+
+    print("\nSlowest imports (including what they import):")
+    for r in sorted(records, key=lambda r: -r.cumulative_us)[:top]:
+        print("  %-30s %8.1f ms" % (r.name, r.cumulative_us / 1000))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m PDUtilities profile-startup',
+                                     description='Show where startup time goes.')
+    parser.add_argument('--headless', action='store_true', help='time creating a MidiConverter instead of the GUI')
+    parser.add_argument('-r', '--repeat', type=int, default=3, help='times to start the app, the median is reported')
+    parser.add_argument('-n', '--top', type=int, default=15, help='packages and modules to list')
+    args = parser.parse_args(argv)
+
+    ready_times = []
+    for _ in range(max(1, args.repeat)):
+        try:
+            ready_time, records = profile_once(args.headless)
+        except RuntimeError as e:
+            print(e)
+            return 1
+        ready_times.append(ready_time)
+    # import times of the last run, when disk caches are warm like in normal use
+    print_report(ready_times, records, args.top, args.headless)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,113 @@
+# Copyright (C) 2020 Emre Tanirgan <emre@paradiddleapp.com>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+# Builds windows from the Qt Designer layouts in ui_layouts/. Parsing a .ui
+# file with uic.loadUi on every launch is slow, so compile_all() turns each
+# layout into a Python module next to it (<layout>_ui.py) when the app is
+# installed or built. A generated module starts with the hash of the layout
+# it came from and is only used while that still matches, so editing a .ui
+# file without recompiling falls back to loadUi instead of showing an old
+# layout.
+
+import hashlib
+import importlib.util
+import io
+import os
+import sys
+from pdlog import get_logger
+
+log = get_logger(__name__)
+
+project_dir = os.path.dirname(os.path.realpath(__file__))
+UI_DIR = os.path.join(project_dir, 'ui_layouts')
+DIGEST_PREFIX = '# ui digest: '
+GENERATED_SUFFIX = '_ui.py'
+
+use_generated = True # False always parses the .ui files, for benchmarks
+_modules = {} # layout name -> generated module
+
+def ui_path(name):
+    return os.path.join(UI_DIR, name + '.ui')
+
+def generated_path(name):
+    return os.path.join(UI_DIR, name + GENERATED_SUFFIX)
+
+def _digest(path):
+    with open(path, 'rb') as f:
+        return hashlib.blake2b(f.read()).digest()[:16].hex()
+
+def layout_names():
+    return sorted(os.path.splitext(name)[0] for name in os.listdir(UI_DIR) if name.endswith('.ui'))
+
+def compile_ui(name):
+    '''Writes the Python module for the layout `name`, returns its path'''
+    from PyQt5 import uic
+    source = io.StringIO()
+    uic.compileUi(ui_path(name), source)
+    path = generated_path(name)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(DIGEST_PREFIX + _digest(ui_path(name)) + '\n')
+        f.write(source.getvalue())
+    os.replace(tmp_path, path)
+    return path
+
+def compile_all():
+    return [compile_ui(name) for name in layout_names()]
+
+def is_current(name):
+    '''True if the generated module for `name` exists and matches its .ui file'''
+    try:
+        with open(generated_path(name), encoding='utf-8') as f:
+            first_line = f.readline().rstrip('\n')
+        return first_line == DIGEST_PREFIX + _digest(ui_path(name))
+    except OSError:
+        return False
+
+def _generated_module(name):
+    if name in _modules:
+        return _modules[name]
+    module = None
+    if is_current(name):
+        spec = importlib.util.spec_from_file_location(name + '_ui', generated_path(name))
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+    elif os.path.exists(generated_path(name)):
+        log.info("%s changed since it was compiled, loading the .ui file instead", name + '.ui')
+    _modules[name] = module
+    return module
+
+def load_ui(name, widget):
+    '''Sets up `widget` with the layout `name`, like uic.loadUi(ui_path(name), widget)'''
+    module = _generated_module(name) if use_generated else None
+    if module is None:
+        from PyQt5 import uic
+        uic.loadUi(ui_path(name), widget)
+        return
+    ui_class = next(value for key, value in vars(module).items() if key.startswith('Ui_'))
+    ui = ui_class()
+    ui.setupUi(widget)
+    # loadUi puts the child widgets on the window itself, the generated class
+    # keeps them on the Ui_ object
+    for attr, value in vars(ui).items():
+        setattr(widget, attr, value)
+
+def main(argv=None):
+    for path in compile_all():
+        print("Generated " + os.path.relpath(path, project_dir))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
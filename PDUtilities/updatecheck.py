@@ -0,0 +1,92 @@
+# Copyright (C) 2020 Emre Tanirgan <emre@paradiddleapp.com>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+# Looks up the latest release on GitHub. The answer is kept in the user
+# cache folder along with the response's ETag, so most launches don't touch
+# the network, and later checks are conditional requests that GitHub answers
+# with an empty 304 when nothing changed. Meant to be run off the GUI thread.
+
+import importlib.metadata
+import os
+import time
+from pdcache import cache_path, read_json, write_json
+from pdlog import get_logger
+
+log = get_logger(__name__)
+
+RELEASES_URL = 'https://api.github.com/repos/emretanirgan/ParadiddleUtilities/releases/latest'
+RELEASES_PAGE = 'https://www.github.com/emretanirgan/ParadiddleUtilities/releases/latest'
+URL_ENV = 'PDU_UPDATE_URL' # to point the check at another server
+CHECK_INTERVAL = 24 * 60 * 60 # seconds a successful check is trusted for
+RETRY_INTERVAL = 60 * 60 # seconds to wait after a failed check
+TIMEOUT = 3.0
+
+def current_version():
+    try:
+        return importlib.metadata.version("ParadiddleUtilities")
+    except importlib.metadata.PackageNotFoundError:
+        return None # running from a source tree that isn't installed
+
+def _state_path():
+    return cache_path('update_check.json')
+
+def latest_release(url=None, now=None, timeout=TIMEOUT):
+    '''Tag name of the latest release, from the cache while it's fresh.
+    None if it isn't known (offline and never checked).'''
+    url = url or os.environ.get(URL_ENV) or RELEASES_URL
+    now = time.time() if now is None else now
+    path = _state_path()
+    state = read_json(path) or {}
+    if state.get('url') != url:
+        state = {'url': url}
+
+    checked_at = state.get('checked_at')
+    failed_at = state.get('failed_at')
+    if (checked_at is not None and now - checked_at < CHECK_INTERVAL) or (failed_at is not None and now - failed_at < RETRY_INTERVAL):
+        return state.get('tag')
+
+    import requests # only needed when the cache is stale
+    headers = {'Accept': 'application/vnd.github+json'}
+    if state.get('etag') and state.get('tag'):
+        headers['If-None-Match'] = state['etag']
+    try:
+        response = requests.get(url, headers=headers, timeout=timeout)
+        if response.status_code != 304:
+            response.raise_for_status()
+            state['tag'] = response.json()['tag_name']
+            state['etag'] = response.headers.get('ETag')
+        state['checked_at'] = now
+        state.pop('failed_at', None)
+    except (requests.exceptions.RequestException, ValueError, KeyError) as e:
+        log.warning("Network error checking updates, skipping check: (%s)", e)
+        state['failed_at'] = now
+    write_json(path, state)
+    return state.get('tag')
+
+def newer_release(url=None):
+    '''(new version, current version) if a newer release is out, else None'''
+    current = current_version()
+    if current is None:
+        return None
+    tag = latest_release(url)
+    if not tag:
+        return None
+    from packaging import version
+    try:
+        if version.parse(tag) > version.parse(current):
+            return (tag, current)
+    except version.InvalidVersion:
+        log.warning("Unexpected release tag %s", tag)
+    return None
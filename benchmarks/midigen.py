@@ -0,0 +1,134 @@
+# Copyright (C) 2020 Emre Tanirgan <emre@paradiddleapp.com>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+# Synthetic rhythm game drum charts for the benchmarks. The layout follows
+# midi_maps/rhythm_ game_mapping.yaml: gems for difficulty d are notes
+# 60 + 12*d to 64 + 12*d, and notes 110-112 are held to toggle the toms.
+# Files are written straight to bytes so that million note charts are quick
+# to generate.
+
+import argparse
+import struct
+import numpy as np
+
+TICKS_PER_BEAT = 480
+GEM_BASES = (60, 72, 84, 96) # easy, medium, hard, expert
+TOGGLE_NOTES = (110, 111, 112)
+DRUM_CHANNEL = 9
+
+def _encode_events(ticks, payloads, payload_lengths):
+    '''Track data for events at absolute `ticks` (sorted), each followed by
+    the first payload_lengths[i] bytes of the (n, 6) uint8 array payloads'''
+    deltas = np.diff(ticks, prepend=0).astype(np.int64)
+    num_bytes = 1 + (deltas >= 1 << 7) + (deltas >= 1 << 14) + (deltas >= 1 << 21)
+    stream = np.zeros((len(ticks), 10), dtype=np.uint8)
+    valid = np.zeros((len(ticks), 10), dtype=bool)
+    # variable length delta, most significant 7 bits first
+    for j in range(4):
+        group = num_bytes - 1 - j
+        has_byte = group >= 0
+        value = (deltas >> (7 * np.maximum(group, 0))) & 0x7F
+        stream[:, j] = np.where(group > 0, value | 0x80, value)
+        valid[:, j] = has_byte
+    stream[:, 4:] = payloads
+    valid[:, 4:] = np.arange(6) < payload_lengths[:, None]
+    return stream[valid].tobytes()
+
+def _track_chunk(name, ticks, payloads, payload_lengths):
+    data = b''
+    if name is not None:
+        encoded = name.encode('latin-1')
+        data += b'\x00\xff\x03' + bytes((len(encoded),)) + encoded
+    data += _encode_events(ticks, payloads, payload_lengths) + b'\x00\xff\x2f\x00'
+    return b'MTrk' + struct.pack('>I', len(data)) + data
+
+def _note_payloads(statuses, notes, velocities):
+    payloads = np.zeros((len(notes), 6), dtype=np.uint8)
+    payloads[:, 0] = statuses
+    payloads[:, 1] = notes
+    payloads[:, 2] = velocities
+    return payloads, np.full(len(notes), 3)
+
+def _drum_events(num_notes, rng):
+    '''(ticks, payloads, lengths) of a drum part with about num_notes note_ons'''
+    # every chord has one or two gems on each difficulty
+    num_chords = max(1, int(num_notes / (len(GEM_BASES) * 1.4)))
+    chord_ticks = np.cumsum(rng.choice((60, 120, 120, 240), size=num_chords))
+
+    first = rng.integers(0, 5, size=(num_chords, len(GEM_BASES)))
+    second = rng.integers(0, 5, size=(num_chords, len(GEM_BASES)))
+    has_second = (rng.random((num_chords, len(GEM_BASES))) < 0.5) & (second != first)
+    bases = np.broadcast_to(np.array(GEM_BASES), first.shape)
+    gem_ticks = np.concatenate((np.broadcast_to(chord_ticks[:, None], first.shape).ravel(),
+                                np.broadcast_to(chord_ticks[:, None], first.shape)[has_second]))
+    gem_notes = np.concatenate(((bases + first).ravel(), (bases + second)[has_second]))
+    gem_velocities = rng.integers(60, 128, size=len(gem_notes))
+
+    # tom toggles held for one to eight beats, starting on about 5% of chords
+    toggle_starts = rng.random(num_chords) < 0.05
+    toggle_ticks = chord_ticks[toggle_starts]
+    toggle_notes = rng.choice(TOGGLE_NOTES, size=len(toggle_ticks))
+    toggle_lengths = rng.integers(1, 8, size=len(toggle_ticks)) * TICKS_PER_BEAT
+
+    # note_on with velocity 0 ends the gems, toggles get a real note_off
+    ticks = np.concatenate((gem_ticks, gem_ticks + 30, toggle_ticks, toggle_ticks + toggle_lengths))
+    statuses = np.concatenate((np.full(len(gem_ticks) * 2, 0x90 | DRUM_CHANNEL),
+                               np.full(len(toggle_ticks), 0x90 | DRUM_CHANNEL),
+                               np.full(len(toggle_ticks), 0x80 | DRUM_CHANNEL)))
+    notes = np.concatenate((gem_notes, gem_notes, toggle_notes, toggle_notes))
+    velocities = np.concatenate((gem_velocities, np.zeros(len(gem_ticks)), np.full(len(toggle_ticks), 100), np.zeros(len(toggle_ticks))))
+    return (ticks,) + _note_payloads(statuses, notes, velocities)
+
+def _tempo_events(end_tick, tempo_every_beats, rng):
+    ticks = np.arange(0, end_tick + 1, tempo_every_beats * TICKS_PER_BEAT)
+    tempos = rng.integers(300000, 800000, size=len(ticks))
+    payloads = np.zeros((len(ticks), 6), dtype=np.uint8)
+    payloads[:, :3] = (0xFF, 0x51, 0x03)
+    payloads[:, 3] = tempos >> 16
+    payloads[:, 4] = (tempos >> 8) & 0xFF
+    payloads[:, 5] = tempos & 0xFF
+    return ticks, payloads, np.full(len(ticks), 6)
+
+def _sorted(ticks, payloads, lengths):
+    order = np.argsort(ticks, kind='stable')
+    return ticks[order], payloads[order], lengths[order]
+
+def generate_chart(path, num_notes, midi_type=1, tempo_every_beats=1, seed=0):
+    '''Writes a synthetic drum chart with about `num_notes` note_ons and a
+    tempo change every `tempo_every_beats` beats to `path`'''
+    rng = np.random.default_rng(seed)
+    drums = _sorted(*_drum_events(num_notes, rng))
+    tempo = _tempo_events(int(drums[0][-1]), tempo_every_beats, rng)
+
+    if midi_type == 0:
+        merged = _sorted(*[np.concatenate(parts) for parts in zip(tempo, drums)])
+        tracks = [_track_chunk('PART DRUMS', *merged)]
+    else:
+        tracks = [_track_chunk('tempo', *tempo), _track_chunk('PART DRUMS', *drums)]
+    header = b'MThd' + struct.pack('>IHHH', 6, midi_type, len(tracks), TICKS_PER_BEAT)
+    with open(path, 'wb') as f:
+        f.write(header)
+        for track in tracks:
+            f.write(track)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Write a synthetic drum chart MIDI file.')
+    parser.add_argument('path')
+    parser.add_argument('-n', '--notes', type=int, default=10000)
+    parser.add_argument('-t', '--type', type=int, choices=[0, 1], default=1)
+    parser.add_argument('--tempo-every', type=int, default=1, help='beats between tempo changes')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    generate_chart(args.path, args.notes, args.type, args.tempo_every, args.seed)
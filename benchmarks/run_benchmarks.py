@@ -0,0 +1,184 @@
+# Copyright (C) 2020 Emre Tanirgan <emre@paradiddleapp.com>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+# Times the converter and song display on synthetic charts and saves the
+# results as JSON, so runs from different versions can be compared:
+#   python benchmarks/run_benchmarks.py --sizes 1000 100000 -o before.json
+#   python benchmarks/run_benchmarks.py --sizes 1000 100000 --compare before.json
+# The song display cases need PyQt5 and run on the offscreen Qt platform.
+
+import argparse
+import contextlib
+import datetime
+import io
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+benchmarks_dir = os.path.dirname(os.path.realpath(__file__))
+project_dir = os.path.join(os.path.dirname(benchmarks_dir), 'PDUtilities')
+sys.path.insert(0, project_dir)
+sys.path.insert(0, benchmarks_dir)
+
+import numpy as np
+from midigen import generate_chart
+from midicache import midi_cache
+from midiconvert import MidiConverter, read_midi_notes
+
+DEFAULT_SIZES = [1000, 10000, 100000, 1000000]
+MAPPING = os.path.join(project_dir, 'midi_maps', 'rhythm_ game_mapping.yaml')
+KIT = os.path.join(project_dir, 'drum_sets', 'defaultset.rlrr')
+DRUM_TRACK_SECONDS = 60 # length of audio rendered by _generate_full_drum_track
+
+def time_runs(func, repeat, setup=None):
+    '''Seconds taken by each of `repeat` calls to func, with converter output hidden'''
+    runs = []
+    for _ in range(repeat):
+        if setup:
+            setup()
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            func()
+            runs.append(time.perf_counter() - start)
+    return runs
+
+def make_converter(midi_path, output_dir):
+    mc = MidiConverter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        mc.analyze_drum_set(KIT)
+        mc.load_midi_map(MAPPING)
+        mc.midi_file = midi_path
+        mc.convert_track_index = mc.get_default_midi_track()[1]
+    mc.difficulty = 'Expert'
+    mc.output_rlrr_dir = output_dir
+    mc.song_name = 'bench'
+    mc.use_conversion_cache = False # every run has to do the work
+    return mc
+
+def display_available():
+    os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+    try:
+        import song_display
+    except (ImportError, OSError) as e: # OSError: soundfile without libsndfile
+        print("Skipping song display benchmarks: " + str(e))
+        return False
+    return True
+
+def make_song_display(mc):
+    from PyQt5 import QtWidgets
+    from song_display import SongDisplay_GUI
+    global _qt_app
+    _qt_app = QtWidgets.QApplication.instance() or QtWidgets.QApplication([])
+    with contextlib.redirect_stdout(io.StringIO()):
+        sd = SongDisplay_GUI(mc)
+        sd.midi_file = read_midi_notes(mc.midi_file)
+    return sd
+
+def benchmark_file(midi_path, output_dir, repeat, with_display):
+    '''Returns {case name: [seconds per run]} for one chart'''
+    mc = make_converter(midi_path, output_dir)
+    cases = {}
+    cases['read_midi_notes (cold)'] = time_runs(lambda: read_midi_notes(midi_path), repeat, setup=midi_cache.clear)
+    cases['analyze_midi_file'] = time_runs(mc.analyze_midi_file, repeat)
+    cases['count_converted_events'] = time_runs(mc.count_converted_events, repeat)
+    rlrr_path = os.path.join(output_dir, 'bench.rlrr')
+    cases['write_rlrr'] = time_runs(lambda: mc.write_rlrr(rlrr_path), repeat)
+    mc.compact_output = True
+    cases['write_rlrr (compact)'] = time_runs(lambda: mc.write_rlrr(rlrr_path), repeat)
+    mc.compact_output = False
+    cases['convert_all_difficulties'] = time_runs(mc.convert_all_difficulties, repeat)
+
+    if with_display:
+        sd = make_song_display(mc)
+        track_index = mc.convert_track_index
+        cases['_process_mapped_midi_data'] = time_runs(lambda: sd._process_mapped_midi_data(track_index), repeat)
+        mapped = sd._process_mapped_midi_data(track_index)
+        total_samples = DRUM_TRACK_SECONDS * sd.sample_rate
+        cases['_generate_full_drum_track'] = time_runs(lambda: sd._generate_full_drum_track(0.0, total_samples, mapped), repeat)
+    return cases
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=benchmarks_dir,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run(sizes, midi_types, repeat, with_display):
+    results = []
+    with_display = with_display and display_available()
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for midi_type in midi_types:
+            for size in sizes:
+                midi_path = os.path.join(tmp_dir, 'chart_%d_type%d.mid' % (size, midi_type))
+                generate_chart(midi_path, size, midi_type)
+                print("%d notes, type %d" % (size, midi_type))
+                for case, runs in benchmark_file(midi_path, tmp_dir, repeat, with_display).items():
+                    results.append({
+                        'case': case,
+                        'notes': size,
+                        'midi_type': midi_type,
+                        'best': min(runs),
+                        'median': statistics.median(runs),
+                        'runs': runs
+                    })
+                    print("  %-28s %10.4fs" % (case, min(runs)))
+    return {
+        'commit': git_commit(),
+        'date': datetime.datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'repeat': repeat,
+        'results': results
+    }
+
+def compare(report, baseline):
+    '''Prints how each case changed against an earlier report'''
+    old = {(r['case'], r['notes'], r['midi_type']): r['best'] for r in baseline['results']}
+    print("\nCompared to %s (%s)" % (baseline.get('commit'), baseline.get('date')))
+    for r in report['results']:
+        key = (r['case'], r['notes'], r['midi_type'])
+        if key in old and old[key] > 0:
+            print("  %-28s %8d type %d  %6.2fx" % (r['case'], r['notes'], r['midi_type'], r['best'] / old[key]))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark MIDI conversion on synthetic charts.')
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES, help='note counts to generate')
+    parser.add_argument('--types', type=int, nargs='+', choices=[0, 1], default=[0, 1], help='MIDI file types')
+    parser.add_argument('-r', '--repeat', type=int, default=3, help='runs per case, the best one is reported')
+    parser.add_argument('-o', '--output', help='JSON file for the results (default: benchmarks/results/<commit>.json)')
+    parser.add_argument('--compare', metavar='JSON', help='earlier results to compare against')
+    parser.add_argument('--no-display', action='store_true', help='skip the song display cases')
+    args = parser.parse_args(argv)
+
+    report = run(args.sizes, args.types, args.repeat, not args.no_display)
+    output = args.output or os.path.join(benchmarks_dir, 'results', '%s.json' % (report['commit'] or 'results'))
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=4)
+    print("Results written to " + output)
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(report, json.load(f))
+
+if __name__ == '__main__':
+    main()
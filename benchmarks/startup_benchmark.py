@@ -0,0 +1,94 @@
+# Copyright (C) 2020 Emre Tanirgan <emre@paradiddleapp.com>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+# Times how long it takes to build the windows' layouts in a fresh process,
+# from the generated UI modules and from the .ui files with uic.loadUi:
+#   python benchmarks/startup_benchmark.py [-r 10] [-o startup.json]
+# Every run is a new Python process, so module imports are included the way
+# they are when the app starts. Runs on the offscreen Qt platform.
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+benchmarks_dir = os.path.dirname(os.path.realpath(__file__))
+project_dir = os.path.join(os.path.dirname(benchmarks_dir), 'PDUtilities')
+sys.path.insert(0, project_dir)
+
+LOADERS = ['generated', 'loadUi']
+WIDGETS = {'pd_gui_layout': 'QMainWindow', 'song_display_layout': 'QDockWidget'}
+
+def child(loader):
+    '''Runs in the benchmark process, prints {stage: seconds} as JSON'''
+    times = {}
+    start = time.perf_counter()
+    from PyQt5 import QtWidgets
+    app = QtWidgets.QApplication([])
+    times['qt'] = time.perf_counter() - start
+    import uiloader
+    uiloader.use_generated = loader == 'generated'
+    for name, widget_class in WIDGETS.items():
+        layout_start = time.perf_counter()
+        uiloader.load_ui(name, getattr(QtWidgets, widget_class)())
+        times[name] = time.perf_counter() - layout_start
+    times['total'] = time.perf_counter() - start
+    print(json.dumps(times))
+
+def run_child(loader):
+    env = dict(os.environ, QT_QPA_PLATFORM='offscreen')
+    start = time.perf_counter()
+    result = subprocess.run([sys.executable, os.path.realpath(__file__), '--child', loader],
+                            env=env, capture_output=True, text=True, check=True)
+    times = json.loads(result.stdout.strip().splitlines()[-1])
+    times['process'] = time.perf_counter() - start
+    return times
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark building the windows from generated UI modules and .ui files.')
+    parser.add_argument('-r', '--repeat', type=int, default=10, help='processes started per loader, the median is reported')
+    parser.add_argument('-o', '--output', help='JSON file for the results')
+    parser.add_argument('--child', choices=LOADERS, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+    if args.child:
+        child(args.child)
+        return
+
+    import uiloader
+    for name in uiloader.layout_names():
+        if not uiloader.is_current(name):
+            print("Compiling " + name)
+            uiloader.compile_ui(name)
+
+    report = {}
+    for loader in LOADERS:
+        runs = [run_child(loader) for _ in range(args.repeat)]
+        report[loader] = {stage: statistics.median(run[stage] for run in runs) for stage in runs[0]}
+    stages = list(report[LOADERS[0]])
+    print("%-22s %12s %12s %8s" % ('median (s)', LOADERS[0], LOADERS[1], 'speedup'))
+    for stage in stages:
+        new, old = report[LOADERS[0]][stage], report[LOADERS[1]][stage]
+        print("%-22s %12.4f %12.4f %7.2fx" % (stage, new, old, old / new if new > 0 else 0))
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'repeat': args.repeat, 'results': report}, f, indent=4)
+        print("Results written to " + args.output)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,121 @@
+# Copyright (C) 2020 Emre Tanirgan <emre@paradiddleapp.com>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+# Converts a short song into a temporary folder with and without optimized
+# audio and checks what ends up next to the .rlrr files.
+
+import json
+import os
+import struct
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy as np
+
+project_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.realpath(__file__))), 'PDUtilities')
+sys.path.insert(0, project_dir)
+
+import yaml
+from midiconvert import MidiConverter
+from pdcache import CACHE_ENV
+
+try:
+    import soundfile as sf
+except (ImportError, OSError):
+    sf = None
+
+SAMPLERATE = 44100
+
+def smf_bytes():
+    '''Type 0 file at 480 ticks per beat: a 120 BPM tempo and one snare hit'''
+    track = (b'\x00\xff\x51\x03' + (500000).to_bytes(3, 'big')
+             + b'\x00\x99\x26\x64' + b'\x83\x60\x89\x26\x00' + b'\x00\xff\x2f\x00')
+    return (b'MThd' + struct.pack('>IHHh', 6, 0, 1, 480)
+            + b'MTrk' + struct.pack('>I', len(track)) + track)
+
+@unittest.skipIf(sf is None or 'OGG' not in sf.available_formats(), 'needs soundfile with OGG support')
+class SongAudioTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.env = mock.patch.dict(os.environ, {CACHE_ENV: os.path.join(self.tmp.name, 'cache')})
+        self.env.start()
+        self.midi_path = os.path.join(self.tmp.name, 'song.mid')
+        with open(self.midi_path, 'wb') as f:
+            f.write(smf_bytes())
+        # 1 s of tone followed by 3 s of silence, which optimizing trims
+        tone = 0.5 * np.sin(np.arange(SAMPLERATE) * 2 * np.pi * 440 / SAMPLERATE)
+        audio = np.concatenate((tone, np.zeros(3 * SAMPLERATE))).astype('float32')
+        self.song_track = os.path.join(self.tmp.name, 'song.wav')
+        self.drum_track = os.path.join(self.tmp.name, 'drums.wav')
+        sf.write(self.song_track, audio, SAMPLERATE)
+        sf.write(self.drum_track, audio, SAMPLERATE)
+        self.out_dir = os.path.join(self.tmp.name, 'out')
+        self.song_dir = os.path.join(self.out_dir, 'Song')
+
+    def tearDown(self):
+        self.env.stop()
+        self.tmp.cleanup()
+
+    def convert(self, optimize_audio):
+        mc = MidiConverter()
+        mc.analyze_drum_set(os.path.join(project_dir, 'drum_sets', 'defaultset.rlrr'))
+        with open(os.path.join(project_dir, 'midi_maps', 'rhythm_ game_mapping.yaml')) as f:
+            mc.create_midi_map(yaml.safe_load(f))
+        mc.midi_file = self.midi_path
+        mc.song_tracks = [self.song_track]
+        mc.drum_tracks = [self.drum_track]
+        mc.song_name = 'Song'
+        mc.output_rlrr_dir = self.out_dir
+        mc.optimize_audio = optimize_audio
+        mc.audio_workers = 1
+        mc.convert_all_difficulties()
+        return mc
+
+    def audio_in_output(self):
+        return sorted(name for name in os.listdir(self.song_dir) if not name.endswith('.rlrr'))
+
+    def listed_audio(self):
+        names = set()
+        for name in os.listdir(self.song_dir):
+            if name.endswith('.rlrr'):
+                with open(os.path.join(self.song_dir, name)) as f:
+                    audio = json.load(f)['audioFileData']
+                names.update(audio['songTracks'] + audio['drumTracks'])
+        return sorted(names)
+
+    def test_toggling_optimized_audio_keeps_only_current_stems(self):
+        self.convert(False)
+        self.assertEqual(self.audio_in_output(), ['drums.wav', 'song.wav'])
+        self.convert(True)
+        self.assertEqual(self.audio_in_output(), ['drums.ogg', 'song.ogg'])
+        self.assertEqual(self.listed_audio(), ['drums.ogg', 'song.ogg'])
+        self.convert(False)
+        self.assertEqual(self.audio_in_output(), ['drums.wav', 'song.wav'])
+        self.assertTrue(os.path.exists(self.song_track) and os.path.exists(self.drum_track))
+
+    def test_length_is_measured_on_packaged_audio(self):
+        self.convert(True)
+        packaged = sf.info(os.path.join(self.song_dir, 'song.ogg')).duration
+        self.assertLess(packaged, 2.0)
+        for name in os.listdir(self.song_dir):
+            if name.endswith('.rlrr'):
+                with open(os.path.join(self.song_dir, name)) as f:
+                    length = json.load(f)['recordingMetadata']['length']
+                self.assertAlmostEqual(length, packaged, places=3)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,71 @@
+# Copyright (C) 2020 Emre Tanirgan <emre@paradiddleapp.com>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+# Checks that mido stays off the startup path: importing the GUI or the
+# converter, and reading a MIDI file with the fast parser, must not import it.
+# Every check runs in a new Python process so earlier imports don't count.
+
+import importlib.util
+import os
+import struct
+import subprocess
+import sys
+import tempfile
+import textwrap
+import unittest
+
+project_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.realpath(__file__))), 'PDUtilities')
+
+def smf_bytes():
+    '''Type 0 file at 480 ticks per beat: a 120 BPM tempo and one snare hit'''
+    track = (b'\x00\xff\x51\x03' + (500000).to_bytes(3, 'big')
+             + b'\x00\x99\x26\x64' + b'\x83\x60\x89\x26\x00' + b'\x00\xff\x2f\x00')
+    return (b'MThd' + struct.pack('>IHHh', 6, 0, 1, 480)
+            + b'MTrk' + struct.pack('>I', len(track)) + track)
+
+class StartupImportsTest(unittest.TestCase):
+    def run_fresh(self, code):
+        '''Runs `code` in a new interpreter, returns whether mido got imported'''
+        code = 'import sys\nsys.path.insert(0, %r)\n' % project_dir + textwrap.dedent(code) \
+            + "\nprint('mido' in sys.modules)\n"
+        env = dict(os.environ, QT_QPA_PLATFORM='offscreen')
+        result = subprocess.run([sys.executable, '-c', code], env=env, capture_output=True, text=True)
+        self.assertEqual(result.returncode, 0, result.stderr)
+        return result.stdout.strip().splitlines()[-1] == 'True'
+
+    def test_headless_convert_import(self):
+        self.assertFalse(self.run_fresh('''
+            from midiconvert import MidiConverter
+            MidiConverter()
+        '''))
+
+    def test_fast_midi_read(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'song.mid')
+            with open(path, 'wb') as f:
+                f.write(smf_bytes())
+            self.assertFalse(self.run_fresh('''
+                from midiconvert import read_midi_notes
+                notes = read_midi_notes(%r)
+                assert notes.count_note_ons() == 1
+                assert notes.tempo_map.bpm_events()[0]['bpm'] == 120.0
+            ''' % path))
+
+    @unittest.skipIf(importlib.util.find_spec('PyQt5') is None, 'needs PyQt5')
+    def test_gui_import(self):
+        self.assertFalse(self.run_fresh('import pd_gui'))
+
+if __name__ == '__main__':
+    unittest.main()
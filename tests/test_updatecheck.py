@@ -0,0 +1,129 @@
+# Copyright (C) 2020 Emre Tanirgan <emre@paradiddleapp.com>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+# Runs the update check against a local stand-in for the GitHub releases
+# API, with the cache in a temporary folder:
+#   python -m pytest tests
+#   python -m unittest discover tests
+
+import http.server
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.realpath(__file__))), 'PDUtilities'))
+
+import updatecheck
+from pdcache import CACHE_ENV, read_json
+
+ETAG = '"release-etag"'
+
+# Answers like the releases API: 304 when If-None-Match has the current
+# ETag, otherwise the release as JSON. Every request is recorded.
+class ReleasesHandler(http.server.BaseHTTPRequestHandler):
+    def do_GET(self):
+        server = self.server
+        server.requests.append(dict(self.headers))
+        if server.delay:
+            time.sleep(server.delay)
+        if self.headers.get('If-None-Match') == ETAG:
+            self.send_response(304)
+            self.end_headers()
+            return
+        body = json.dumps({'tag_name': server.tag}).encode('utf-8')
+        self.send_response(200)
+        self.send_header('ETag', ETAG)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+class UpdateCheckTest(unittest.TestCase):
+    def setUp(self):
+        self.cache_dir = tempfile.TemporaryDirectory()
+        self.server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), ReleasesHandler)
+        self.server.requests = []
+        self.server.delay = 0
+        self.server.tag = '9.9.9'
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = 'http://127.0.0.1:%d/releases/latest' % self.server.server_port
+        self.env = mock.patch.dict(os.environ, {CACHE_ENV: self.cache_dir.name, updatecheck.URL_ENV: self.url})
+        self.env.start()
+
+    def tearDown(self):
+        self.env.stop()
+        self.server.shutdown()
+        self.server.server_close()
+        self.cache_dir.cleanup()
+
+    def state(self):
+        return read_json(os.path.join(self.cache_dir.name, 'update_check.json'))
+
+    def test_fresh_check_stores_tag_and_etag(self):
+        self.assertEqual(updatecheck.latest_release(now=1000.0), '9.9.9')
+        self.assertEqual(len(self.server.requests), 1)
+        state = self.state()
+        self.assertEqual(state['url'], self.url)
+        self.assertEqual(state['tag'], '9.9.9')
+        self.assertEqual(state['etag'], ETAG)
+        self.assertEqual(state['checked_at'], 1000.0)
+
+    def test_check_inside_ttl_makes_no_request(self):
+        updatecheck.latest_release(now=1000.0)
+        self.assertEqual(updatecheck.latest_release(now=1000.0 + updatecheck.CHECK_INTERVAL - 1), '9.9.9')
+        self.assertEqual(len(self.server.requests), 1)
+
+    def test_stale_check_is_conditional_and_keeps_tag(self):
+        updatecheck.latest_release(now=1000.0)
+        later = 1000.0 + updatecheck.CHECK_INTERVAL + 1
+        self.assertEqual(updatecheck.latest_release(now=later), '9.9.9')
+        self.assertEqual(len(self.server.requests), 2)
+        self.assertEqual(self.server.requests[1].get('If-None-Match'), ETAG)
+        state = self.state()
+        self.assertEqual(state['tag'], '9.9.9')
+        self.assertEqual(state['checked_at'], later)
+
+    def test_timeout_records_failure(self):
+        self.server.delay = 1.0
+        start = time.perf_counter()
+        self.assertIsNone(updatecheck.latest_release(now=1000.0, timeout=0.2))
+        self.assertLess(time.perf_counter() - start, 1.0)
+        state = self.state()
+        self.assertEqual(state['failed_at'], 1000.0)
+        self.assertNotIn('tag', state)
+
+        # no retry until RETRY_INTERVAL has passed
+        self.server.delay = 0
+        updatecheck.latest_release(now=1000.0 + updatecheck.RETRY_INTERVAL - 1)
+        self.assertEqual(len(self.server.requests), 1)
+        self.assertEqual(updatecheck.latest_release(now=1000.0 + updatecheck.RETRY_INTERVAL + 1), '9.9.9')
+        self.assertNotIn('failed_at', self.state())
+
+    def test_newer_release(self):
+        with mock.patch.object(updatecheck, 'current_version', return_value='0.8.0'):
+            self.assertEqual(updatecheck.newer_release(), ('9.9.9', '0.8.0'))
+        with mock.patch.object(updatecheck, 'current_version', return_value='10.0.0'):
+            self.assertIsNone(updatecheck.newer_release())
+
+if __name__ == '__main__':
+    unittest.main()